@@ -79,6 +79,14 @@ class BCP():
         self.use_quoted_identifiers = '-q' #allows loading to table name with spaces in it
         self.use_char_dtype = '-c'
         
+        # BCP cannot read some timestamp formats, so they get quoted before loading (see add_quotes_to_tstamps)
+        self.quote_tstamps = True
+        
+        # suffixes for side-table publishing. New data are built into <table>_build, then
+        # swapped in for the live table, which is briefly kept as <table>_retired
+        self.side_tbl_suffix = '_build'
+        self.retired_tbl_suffix = '_retired'
+        
         
     def dbf_to_csv(self, dbf_in,outcsv):
         """Export from DBF to CSV for large files"""
@@ -183,9 +191,63 @@ class BCP():
             
         
 
+    def publish_side_table(self, side_tbl_name, tbl_name):
+        '''Swaps a fully loaded and indexed side table in for the live table.
+        
+        Both renames happen in one transaction, so queries against tbl_name see either
+        the old data or the new data, never a missing or half-loaded table. Readers are
+        only blocked for the moment it takes to commit the metadata change.
+        
+        PARAMETERS:
+            side_tbl_name (string) = name of table the new data were built into
+            tbl_name (string) = name of live table that downstream queries use
+        '''
+        retired_tbl_name = f"{tbl_name}{self.retired_tbl_suffix}"
+        
+        sql_publish = f"""
+            SET XACT_ABORT ON;
+            IF OBJECT_ID('{retired_tbl_name}', 'U') IS NOT NULL 
+                DROP TABLE {retired_tbl_name};
+            
+            BEGIN TRANSACTION;
+            IF OBJECT_ID('{tbl_name}', 'U') IS NOT NULL 
+                EXEC sp_rename '{tbl_name}', '{retired_tbl_name}';
+            EXEC sp_rename '{side_tbl_name}', '{tbl_name}';
+            COMMIT TRANSACTION;
+            
+            IF OBJECT_ID('{retired_tbl_name}', 'U') IS NOT NULL 
+                DROP TABLE {retired_tbl_name};
+            """
+        
+        print(f"publishing {side_tbl_name} as {tbl_name}...")
+        with pyodbc.connect(self.str_conn_info, autocommit=True) as conn:
+            sql_cur = conn.cursor()
+            sql_cur.execute(sql_publish)
+            
+
+    def load_file_to_table(self, file_in, tbl_name, delim_char, data_start_row,
+                           dt_cols=None, re_dt_format=None):
+        '''Runs the BCP utility to load a delimited text file into an existing table.
+        dt_cols and re_dt_format are not used here, because BCP loads from a copy of the
+        file whose timestamps were already quoted by add_quotes_to_tstamps()'''
+        
+        loading_dir = 'in' # in = load from file into sql server; out = from server to file
+        bcp_new_tbl_from_file = ['bcp', tbl_name, loading_dir, file_in,
+                                 '-S', self.svr_name, # -S <server name>
+                                 '-d', self.db_name, # -d <database name>
+                                 self.bcp_auth, self.use_quoted_identifiers,
+                                 self.use_char_dtype,
+                                 '-t', delim_char, # -t <field delimiter char to use>
+                                 '-F', str(data_start_row)] # -F indicates row data starts on (default = 2nd row if file has headers)
+        
+        # run bcp command
+        subprocess.check_output(bcp_new_tbl_from_file)
+        
+
     def create_sql_table_from_file(self, file_in, str_create_table_sql, tbl_name,
                                    overwrite=True, data_start_row=2, delimiter=None, dt_cols=None,
-                                   str_load2final_sql=None, re_dt_format=None):
+                                   str_load2final_sql=None, re_dt_format=None,
+                                   publish_via_side_tbl=False, str_index_sql=None):
         '''Loads data from a text file into a sql server table
         PARAMETERS:
             file_in (str file path)= text or CSV input data file
@@ -203,6 +265,11 @@ class BCP():
             re_dt_format (regex string) = regular expression describing the datetime format.
                 Example: 01-01-2020 14:58:00 would have a regex format of '(\d+-\d+-\d+ \d+:\d+:\d+).*'
                 ***ISSUE: this should be improved in future so it is more intuitive to someone unfamiliar with regex
+            publish_via_side_tbl (boolean) = if True, data are built into a side table (<tbl_name>_build) while
+                the existing tbl_name stays queryable, then the side table is swapped in using publish_side_table().
+                If False, any existing tbl_name is dropped before loading begins.
+            str_index_sql (string) = optional SQL to build indexes on the loaded table before it is published, with
+                {0} as placeholder for the table name.
             
          '''
          
@@ -247,10 +314,16 @@ class BCP():
         if delimiter: delim_char = delimiter
         
         
+        # name of table that downstream queries will use once loading is finished
+        tbl_name_published = tbl_name
+        if publish_via_side_tbl:
+            tbl_name = f"{tbl_name}{self.side_tbl_suffix}"
+        
         #------------if necessary, pre-processing to load tables with datetime column
         if dt_cols:
-            in_file_dt_str = self.add_quotes_to_tstamps(file_in, dt_cols, re_dt_format)
-            file_in = in_file_dt_str
+            if self.quote_tstamps:
+                in_file_dt_str = self.add_quotes_to_tstamps(file_in, dt_cols, re_dt_format)
+                file_in = in_file_dt_str
             tbl_name_final = tbl_name
             tbl_name = f"{tbl_name}_staging"
             
@@ -262,7 +335,6 @@ class BCP():
 
         with pyodbc.connect(self.str_conn_info, autocommit=True) as conn:
             sql_cur = conn.cursor()
-            str_data_start_row = str(data_start_row)
             
             # drop existing table if specified
             tables = [t[2] for t in sql_cur.tables()]
@@ -280,20 +352,11 @@ class BCP():
             print(f"creating table {tbl_name}...")
             sql_cur.execute(str_create_table_sql)
 
-        #------------load file's data to created table using BCP utility---------
-        loading_dir = 'in' # in = load from file into sql server; out = from server to file
-        bcp_new_tbl_from_file = ['bcp', tbl_name, loading_dir, file_in,
-                                 '-S', self.svr_name, # -S <server name>
-                                 '-d', self.db_name, # -d <database name>
-                                 self.bcp_auth, self.use_quoted_identifiers,
-                                 self.use_char_dtype,
-                                 '-t', delim_char, # -t <field delimiter char to use>
-                                 '-F', str_data_start_row] # -F indicates row data starts on (default = 2nd row if file has headers)
-        
-        # run bcp command
+        #------------load file's data to created table---------
         print(f"loading data from {file_in} into {tbl_name}...")
         try:
-            subprocess.check_output(bcp_new_tbl_from_file)
+            self.load_file_to_table(file_in, tbl_name, delim_char, data_start_row,
+                                    dt_cols=dt_cols, re_dt_format=re_dt_format)
             
             if dt_cols:
                 print("loading from staging table into final table for conversion to tstamp...")
@@ -302,7 +365,19 @@ class BCP():
                     sql_cur = conn.cursor()
                     sql_cur.execute(str_load2final_sql)
 
-                os.remove(in_file_dt_str) # delete to free up space
+                if self.quote_tstamps:
+                    os.remove(in_file_dt_str) # delete to free up space
+                
+            tbl_name_loaded = tbl_name_final if dt_cols else tbl_name
+            
+            if str_index_sql:
+                print(f"building indexes on {tbl_name_loaded}...")
+                with pyodbc.connect(self.str_conn_info, autocommit=True) as conn:
+                    sql_cur = conn.cursor()
+                    sql_cur.execute(str_index_sql.format(tbl_name_loaded))
+                    
+            if publish_via_side_tbl:
+                self.publish_side_table(tbl_name_loaded, tbl_name_published)
             
             elapsed_time = round((time.perf_counter() - start_time)/60,1)
             print(("Successfully loaded table in {}mins!\n".format(elapsed_time)))
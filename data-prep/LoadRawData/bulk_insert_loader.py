@@ -0,0 +1,165 @@
+"""
+Name:bulk_insert_loader.py
+Purpose: Pure-python alternative to the BCP wrapper in bcp_loader.py, for machines that do
+    not have the BCP utility installed (e.g., Linux analysis nodes, container images).
+    Rows are read from the input file and sent to SQL Server in large batches using pyodbc's
+    fast_executemany option, which sends each batch as one array of parameters instead of
+    making one round trip per row. One connection is held open for the whole load.
+
+    BulkInsertLoader has the same methods and arguments as BCP, so it can be used anywhere a
+    BCP object is used (e.g., DataSet.BCP_conn in load_raw_npmrds_data.py).
+
+    Dependencies:
+        -pyodbc python library, downloadable through conda and pip package managers
+        -Microsoft ODBC Driver 17 or later for SQL Server. fast_executemany does not work with
+            the older "SQL Server" driver that BCP connections use. Available at:
+            https://learn.microsoft.com/en-us/sql/connect/odbc/download-odbc-driver-for-sql-server
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import re
+import csv
+
+import pyodbc
+
+from bcp_loader import BCP
+
+
+class BulkInsertLoader(BCP):
+
+    def __init__(self, svr_name, db_name, trusted_conn=True, batch_rows=50000):
+        '''
+        PARAMETERS:
+            svr_name (string) = name of SQL Server instance
+            db_name (string) = name of database to load to
+            trusted_conn (boolean) = if False, will prompt for username and password
+            batch_rows (int) = number of rows sent to server per batch. Larger batches mean fewer
+                round trips but more client memory; 50,000 rows of NPMRDS travel time data is ~20MB.
+        '''
+        super().__init__(svr_name, db_name, trusted_conn=trusted_conn)
+
+        self.batch_rows = batch_rows
+
+        # timestamps are sent as string parameters, so they do not need quoting like they do for BCP
+        self.quote_tstamps = False
+
+        self.db_system = self.get_odbc_driver()
+        if trusted_conn:
+            str_auth = "Trusted_Connection=yes;"
+        else:
+            str_auth = f"UID={self.username}; PWD={self.password};"
+
+        self.str_conn_info = f"Driver={self.db_system}; Server={self.svr_name}; " \
+            f"Database={self.db_name}; {str_auth}"
+
+        # SQL Server data types that get converted from file strings to python numbers before sending
+        self.int_dtypes = ['bigint', 'int', 'smallint', 'tinyint', 'bit']
+        self.float_dtypes = ['real', 'float', 'decimal', 'numeric']
+
+
+    def get_odbc_driver(self):
+        '''Returns the newest installed "ODBC Driver NN for SQL Server" driver'''
+        re_driver = re.compile(r'ODBC Driver (\d+) for SQL Server')
+        drivers = [d for d in pyodbc.drivers() if re.match(re_driver, d)]
+
+        if not drivers:
+            raise Exception("No Microsoft ODBC Driver for SQL Server found. Install ODBC Driver 17 " \
+                            "or later to load without the BCP utility.")
+
+        newest_driver = max(drivers, key=lambda d: int(re.match(re_driver, d).group(1)))
+
+        return f"{{{newest_driver}}}"
+
+
+    def get_value_converters(self, sql_cur, tbl_name, dt_cols=None, re_dt_format=None):
+        '''Makes a list, in table column order, of functions that convert each raw file value
+        into the python value to send. Blank values become NULL, the same as with BCP.'''
+
+        def to_int(val):
+            return int(float(val)) if val != '' else None
+
+        def to_float(val):
+            return float(val) if val != '' else None
+
+        def to_str(val):
+            return val if val != '' else None
+
+        def to_tstamp_str(val):
+            # same cleaning as BCP.add_quotes_to_tstamps, but without adding the quotes
+            if len(val) < 5: # shortest time stamp possible would be '00:00' or 'mm/dd'
+                return None
+            if re_dt_format:
+                return re.search(re_dt_format, val).group(1)
+            return val
+
+        dt_cols = dt_cols if dt_cols else []
+        converters = []
+        for col in sql_cur.columns(table=tbl_name):
+            if col.column_name in dt_cols:
+                converters.append(to_tstamp_str)
+            elif col.type_name in self.int_dtypes:
+                converters.append(to_int)
+            elif col.type_name in self.float_dtypes:
+                converters.append(to_float)
+            else:
+                converters.append(to_str)
+
+        return converters
+
+
+    def load_file_to_table(self, file_in, tbl_name, delim_char, data_start_row,
+                           dt_cols=None, re_dt_format=None):
+        '''Loads a delimited text file into an existing table using batched parameter arrays.
+        File columns must be in the same order as the table columns, as with BCP.
+
+        PARAMETERS:
+            file_in (str file path) = text or CSV file to load
+            tbl_name (string) = name of existing table to load into
+            delim_char (string) = field delimiter. '\\t' is accepted as tab, as with BCP.
+            data_start_row (int) = row that data start on. If file has header row, then start_row = 2
+            dt_cols (list) = names of timestamp columns, which are loaded as strings
+            re_dt_format (regex string) = regular expression to extract timestamp from the raw timestamp string
+        '''
+        delim_char = delim_char.replace('\\t', '\t')
+
+        with pyodbc.connect(self.str_conn_info, autocommit=False) as conn:
+            sql_cur = conn.cursor()
+            sql_cur.fast_executemany = True
+
+            converters = self.get_value_converters(sql_cur, tbl_name, dt_cols, re_dt_format)
+
+            # TABLOCK allows minimally-logged inserts into the (unindexed) staging table
+            str_params = ', '.join(['?' for _ in converters])
+            sql_insert = f"INSERT INTO [{tbl_name}] WITH (TABLOCK) VALUES ({str_params})"
+
+            with open(file_in, 'r', newline='') as f_in:
+                reader = csv.reader(f_in, delimiter=delim_char)
+                for _ in range(data_start_row - 1):
+                    next(reader)
+
+                rows_loaded = 0
+                batch = []
+                for row in reader:
+                    batch.append([convert(val) for convert, val in zip(converters, row)])
+
+                    if len(batch) == self.batch_rows:
+                        sql_cur.executemany(sql_insert, batch)
+                        conn.commit()
+                        rows_loaded += len(batch)
+                        batch = []
+
+                        if rows_loaded % (self.batch_rows * 20) == 0: print(f"\t{rows_loaded} rows loaded...")
+
+                if batch:
+                    sql_cur.executemany(sql_insert, batch)
+                    conn.commit()
+                    rows_loaded += len(batch)
+
+        print(f"\t{rows_loaded} rows loaded in total")
+
@@ -0,0 +1,258 @@
+"""
+Name: epoch_bitmap.py
+Purpose: Compact index of which epochs have data for each TMC, so that completeness, gaps and
+    duplicate checks do not have to rescan the raw travel time table or CSV.
+
+    Each TMC gets one bit per epoch of the year (35,040 15-minute epochs = 4,380 bytes per TMC-year),
+    set to 1 if the raw data has a row for that TMC and epoch. A second bitmap of the same size flags
+    epochs that have more than one row (duplicate TMC-timestamp rows). Both are saved to a single
+    .npz file with the TMC codes, data year and epoch length.
+
+    Epoch IDs count from the start of the year, e.g. epoch 0 = 1/1 12:00am-12:15am, as in
+    npmrds-metrics/srcpy/epoch_calendar.py. Once built, checks are bit operations on the bitmaps:
+        -epochs observed / completeness: AND with a mask of the epochs wanted (e.g. a date range or
+            hours of day), then count bits
+        -gaps: runs of 0 bits
+        -duplicates: count bits in the duplicate bitmap; epochs in two data sets: AND the two bitmaps
+
+    Bitmaps can be built as a stand-alone step, or by load_raw_npmrds_data.py when
+    DataSet.bitmap_dir is set.
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+COL_TMC = 'tmc_code'
+COL_TSTAMP = 'measurement_tstamp'
+EPOCH_MINS = 15
+BITMAP_EXT = '.npz'
+
+# number of 1 bits in each possible byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+
+def epochs_in_year(data_year, epoch_mins=EPOCH_MINS):
+    '''Number of epochs in the year'''
+    year_mins = (np.datetime64(f"{data_year + 1}-01-01", 'm') - np.datetime64(f"{data_year}-01-01", 'm')).astype(np.int64)
+    return int(year_mins // epoch_mins)
+
+
+def popcount_rows(bits):
+    '''Number of 1 bits in each row of a packed (uint8) bitmap'''
+    return POPCOUNT[bits].sum(axis=1)
+
+
+class EpochBitmapWriter():
+    def __init__(self, in_csv, bitmap_path, data_year, epoch_mins=EPOCH_MINS, chunk_rows=2000000):
+        '''
+        PARAMETERS:
+            in_csv (str file path) = raw NPMRDS travel time CSV
+            bitmap_path (str file path) = path of bitmap file to create, ending in .npz
+            data_year (int) = year of data. Rows outside the year are counted and skipped.
+            epoch_mins (int) = epoch length in minutes
+            chunk_rows (int) = number of CSV rows read into memory at a time
+        '''
+        self.in_csv = in_csv
+        self.bitmap_path = bitmap_path
+        self.data_year = data_year
+        self.epoch_mins = epoch_mins
+        self.chunk_rows = chunk_rows
+
+        self.n_epochs = epochs_in_year(data_year, epoch_mins)
+        self.n_bytes = -(-self.n_epochs // 8)
+
+    def write(self):
+        '''Builds bitmaps in one pass over the CSV and saves them. Returns path to bitmap file.'''
+        start_time = time.perf_counter()
+        print(f"building epoch bitmaps for {self.in_csv}...")
+
+        year_start = np.datetime64(f"{self.data_year}-01-01", 'm')
+        tmc_rows = {}
+        bits = np.zeros((1024, self.n_bytes), dtype=np.uint8)
+        dup_bits = np.zeros_like(bits)
+        rows_read = 0
+        rows_outside_year = 0
+
+        for df in pd.read_csv(self.in_csv, chunksize=self.chunk_rows, usecols=[COL_TMC, COL_TSTAMP],
+                              dtype={COL_TMC: str}, parse_dates=[COL_TSTAMP]):
+            # add row for each TMC not seen yet, growing the bitmaps if needed
+            for tmc in df[COL_TMC].unique():
+                if tmc not in tmc_rows:
+                    tmc_rows[tmc] = len(tmc_rows)
+            if len(tmc_rows) > len(bits):
+                n_rows = max(len(tmc_rows), 2 * len(bits))
+                bits = np.concatenate([bits, np.zeros((n_rows - len(bits), self.n_bytes), dtype=np.uint8)])
+                dup_bits = np.concatenate([dup_bits, np.zeros((n_rows - len(dup_bits), self.n_bytes), dtype=np.uint8)])
+
+            row = df[COL_TMC].map(tmc_rows).values.astype(np.int64)
+            epoch = (df[COL_TSTAMP].values.astype('datetime64[m]') - year_start).astype(np.int64) // self.epoch_mins
+            in_year = (epoch >= 0) & (epoch < self.n_epochs)
+            rows_outside_year += (~in_year).sum()
+
+            # an epoch is a duplicate if it appears twice in this chunk or was already set by an earlier chunk
+            keys, key_cnts = np.unique(row[in_year] * self.n_epochs + epoch[in_year], return_counts=True)
+            row, epoch = keys // self.n_epochs, keys % self.n_epochs
+            byte_idx, bit_val = epoch // 8, (np.uint8(128) >> (epoch % 8).astype(np.uint8))
+            is_dup = (key_cnts > 1) | ((bits[row, byte_idx] & bit_val) > 0)
+
+            # bitwise_or.at, because several epochs in one chunk can share a byte
+            np.bitwise_or.at(bits, (row, byte_idx), bit_val)
+            np.bitwise_or.at(dup_bits, (row[is_dup], byte_idx[is_dup]), bit_val[is_dup])
+
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+        n_tmc = len(tmc_rows)
+        np.savez(self.bitmap_path, tmcs=np.array(list(tmc_rows.keys()), dtype=str), bits=bits[:n_tmc],
+                 dup_bits=dup_bits[:n_tmc], data_year=self.data_year, epoch_mins=self.epoch_mins)
+
+        if rows_outside_year > 0:
+            print(f"\tWARNING: {rows_outside_year} rows not in {self.data_year} were skipped.")
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"\tbitmaps for {n_tmc} TMCs written to {self.bitmap_path} in {elapsed_time}mins.")
+
+        return self.bitmap_path
+
+
+class EpochBitmap():
+    def __init__(self, bitmap_path):
+        '''Reader for a bitmap file made by EpochBitmapWriter.
+        PARAMETERS:
+            bitmap_path (str file path) = path to .npz bitmap file'''
+        with np.load(bitmap_path) as f_in:
+            self.tmcs = pd.Index(f_in['tmcs'])
+            self.bits = f_in['bits']
+            self.dup_bits = f_in['dup_bits']
+            self.data_year = int(f_in['data_year'])
+            self.epoch_mins = int(f_in['epoch_mins'])
+
+        self.n_epochs = epochs_in_year(self.data_year, self.epoch_mins)
+        self.year_start = np.datetime64(f"{self.data_year}-01-01", 'm')
+
+    def tmc_rows(self, tmcs=None):
+        '''Row number of each TMC in tmcs (all rows if None). Raises exception if a TMC is not in the bitmap.'''
+        if tmcs is None:
+            return np.arange(len(self.tmcs))
+
+        rows = self.tmcs.get_indexer(tmcs)
+        if (rows < 0).any():
+            raise Exception(f"{(rows < 0).sum()} TMCs not found in epoch bitmap.")
+
+        return rows
+
+    def epoch_tstamps(self, epochs):
+        '''Start time of each epoch ID'''
+        return self.year_start + np.asarray(epochs) * np.timedelta64(self.epoch_mins, 'm')
+
+    def epoch_mask(self, start_date=None, end_date=None, hours=None):
+        '''Boolean array, True for each epoch of the year from start_date (inclusive) to end_date (exclusive),
+        as 'yyyy-mm-dd' strings, in the hours of day listed in hours (all if None)'''
+        tstamps = self.epoch_tstamps(np.arange(self.n_epochs))
+        mask = np.ones(self.n_epochs, dtype=bool)
+        if start_date:
+            mask &= tstamps >= np.datetime64(start_date, 'm')
+        if end_date:
+            mask &= tstamps < np.datetime64(end_date, 'm')
+        if hours is not None:
+            mask &= np.isin(tstamps.astype('datetime64[h]').astype(np.int64) % 24, hours)
+
+        return mask
+
+    def observed_epochs(self, tmcs=None, epoch_mask=None):
+        '''Number of observed epochs for each TMC, counting only epochs in epoch_mask (from epoch_mask()) if given'''
+        bits = self.bits[self.tmc_rows(tmcs)]
+        if epoch_mask is not None:
+            bits = bits & np.packbits(epoch_mask)[None, :]
+
+        return popcount_rows(bits)
+
+    def completeness(self, tmcs=None, epoch_mask=None):
+        '''Dataframe of observed epochs, possible epochs and share observed for each TMC'''
+        possible = self.n_epochs if epoch_mask is None else int(epoch_mask.sum())
+        rows = self.tmc_rows(tmcs)
+        df_out = pd.DataFrame({COL_TMC: self.tmcs[rows], 'obs_epochs': self.observed_epochs(tmcs, epoch_mask),
+                               'poss_epochs': possible})
+        df_out['data_compl_pct'] = df_out['obs_epochs'] / possible
+
+        return df_out
+
+    def gaps(self, tmcs=None, min_epochs=1):
+        '''Dataframe of each run of min_epochs or more consecutive missing epochs, with TMC, first missing epoch,
+        number of epochs missing and start and end (exclusive) times of the gap'''
+        rows = self.tmc_rows(tmcs)
+        is_obs = np.unpackbits(self.bits[rows], axis=1, count=self.n_epochs).astype(np.int8)
+
+        # pad each row with observed epochs, so every gap has a 1 -> 0 start and 0 -> 1 end
+        padded = np.pad(is_obs, ((0, 0), (1, 1)), constant_values=1)
+        edges = np.diff(padded, axis=1)
+        gap_rows, gap_starts = np.nonzero(edges == -1)
+        _, gap_ends = np.nonzero(edges == 1) # nonzero() returns row-major order, so ends line up with starts
+
+        gap_epochs = gap_ends - gap_starts
+        keep = gap_epochs >= min_epochs
+        gap_starts, gap_epochs = gap_starts[keep], gap_epochs[keep]
+
+        return pd.DataFrame({COL_TMC: self.tmcs[rows[gap_rows[keep]]], 'gap_start_epoch': gap_starts,
+                             'gap_epochs': gap_epochs, 'gap_start': self.epoch_tstamps(gap_starts),
+                             'gap_end': self.epoch_tstamps(gap_starts + gap_epochs)})
+
+    def duplicate_epochs(self, tmcs=None):
+        '''Number of epochs with more than one row, for each TMC'''
+        return popcount_rows(self.dup_bits[self.tmc_rows(tmcs)])
+
+    def duplicate_tstamps(self, tmc):
+        '''Timestamps of epochs with more than one row for one TMC'''
+        dup_epochs = np.flatnonzero(np.unpackbits(self.dup_bits[self.tmc_rows([tmc])[0]], count=self.n_epochs))
+        return self.epoch_tstamps(dup_epochs)
+
+    def overlap(self, other):
+        '''Number of epochs in both this bitmap and other (e.g. a new download of the same year), for each TMC
+        in both. Returns series indexed by TMC.'''
+        if (other.data_year, other.epoch_mins) != (self.data_year, self.epoch_mins):
+            raise Exception("Bitmaps must be for the same data year and epoch length to be compared.")
+
+        tmcs = self.tmcs.intersection(other.tmcs)
+        both = self.bits[self.tmc_rows(tmcs)] & other.bits[other.tmc_rows(tmcs)]
+
+        return pd.Series(popcount_rows(both), index=tmcs)
+
+    def summary(self, min_gap_epochs=4):
+        '''Dataframe with observed epochs, completeness, duplicate epochs, number of gaps of min_gap_epochs
+        or more, and longest gap for each TMC'''
+        df_out = self.completeness()
+        df_out['dup_epochs'] = self.duplicate_epochs()
+
+        df_gaps = self.gaps(min_epochs=min_gap_epochs).groupby(COL_TMC)['gap_epochs'].agg(['count', 'max'])
+        df_out['gaps'] = df_out[COL_TMC].map(df_gaps['count']).fillna(0).astype(int)
+        df_out['longest_gap_epochs'] = df_out[COL_TMC].map(df_gaps['max']).fillna(0).astype(int)
+
+        return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    in_file = r"P:\NPMRDS data\Raw Downloads\DynamicData_15Min\2023\inrix2023\inrix2023.csv"
+    out_bitmap = r"P:\NPMRDS data\EpochBitmaps\npmrds_2023_alltmc_paxtruck_comb.npz"
+    year = 2023
+
+    #=================RUN SCRIPT===========================
+    if not os.path.exists(out_bitmap):
+        EpochBitmapWriter(in_file, out_bitmap, year).write()
+
+    bitmap = EpochBitmap(out_bitmap)
+    df_summary = bitmap.summary()
+    print(df_summary.describe())
+
+    # example: completeness for January, 6am-10am
+    # jan_ampk = bitmap.epoch_mask('2023-01-01', '2023-02-01', hours=[6, 7, 8, 9])
+    # df_jan_ampk = bitmap.completeness(epoch_mask=jan_ampk)
@@ -22,12 +22,17 @@ Python Version: 3.x
 """
 
 import os
+import shutil
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
 from bcp_loader import BCP
+from bulk_insert_loader import BulkInsertLoader
+from sort_tt_csv import TTFileSorter
+from tt_archive import TTArchiveWriter, ARCHIVE_EXT
+from epoch_bitmap import EpochBitmapWriter, BITMAP_EXT
 
 class ParamCSV:
     '''Takse a single CSV as an input that the user fills out the input parameters on'''
@@ -117,7 +122,13 @@ class DataSet():
         #db connection info
         self.server = 'SQL-SVR'
         self.database = 'NPMRDS'
-        self.BCP_conn = BCP(self.server, self.database)
+        
+        # load with BCP utility if it is installed, otherwise fall back to pyodbc bulk inserts
+        if shutil.which('bcp'):
+            self.BCP_conn = BCP(self.server, self.database)
+        else:
+            print("BCP utility not found. Will load using pyodbc bulk inserts instead...")
+            self.BCP_conn = BulkInsertLoader(self.server, self.database)
         
         # queries to run
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -127,7 +138,25 @@ class DataSet():
         self.sql_tmcspec_load2final = "tmc_spec_load2final.sql"
         self.sql_create_tt_tbls = 'create_tt_table_2ph.sql'
         self.sql_tt_load2final = 'tt_tbl_load2final.sql'
+        self.sql_tt_index = 'create_tt_table_index.sql'
+        
+        # if True, tables are built as side tables and swapped in once fully loaded and indexed,
+        # so existing tables stay queryable for the whole load. If False, existing tables
+        # are dropped before the new data are loaded.
+        self.publish_via_side_tbl = True
+        
+        # if True, travel time CSVs are sorted by TMC then timestamp before loading (see sort_tt_csv.py).
+        # Sorting needs free disk space about equal to the CSV size.
+        self.presort_tt_csv = False
+        self.drop_dup_epochs = False # if presorting, also remove rows with duplicate TMC and timestamp
+        
+        # if a folder is given, each travel time CSV is also saved as a compressed archive, indexed
+        # by TMC, named after its SQL Server table (see tt_archive.py). Set to None to skip.
+        self.archive_dir = None # e.g. r"P:\NPMRDS data\Archive"
         
+        # if a folder is given, a bitmap of which epochs have data for each TMC is also saved there,
+        # named after its SQL Server table (see epoch_bitmap.py). Set to None to skip.
+        self.bitmap_dir = None # e.g. r"P:\NPMRDS data\EpochBitmaps"
         
         self.tmc_extent = f"{param_obj.tmcext}tmc"
         
@@ -155,7 +184,63 @@ class DataSet():
         
         # columns
         self.cols_timestamp = ['measurement_tstamp']
-    
+
+        # travel time columns, in the order they appear in the raw CSV, and their data type in the final table
+        self.tt_cols = {'tmc_code': 'varchar(9)', 'measurement_tstamp': 'datetime', 'speed': 'real',
+                        'historical_average_speed': 'real', 'reference_speed': 'real',
+                        'travel_time_seconds': 'real', 'data_density': 'varchar(1)'}
+        self.tt_cols_required = ['tmc_code', 'measurement_tstamp'] # cannot be dropped; used by indexes and all queries
+
+        # raw CSV columns to leave out of the final table, e.g. ['historical_average_speed', 'reference_speed']
+        self.tt_cols_drop = []
+
+        # columns to store as scaled integers, as {column: (scale factor, integer data type)}.
+        # e.g. {'speed': (10, 'smallint')} stores speed as tenths of mph in a 2-byte smallint instead
+        # of a 4-byte real. The final table gets a computed column with the original name and units,
+        # so queries that use the column need no changes. Values too big for the integer type
+        # will make the load fail (smallint max is 32,767, so 3,276.7 for a scale factor of 10).
+        self.tt_cols_scaled = {}
+
+    def tt_final_tbl_sql(self):
+        '''Returns SQL snippets to create and fill the final travel time table with only the
+        columns that are kept, with scaled columns stored as integers:
+            -column definitions for CREATE TABLE
+            -column names for INSERT INTO
+            -column expressions for SELECT from the staging table'''
+
+        for col in self.tt_cols_required:
+            if col in self.tt_cols_drop:
+                raise Exception(f"Column {col} is required and cannot be dropped.")
+
+        col_defs = []
+        insert_cols = []
+        select_exprs = []
+        for col, dtype in self.tt_cols.items():
+            if col in self.tt_cols_drop:
+                continue
+
+            if col in self.tt_cols_scaled:
+                scale, int_dtype = self.tt_cols_scaled[col]
+                col_scaled = f"{col}_x{scale}"
+                col_defs.append(f"{col_scaled} {int_dtype} NULL")
+                col_defs.append(f"{col} AS CAST({col_scaled} AS real) / {scale}") # computed column; takes no storage
+                insert_cols.append(col_scaled)
+                select_exprs.append(f"CAST(ROUND({col} * {scale}, 0) AS {int_dtype}) AS {col_scaled}")
+            elif col in self.cols_timestamp:
+                col_defs.append(f"{col} {dtype} NULL")
+                insert_cols.append(col)
+                select_exprs.append(f"REPLACE({col}, '''','') AS {col}")
+            else:
+                col_defs.append(f"{col} {dtype} NULL")
+                insert_cols.append(col)
+                select_exprs.append(col)
+
+        str_col_defs = ',\n\t'.join(col_defs)
+        str_insert_cols = ', '.join(insert_cols)
+        str_select_exprs = ',\n\t'.join(select_exprs)
+
+        return str_col_defs, str_insert_cols, str_select_exprs
+
     def sql_str_from_file(self, in_sql_file, *formatter_args):
         '''PARAMETERS:
             in_sql = sql file that string will be generated from.
@@ -183,26 +268,48 @@ class DataSet():
                                                  tbl_name=self.tmc_spec_tblname,
                                                  dt_cols=dt_columns,
                                                  str_load2final_sql=sqlstr_load2final,
-                                                 re_dt_format='(\d+-\d+-\d+\s\d+:\d+:\d+).*')
+                                                 re_dt_format='(\d+-\d+-\d+\s\d+:\d+:\d+).*',
+                                                 publish_via_side_tbl=self.publish_via_side_tbl)
         
     
     #load specified tables to SQL server
     def load_to_sql(self):
         qry_load2svr = os.path.join(self.qry_dir, self.sql_create_tt_tbls)
         qry_load2final = os.path.join(self.qry_dir, self.sql_tt_load2final)
+        qry_index = os.path.join(self.qry_dir, self.sql_tt_index)
 
         
         for data in self.data_dir_list:
             print(f"loading {data.csv_name} to {data.sql_server_table_name}...")
-            str_sql_load2svr = self.sql_str_from_file(qry_load2svr)
-            str_sql_load2final = self.sql_str_from_file(qry_load2final)
+            # {0} and {1} placeholders (staging and final table names) are kept for the loader to fill in
+            col_defs, insert_cols, select_exprs = self.tt_final_tbl_sql()
+            str_sql_load2svr = self.sql_str_from_file(qry_load2svr, '{0}', '{1}', col_defs)
+            str_sql_load2final = self.sql_str_from_file(qry_load2final, '{0}', '{1}', insert_cols, select_exprs)
+            str_sql_index = self.sql_str_from_file(qry_index)
+            
+            csv_to_load = data.csv_path
+            if self.presort_tt_csv:
+                csv_to_load = TTFileSorter(data.csv_path).sort(drop_duplicates=self.drop_dup_epochs)
 
           
-            self.BCP_conn.create_sql_table_from_file(file_in=data.csv_path, 
+            self.BCP_conn.create_sql_table_from_file(file_in=csv_to_load, 
                                                      str_create_table_sql=str_sql_load2svr,
                                                      tbl_name=data.sql_server_table_name,
                                                      dt_cols=self.cols_timestamp,
-                                                     str_load2final_sql=str_sql_load2final)
+                                                     str_load2final_sql=str_sql_load2final,
+                                                     publish_via_side_tbl=self.publish_via_side_tbl,
+                                                     str_index_sql=str_sql_index)
+            
+            if self.archive_dir:
+                archive_path = os.path.join(self.archive_dir, f"{data.sql_server_table_name}{ARCHIVE_EXT}")
+                TTArchiveWriter(csv_to_load, archive_path, presorted=self.presort_tt_csv).write()
+            
+            if self.bitmap_dir:
+                bitmap_path = os.path.join(self.bitmap_dir, f"{data.sql_server_table_name}{BITMAP_EXT}")
+                EpochBitmapWriter(csv_to_load, bitmap_path, data.table_year).write()
+            
+            if self.presort_tt_csv:
+                os.remove(csv_to_load) # delete to free up space
                 
 def do_work(param_csv):
     params = ParamCSV(param_csv)
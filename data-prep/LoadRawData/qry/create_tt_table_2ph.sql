@@ -5,6 +5,9 @@ Post processing for time stamp data for NPMRDS
 	string timestamp into SQL Server datetime timestamp.
 
 	**THIS QUERY JUST CREATES THE TWO TABLES (STAGING AND FINAL)
+	
+	If the loader is publishing via a side table, the "final" table here is the
+	side table (<table>_build), so dropping it does not affect the live table.
 */
 
 --drop staging table if exists
@@ -28,14 +31,10 @@ CREATE TABLE {0} ( --name of staging table
 )
 
 
+--final table columns come from DataSet.tt_final_tbl_sql(), which leaves out dropped
+--columns and stores scaled columns as integers
 CREATE TABLE {1} ( --name of final table
-	tmc_code varchar(9) NULL,
-	measurement_tstamp datetime NULL,
-	speed real NULL,
-	historical_average_speed real NULL,
-	reference_speed real NULL,
-	travel_time_seconds real NULL,
-	data_density varchar(1) NULL
+	{2}
 )
 
 
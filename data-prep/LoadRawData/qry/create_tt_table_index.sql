@@ -0,0 +1,9 @@
+/*
+Indexes for NPMRDS travel time table. Run against the side table after its data are
+loaded and before it is published, so that the live table is never queried without them.
+
+{0} = name of table to index
+*/
+
+CREATE CLUSTERED INDEX ix_tmc_tstamp ON {0} (tmc_code, measurement_tstamp)
+
@@ -7,15 +7,11 @@ Post processing for time stamp data for NPMRDS
 **THIS SCRIPT COMPLETES ONLY STEP 2**
 */
 
-INSERT INTO {1} --name of final table
+--columns and column expressions (e.g. removing timestamp quotes, scaling to integers)
+--come from DataSet.tt_final_tbl_sql()
+INSERT INTO {1} ({2}) --name of final table, columns being kept
 SELECT
-	tmc_code,
-	REPLACE(measurement_tstamp, '''','') AS measurement_tstamp,
-	speed,
-	historical_average_speed,
-	reference_speed,
-	travel_time_seconds,
-	data_density	
+	{3}
 FROM {0} --name of staging table
 
 DROP TABLE {0} --remove staging table when finished to clean up
@@ -0,0 +1,204 @@
+"""
+Name: sort_tt_csv.py
+Purpose: External merge sort for raw NPMRDS travel time CSVs, reordering rows by
+    TMC code and then timestamp. Raw downloads come ordered by timestamp, but nearly every
+    query groups or partitions by TMC, so loading pre-sorted data means SQL Server gets
+    its input already in clustered-index order.
+
+    Memory use is bounded: the file is split into byte ranges that are sorted in parallel
+    by separate processes, each writing sorted "run" files of at most max_rows_in_mem / n_workers
+    rows. The runs are then merged into the output file, at most merge_fan_in runs at a time (with
+    intermediate merge passes if there are more runs than that), so the number of open files stays
+    under the Windows C runtime's limit of 512. Because the output is sorted,
+    duplicate TMC-timestamp rows end up next to each other and are counted (and optionally
+    removed) during the merge.
+
+    Can be run as a stand-alone tool, or from load_raw_npmrds_data.py by setting
+    DataSet.presort_tt_csv = True
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import time
+import heapq
+import shutil
+import tempfile
+import multiprocessing as mp
+
+
+def sort_byte_range(in_csv, start_byte, end_byte, key_idxs, delim, rows_per_run, run_dir, worker_id):
+    '''Sorts the lines of in_csv that start in [start_byte, end_byte), writing one sorted
+    run file per rows_per_run lines. Returns list of run file paths.
+    Module-level so that it can be sent to worker processes.'''
+
+    run_files = []
+
+    def write_run(lines):
+        lines.sort(key=lambda line: line_key(line, key_idxs, delim))
+        run_path = os.path.join(run_dir, f"run_{worker_id}_{len(run_files)}.csv")
+        with open(run_path, 'wb') as f_out:
+            f_out.writelines(lines)
+        run_files.append(run_path)
+
+    with open(in_csv, 'rb') as f_in:
+        f_in.seek(start_byte)
+        pos = start_byte
+        lines = []
+        for line in f_in:
+            if pos >= end_byte:
+                break
+            pos += len(line)
+
+            if not line.endswith(b'\n'): # last line of file may not have line break
+                line += b'\n'
+            lines.append(line)
+
+            if len(lines) == rows_per_run:
+                write_run(lines)
+                lines = []
+
+        if lines:
+            write_run(lines)
+
+    return run_files
+
+
+def line_key(line, key_idxs, delim):
+    '''Sort key for a raw CSV line (bytes): tuple of the key column values'''
+    fields = line.split(delim)
+    return tuple(fields[i] for i in key_idxs)
+
+
+class TTFileSorter():
+    def __init__(self, in_csv, out_csv=None, sort_cols=['tmc_code', 'measurement_tstamp'],
+                 max_rows_in_mem=10000000, n_workers=None, delim=',', merge_fan_in=256):
+        '''
+        PARAMETERS:
+            in_csv (str file path) = raw NPMRDS travel time CSV, with header row
+            out_csv (str file path) = path of sorted output CSV. Default is <in_csv name>_sorted.csv
+                in the same folder as in_csv
+            sort_cols (list) = columns to sort by, in order of precedence
+            max_rows_in_mem (int) = max number of rows held in memory across all workers. Each
+                NPMRDS row takes roughly 150 bytes in memory once read, so 10 million rows is ~1.5GB
+            n_workers (int) = number of processes sorting in parallel. Default is number of CPU cores
+            delim (string) = field delimiter
+            merge_fan_in (int) = max number of run files merged (and open) at once
+        '''
+        self.in_csv = in_csv
+        self.out_csv = out_csv
+        if not out_csv:
+            self.out_csv = f"{os.path.splitext(in_csv)[0]}_sorted.csv"
+
+        self.sort_cols = sort_cols
+        self.n_workers = n_workers if n_workers else os.cpu_count()
+        self.rows_per_run = max(max_rows_in_mem // self.n_workers, 1)
+        self.delim = delim.encode()
+        self.merge_fan_in = max(merge_fan_in, 2)
+
+        self.dup_rows = 0 # count of rows whose key was the same as the preceding row's
+
+    def get_byte_ranges(self, data_start_byte):
+        '''Splits the data part of the file into one byte range per worker, with each
+        boundary moved forward to the start of the next line'''
+        file_size = os.path.getsize(self.in_csv)
+        approx_size = (file_size - data_start_byte) // self.n_workers
+
+        boundaries = [data_start_byte]
+        with open(self.in_csv, 'rb') as f_in:
+            for i in range(1, self.n_workers):
+                f_in.seek(max(data_start_byte + i * approx_size, boundaries[-1]))
+                f_in.readline()
+                boundaries.append(min(f_in.tell(), file_size))
+        boundaries.append(file_size)
+
+        return [(boundaries[i], boundaries[i+1]) for i in range(self.n_workers)
+                if boundaries[i+1] > boundaries[i]]
+
+    def sort(self, drop_duplicates=False):
+        '''Sorts in_csv and writes it to out_csv. If drop_duplicates is True, only the first
+        row for each TMC-timestamp is kept. Returns path to sorted file.'''
+        start_time = time.perf_counter()
+
+        with open(self.in_csv, 'rb') as f_in:
+            header = f_in.readline()
+            data_start_byte = f_in.tell()
+
+        header_cols = [c.strip().strip('"') for c in header.decode().split(self.delim.decode())]
+        key_idxs = [header_cols.index(c) for c in self.sort_cols]
+
+        run_dir = tempfile.mkdtemp(dir=os.path.dirname(self.out_csv))
+        try:
+            print(f"sorting {self.in_csv} by {self.sort_cols} using {self.n_workers} processes...")
+            tasks = [(self.in_csv, start, end, key_idxs, self.delim, self.rows_per_run, run_dir, i)
+                     for i, (start, end) in enumerate(self.get_byte_ranges(data_start_byte))]
+
+            with mp.Pool(len(tasks)) as pool:
+                run_lists = pool.starmap(sort_byte_range, tasks)
+            run_files = [run for runs in run_lists for run in runs]
+
+            print(f"\tmerging {len(run_files)} sorted runs into {self.out_csv}...")
+            self.merge_runs(run_files, header, key_idxs, drop_duplicates, run_dir)
+        finally:
+            shutil.rmtree(run_dir)
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"\tsorted in {elapsed_time}mins. {self.dup_rows} duplicate TMC-timestamp rows found.")
+
+        return self.out_csv
+
+    def merge_files(self, run_files, f_out, key_idxs, count_dups=False, drop_duplicates=False):
+        '''k-way merge of sorted run files, written to open file f_out. If count_dups is True, counts
+        duplicate keys as it goes (and skips them if drop_duplicates is True).'''
+        run_handles = [open(run, 'rb') for run in run_files]
+        try:
+            keyed_runs = [((line_key(line, key_idxs, self.delim), line) for line in f) for f in run_handles]
+            prev_key = None
+            for key, line in heapq.merge(*keyed_runs, key=lambda kl: kl[0]):
+                if count_dups and key == prev_key:
+                    self.dup_rows += 1
+                    if drop_duplicates:
+                        continue
+                f_out.write(line)
+                prev_key = key
+        finally:
+            for f in run_handles:
+                f.close()
+
+    def merge_runs(self, run_files, header, key_idxs, drop_duplicates, run_dir):
+        '''Merges sorted run files into out_csv, counting duplicate keys as it goes. If there are more than
+        merge_fan_in runs, groups of merge_fan_in runs are first merged into longer runs in run_dir,
+        as many passes as needed. Since heapq.merge() keeps equal keys in the order of its inputs,
+        rows with the same key stay in their original file order through every pass.'''
+        merge_pass = 0
+        while len(run_files) > self.merge_fan_in:
+            merge_pass += 1
+            merged_runs = []
+            for i in range(0, len(run_files), self.merge_fan_in):
+                group = run_files[i:i + self.merge_fan_in]
+                merged_path = os.path.join(run_dir, f"merge_{merge_pass}_{len(merged_runs)}.csv")
+                with open(merged_path, 'wb') as f_out:
+                    self.merge_files(group, f_out, key_idxs)
+                for run in group:
+                    os.remove(run)
+                merged_runs.append(merged_path)
+
+            print(f"\tmerge pass {merge_pass}: {len(run_files)} runs merged into {len(merged_runs)}...")
+            run_files = merged_runs
+
+        with open(self.out_csv, 'wb') as f_out:
+            f_out.write(header)
+            self.merge_files(run_files, f_out, key_idxs, count_dups=True, drop_duplicates=drop_duplicates)
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    in_file = r"P:\NPMRDS data\Raw Downloads\DynamicData_15Min\2023\inrix2023\inrix2023.csv"
+    remove_duplicates = False
+
+    #=================RUN SCRIPT===========================
+    sorter = TTFileSorter(in_file)
+    sorter.sort(drop_duplicates=remove_duplicates)
@@ -0,0 +1,9 @@
+"""
+Shared setup for LoadRawData tests. The loader scripts import each other by module name, so the
+LoadRawData folder is put on the path the same way it is when the scripts are run from that folder.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from sort_tt_csv import TTFileSorter
+
+
+def write_unsorted_csv(tmp_path, n_rows=3000, n_dups=40, seed=0):
+    '''Raw-format CSV in random row order, with n_dups repeated TMC-timestamps whose other values differ'''
+    rng = np.random.default_rng(seed)
+    tstamps = pd.date_range('2023-01-01', periods=n_rows // 10, freq='15min').strftime('%Y-%m-%d %H:%M:%S')
+    df = pd.DataFrame({'tmc_code': np.repeat([f"105+0{i:04d}" for i in range(10)], n_rows // 10),
+                       'measurement_tstamp': np.tile(tstamps, 10),
+                       'speed': rng.uniform(5, 70, n_rows).round(1)})
+    df_dups = df.sample(n_dups, random_state=seed).assign(speed=-1.0)
+    df = pd.concat([df, df_dups]).sample(frac=1, random_state=seed)
+
+    in_csv = str(tmp_path / 'tt.csv')
+    df.to_csv(in_csv, index=False)
+
+    return in_csv, df
+
+
+def test_sorted_output_and_duplicates(tmp_path):
+    in_csv, df = write_unsorted_csv(tmp_path)
+    sorter = TTFileSorter(in_csv, max_rows_in_mem=500, n_workers=2)
+
+    df_out = pd.read_csv(sorter.sort(), dtype={'tmc_code': str})
+
+    expected = df.sort_values(['tmc_code', 'measurement_tstamp'], kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_out, expected)
+    assert sorter.dup_rows == 40
+
+
+def test_multi_pass_merge_matches_single_pass(tmp_path):
+    in_csv, df = write_unsorted_csv(tmp_path)
+
+    # 30 runs of 100 rows merged 3 at a time takes several passes
+    multi = TTFileSorter(in_csv, str(tmp_path / 'multi.csv'), max_rows_in_mem=200, n_workers=2, merge_fan_in=3)
+    single = TTFileSorter(in_csv, str(tmp_path / 'single.csv'), max_rows_in_mem=200, n_workers=2)
+    multi.sort(drop_duplicates=True)
+    single.sort(drop_duplicates=True)
+
+    with open(multi.out_csv, 'rb') as f_multi, open(single.out_csv, 'rb') as f_single:
+        assert f_multi.read() == f_single.read()
+    assert multi.dup_rows == single.dup_rows == 40
+
+    # the first row for each TMC-timestamp, in input file order, is the one kept
+    df_out = pd.read_csv(multi.out_csv, dtype={'tmc_code': str})
+    expected = df.drop_duplicates(['tmc_code', 'measurement_tstamp'])
+    assert len(df_out) == len(expected)
+    assert (df_out['speed'] != -1).sum() == (expected['speed'] != -1).sum()
@@ -0,0 +1,206 @@
+"""
+Name: tt_archive.py
+Purpose: Compressed, indexed archive format for raw NPMRDS travel time CSVs, so that all
+    epochs for a few TMCs can be pulled from any year without loading the whole year
+    into SQL Server (or reading the whole raw CSV).
+
+    Each archive is two files:
+        <name>.ttarc - data for each TMC, stored as one zlib-compressed block per column.
+            Timestamps are stored as minutes since 1/1/1970, delta-encoded within each
+            TMC, which compresses to almost nothing for 15-minute data.
+        <name>.ttarc.json - index giving, for each TMC, the row count and the byte offset
+            and length of each of its column blocks.
+
+    Reading a TMC only reads its own blocks, so pulling a corridor's data from an archive is
+    a handful of small reads no matter how big the archive is.
+
+    Archives can be written as a stand-alone step, or by load_raw_npmrds_data.py when
+    DataSet.archive_dir is set.
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import glob
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from sort_tt_csv import TTFileSorter
+
+
+# dtype each column is stored as in the archive. Missing numbers are stored as NaN;
+# missing data_density is stored as 0.
+ARCHIVE_COLS = {'measurement_tstamp': 'int32', 'speed': 'float32', 'historical_average_speed': 'float32',
+                'reference_speed': 'float32', 'travel_time_seconds': 'float32', 'data_density': 'uint8'}
+COL_TMC = 'tmc_code'
+COL_TSTAMP = 'measurement_tstamp'
+COL_DENSITY = 'data_density'
+ARCHIVE_EXT = '.ttarc'
+INDEX_EXT = '.json'
+ARCHIVE_VERSION = 1
+
+
+class TTArchiveWriter():
+    def __init__(self, in_csv, archive_path, presorted=False, chunk_rows=2000000, compress_level=6):
+        '''
+        PARAMETERS:
+            in_csv (str file path) = raw NPMRDS travel time CSV
+            archive_path (str file path) = path of archive to create, ending in .ttarc. Index is
+                written to same path with .json added.
+            presorted (boolean) = True if in_csv is already sorted by TMC then timestamp (e.g. output
+                of sort_tt_csv.py). If False, a sorted copy is made and deleted when done.
+            chunk_rows (int) = number of CSV rows read into memory at a time
+            compress_level (int) = zlib compression level, 1 (fastest) to 9 (smallest)
+        '''
+        self.in_csv = in_csv
+        self.archive_path = archive_path
+        self.index_path = f"{archive_path}{INDEX_EXT}"
+        self.presorted = presorted
+        self.chunk_rows = chunk_rows
+        self.compress_level = compress_level
+
+    def tmc_blocks(self, df_tmc):
+        '''Converts one TMC's rows into a dict of {column: bytes} to write to the archive'''
+        tstamp_mins = df_tmc[COL_TSTAMP].values.astype('datetime64[m]').astype(np.int64)
+        tstamp_deltas = np.diff(tstamp_mins, prepend=0) # first value is absolute
+
+        blocks = {COL_TSTAMP: tstamp_deltas.astype(ARCHIVE_COLS[COL_TSTAMP])}
+        for col, dtype in ARCHIVE_COLS.items():
+            if col == COL_TSTAMP:
+                continue
+            elif col == COL_DENSITY:
+                density = df_tmc[col].fillna('\0').astype(str).str[0]
+                blocks[col] = np.frombuffer(''.join(density).encode('ascii'), dtype=np.uint8)
+            else:
+                blocks[col] = df_tmc[col].values.astype(dtype)
+
+        return {col: zlib.compress(arr.tobytes(), self.compress_level) for col, arr in blocks.items()}
+
+    def write(self):
+        '''Writes archive and index. Returns path to archive.'''
+        csv_sorted = self.in_csv
+        if not self.presorted:
+            csv_sorted = TTFileSorter(self.in_csv, out_csv=f"{self.archive_path}_sorted.csv").sort()
+
+        print(f"writing {self.in_csv} to archive {self.archive_path}...")
+        tmc_index = {}
+        try:
+            with open(self.archive_path, 'wb') as f_out:
+
+                def write_tmc(tmc, df_tmc):
+                    tmc_entry = {'nrows': len(df_tmc), 'blocks': {}}
+                    for col, block in self.tmc_blocks(df_tmc).items():
+                        tmc_entry['blocks'][col] = [f_out.tell(), len(block)]
+                        f_out.write(block)
+                    tmc_index[tmc] = tmc_entry
+
+                # a TMC's rows can span two chunks, so the last TMC in each chunk is held
+                # back and combined with the start of the next chunk
+                df_pending = None
+                for df_chunk in pd.read_csv(csv_sorted, chunksize=self.chunk_rows, dtype={COL_TMC: str, COL_DENSITY: str},
+                                            parse_dates=[COL_TSTAMP]):
+                    if df_pending is not None:
+                        df_chunk = pd.concat([df_pending, df_chunk])
+
+                    last_tmc = df_chunk[COL_TMC].iloc[-1]
+                    df_pending = df_chunk.loc[df_chunk[COL_TMC] == last_tmc]
+
+                    for tmc, df_tmc in df_chunk.loc[df_chunk[COL_TMC] != last_tmc].groupby(COL_TMC, sort=False):
+                        write_tmc(tmc, df_tmc)
+
+                if df_pending is not None:
+                    write_tmc(df_pending[COL_TMC].iloc[0], df_pending)
+        finally:
+            if not self.presorted:
+                os.remove(csv_sorted)
+
+        index = {'version': ARCHIVE_VERSION, 'source_csv': os.path.basename(self.in_csv),
+                 'columns': ARCHIVE_COLS, 'tmcs': tmc_index}
+        with open(self.index_path, 'w') as f_out:
+            json.dump(index, f_out)
+
+        print(f"\tarchived {len(tmc_index)} TMCs.")
+
+        return self.archive_path
+
+
+class TTArchive():
+    def __init__(self, archive_path):
+        '''Reader for an archive made by TTArchiveWriter.
+        PARAMETERS:
+            archive_path (str file path) = path to .ttarc file. Its .json index must be in the same folder.'''
+        self.archive_path = archive_path
+        with open(f"{archive_path}{INDEX_EXT}", 'r') as f_in:
+            self.index = json.load(f_in)
+
+        self.tmcs = list(self.index['tmcs'].keys())
+
+    def read_tmcs(self, tmcs, cols=None):
+        '''Returns dataframe of all epochs for the specified TMCs. TMCs not in the archive are skipped.
+        PARAMETERS:
+            tmcs (list) = TMC codes to get data for
+            cols (list) = optional list of columns to read. Default is all columns. Timestamp is always read.'''
+        if cols is None:
+            cols = list(self.index['columns'].keys())
+        cols = [COL_TSTAMP] + [c for c in cols if c != COL_TSTAMP]
+
+        tmc_dfs = []
+        with open(self.archive_path, 'rb') as f_in:
+            for tmc in tmcs:
+                tmc_entry = self.index['tmcs'].get(tmc)
+                if tmc_entry is None:
+                    continue
+
+                tmc_data = {COL_TMC: np.full(tmc_entry['nrows'], tmc, dtype=object)}
+                for col in cols:
+                    offset, nbytes = tmc_entry['blocks'][col]
+                    f_in.seek(offset)
+                    arr = np.frombuffer(zlib.decompress(f_in.read(nbytes)), dtype=self.index['columns'][col])
+
+                    if col == COL_TSTAMP:
+                        arr = np.cumsum(arr, dtype=np.int64).astype('datetime64[m]')
+                    elif col == COL_DENSITY:
+                        arr = np.where(arr == 0, None, arr.view('S1').astype(str))
+                    tmc_data[col] = arr
+
+                tmc_dfs.append(pd.DataFrame(tmc_data))
+
+        if not tmc_dfs:
+            return pd.DataFrame(columns=[COL_TMC] + cols)
+
+        return pd.concat(tmc_dfs, ignore_index=True)
+
+
+def read_archive_dir(archive_dir, tmcs, cols=None):
+    '''Returns data for the specified TMCs from every archive in archive_dir (e.g. all years), with
+    an archive_name column saying which archive each row came from.'''
+    archive_paths = sorted(glob.glob(os.path.join(archive_dir, f"*{ARCHIVE_EXT}")))
+    if not archive_paths:
+        raise Exception(f"No {ARCHIVE_EXT} archives found in {archive_dir}.")
+
+    archive_dfs = []
+    for archive_path in archive_paths:
+        df = TTArchive(archive_path).read_tmcs(tmcs, cols)
+        df['archive_name'] = os.path.splitext(os.path.basename(archive_path))[0]
+        archive_dfs.append(df)
+
+    return pd.concat(archive_dfs, ignore_index=True)
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    in_file = r"P:\NPMRDS data\Raw Downloads\DynamicData_15Min\2023\inrix2023\inrix2023.csv"
+    out_archive = r"P:\NPMRDS data\Archive\npmrds_2023_alltmc_paxtruck_comb.ttarc"
+
+    #=================RUN SCRIPT===========================
+    TTArchiveWriter(in_file, out_archive).write()
+
+    # example of pulling all years of data for a few TMCs
+    # df = read_archive_dir(os.path.dirname(out_archive), ['105+04687', '105-04686'])
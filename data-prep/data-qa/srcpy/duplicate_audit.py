@@ -0,0 +1,213 @@
+"""
+Name: duplicate_audit.py
+Purpose: Audit of duplicate epochs (two or more rows with the same TMC and measurement_tstamp) in any
+    number of NPMRDS travel time data sets - raw CSVs, Parquet files or loaded SQL Server tables - in
+    one run. Replaces the GROUP BY ... HAVING COUNT(*) > 1 queries in sql/check_for_duplicates.sql.
+
+    Data are read in chunks. For each TMC and year, a bitmap with one bit per epoch records which epochs
+    have been seen (4,380 bytes per TMC-year at 15-minute epochs), so memory use depends on the number of
+    TMCs, not the number of rows, and no sorting or GROUP BY is needed. A row is a duplicate if its
+    TMC and epoch have already been seen.
+
+    For each data set, reports:
+        -total rows, duplicate rows (rows after the first for a TMC and epoch) and duplicated epochs
+        -duplicate rows by TMC, by month, and by data_density
+        -sample duplicate rows
+    The summary for all data sets is written to a JSON file, and duplicate counts by TMC to a CSV.
+
+    Reading Parquet files requires the pyarrow package; reading SQL Server tables requires pyodbc.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+
+COL_TMC = 'tmc_code'
+COL_TSTAMP = 'measurement_tstamp'
+COL_DENSITY = 'data_density'
+EPOCH_MINS = 15
+
+
+def data_chunks(data_source, chunk_rows, svr_name, db_name):
+    '''Yields dataframes of chunk_rows rows from a raw CSV, Parquet file or SQL Server table'''
+    source_ext = os.path.splitext(data_source)[1].lower()
+    if source_ext == '.csv':
+        yield from pd.read_csv(data_source, chunksize=chunk_rows, dtype={COL_TMC: str, COL_DENSITY: str},
+                               parse_dates=[COL_TSTAMP])
+    elif source_ext == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(data_source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        import pyodbc
+        conn_str = f"Driver={{SQL Server}}; Server={svr_name}; Database={db_name}; Trusted_Connection=yes;"
+        with pyodbc.connect(conn_str) as conn:
+            yield from pd.read_sql(f"SELECT * FROM {data_source}", conn, chunksize=chunk_rows)
+
+
+class SeenEpochs():
+    '''Bitmap of epochs seen so far for each TMC and year'''
+    def __init__(self, epoch_mins=EPOCH_MINS):
+        self.epoch_mins = epoch_mins
+        self.tmc_rows = {} # {year: {tmc: row in bitmap}}
+        self.bits = {} # {year: uint8 array, one row per TMC and one bit per epoch of the year}
+
+    def year_bitmap(self, year, tmcs):
+        '''Returns bitmap for year, with rows added for any tmcs not seen yet'''
+        if year not in self.bits:
+            n_epochs = (np.datetime64(f"{year + 1}-01-01", 'm') - np.datetime64(f"{year}-01-01", 'm')) \
+                .astype(np.int64) // self.epoch_mins
+            self.tmc_rows[year] = {}
+            self.bits[year] = np.zeros((256, -(-n_epochs // 8)), dtype=np.uint8)
+
+        tmc_rows = self.tmc_rows[year]
+        for tmc in tmcs:
+            if tmc not in tmc_rows:
+                tmc_rows[tmc] = len(tmc_rows)
+
+        bits = self.bits[year]
+        if len(tmc_rows) > len(bits):
+            n_rows = max(len(tmc_rows), 2 * len(bits))
+            self.bits[year] = np.concatenate([bits, np.zeros((n_rows - len(bits), bits.shape[1]), dtype=np.uint8)])
+
+        return self.bits[year]
+
+    def add(self, tmcs, tstamps):
+        '''Marks epochs as seen. Returns boolean array, True for each row whose TMC and epoch were already
+        seen, either in an earlier chunk or earlier in this one.'''
+        tstamps = tstamps.astype('datetime64[m]')
+        years = tstamps.astype('datetime64[Y]').astype(np.int64) + 1970
+        is_dup = np.zeros(len(tmcs), dtype=bool)
+
+        for year in np.unique(years):
+            in_year = np.flatnonzero(years == year)
+            bits = self.year_bitmap(int(year), pd.unique(tmcs[in_year]))
+            n_epochs = bits.shape[1] * 8
+
+            row = pd.Series(tmcs[in_year]).map(self.tmc_rows[int(year)]).values.astype(np.int64)
+            epoch = (tstamps[in_year] - np.datetime64(f"{year}-01-01", 'm')).astype(np.int64) // self.epoch_mins
+            keys = row * n_epochs + epoch
+
+            # first row for each key in this chunk is a duplicate only if the key was set by an earlier chunk
+            uniq_keys, first_idx = np.unique(keys, return_index=True)
+            is_dup_year = np.ones(len(keys), dtype=bool)
+            row_u, epoch_u = uniq_keys // n_epochs, uniq_keys % n_epochs
+            byte_idx, bit_val = epoch_u // 8, np.uint8(128) >> (epoch_u % 8).astype(np.uint8)
+            is_dup_year[first_idx] = (bits[row_u, byte_idx] & bit_val) > 0
+
+            np.bitwise_or.at(bits, (row_u, byte_idx), bit_val)
+            is_dup[in_year] = is_dup_year
+
+        return is_dup
+
+
+class DuplicateAudit():
+    def __init__(self, data_sources, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=2000000, n_sample_rows=20):
+        '''
+        PARAMETERS:
+            data_sources (list) = raw travel time CSVs, Parquet files or SQL Server table names to audit.
+                Each is audited separately.
+            svr_name (string) = SQL Server instance, for data sources that are tables
+            db_name (string) = SQL Server database, for data sources that are tables
+            chunk_rows (int) = number of rows read into memory at a time
+            n_sample_rows (int) = number of duplicate rows to keep as examples for each data source
+        '''
+        self.data_sources = data_sources
+        self.svr_name = svr_name
+        self.db_name = db_name
+        self.chunk_rows = chunk_rows
+        self.n_sample_rows = n_sample_rows
+
+    def audit_source(self, data_source):
+        '''Returns (summary dict, series of duplicate rows by TMC) for one data source'''
+        start_time = time.perf_counter()
+        print(f"checking {data_source} for duplicate epochs...")
+
+        seen = SeenEpochs()
+        dup_tmc = pd.Series(dtype=np.int64)
+        dup_month = pd.Series(dtype=np.int64)
+        dup_density = pd.Series(dtype=np.int64)
+        dup_epochs = SeenEpochs() # epochs seen as duplicates, so each duplicated epoch is counted once
+        n_dup_epochs = 0
+        samples = []
+        rows_read = 0
+
+        for df in data_chunks(data_source, self.chunk_rows, self.svr_name, self.db_name):
+            tstamps = pd.to_datetime(df[COL_TSTAMP]).values
+            tmcs = df[COL_TMC].astype(str).values
+            is_dup = seen.add(tmcs, tstamps)
+
+            if is_dup.any():
+                df_dup = df.loc[is_dup]
+                n_dup_epochs += (~dup_epochs.add(tmcs[is_dup], tstamps[is_dup])).sum()
+
+                dup_tmc = dup_tmc.add(df_dup[COL_TMC].astype(str).value_counts(), fill_value=0)
+                months = pd.Series(tstamps[is_dup].astype('datetime64[M]')).dt.strftime('%Y-%m')
+                dup_month = dup_month.add(months.value_counts(), fill_value=0)
+                if COL_DENSITY in df_dup.columns:
+                    densities = df_dup[COL_DENSITY].fillna('none').astype(str)
+                    dup_density = dup_density.add(densities.value_counts(), fill_value=0)
+
+                if len(samples) < self.n_sample_rows:
+                    samples.extend(df_dup.head(self.n_sample_rows - len(samples)).astype(str).to_dict('records'))
+
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+        summary = {'data_source': data_source, 'rows': rows_read, 'dup_rows': int(dup_tmc.sum()),
+                   'dup_epochs': int(n_dup_epochs), 'tmcs_with_dups': len(dup_tmc),
+                   'dup_rows_by_month': {k: int(v) for k, v in dup_month.sort_index().items()},
+                   'dup_rows_by_density': {k: int(v) for k, v in dup_density.sort_index().items()},
+                   'dup_rows_top_tmcs': {k: int(v) for k, v in dup_tmc.sort_values(ascending=False).head(20).items()},
+                   'sample_dup_rows': samples}
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"\t{summary['dup_rows']} duplicate rows found on {summary['tmcs_with_dups']} TMCs in {elapsed_time}mins.")
+
+        return summary, dup_tmc.astype(np.int64)
+
+    def run(self, out_json=None, out_csv_tmc=None):
+        '''Audits each data source. Returns list of summary dicts and dataframe of duplicate rows by data source
+        and TMC, and writes them to out_json and out_csv_tmc if given.'''
+        summaries = []
+        tmc_dfs = []
+        for data_source in self.data_sources:
+            summary, dup_tmc = self.audit_source(data_source)
+            summaries.append(summary)
+            tmc_dfs.append(pd.DataFrame({'data_source': data_source, COL_TMC: dup_tmc.index, 'dup_rows': dup_tmc.values}))
+
+        df_tmc = pd.concat(tmc_dfs, ignore_index=True)
+
+        if out_json:
+            with open(out_json, 'w') as f_out:
+                json.dump(summaries, f_out, indent=2)
+        if out_csv_tmc:
+            df_tmc.to_csv(out_csv_tmc, index=False)
+
+        return summaries, df_tmc
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    # raw CSVs, Parquet files or SQL Server table names; can mix types and years
+    sources_to_check = ['npmrds_2016_alltmc_paxtruck_comb',
+                        'npmrds_2017_alltmc_paxtruck_comb',
+                        'npmrds_2020_alltmc_paxtruck_comb',
+                        r"P:\NPMRDS data\Raw Downloads\DynamicData_15Min\2023\inrix2023\inrix2023.csv"]
+
+    output_json = r"P:\NPMRDS data\DataQA\duplicate_audit.json"
+    output_csv_tmcs = r"P:\NPMRDS data\DataQA\duplicate_audit_tmcs.csv"
+
+    #=================RUN SCRIPT===========================
+    DuplicateAudit(sources_to_check).run(output_json, output_csv_tmcs)
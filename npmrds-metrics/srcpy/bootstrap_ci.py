@@ -0,0 +1,230 @@
+"""
+Name: bootstrap_ci.py
+Purpose: Bootstrap confidence intervals for the PPA2 metrics most often compared between projects:
+    LOTTR for each reliability period, free-flow speed (PPA2Params.ff_col_congratio) and
+    havg_spd_worst4hrs. Epoch counts alone do not say how much a metric could move by chance; the
+    interval does, so small differences between TMCs or years can be checked before being read into.
+
+    Travel time data are read once (PPA2Metrics.read_epochs()). Then, for each TMC, n_reps bootstrap
+    replicates are drawn with replacement from that TMC's own epochs:
+        -LOTTR: 80th and 50th percentile travel times from the same resample of the period's epochs
+        -free-flow speed: percentile of a resample of the overnight speeds
+        -havg_spd_worst4hrs: each weekday hour's speeds are resampled separately, so each hour keeps
+            its epoch count; worst hours are then picked again for each replicate (congestion_hours.py),
+            using that replicate's free-flow speed
+    All replicates for a TMC are drawn as one array of random indices into the TMC's sorted values;
+    percentiles come from partitioning the indices rather than sorting every replicate.
+
+    TMCs are split into blocks that run on a pool of processes. Each TMC gets its own random number
+    stream, spawned from one seed with numpy's SeedSequence, so results for a given seed do not depend
+    on the number of processes or how TMCs are split into blocks.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ppa2_metrics import PPA2Metrics, PPA2Params
+from congestion_hours import worst_hours
+
+
+def resample_percentiles(vals_sorted, pctls, n_reps, rng, max_draws=20000000):
+    '''Percentiles of n_reps bootstrap resamples of vals_sorted, with linear interpolation like
+    PERCENTILE_CONT. Returns array of shape (len(pctls), n_reps); NaN if there are no values.
+    PARAMETERS:
+        vals_sorted (array) = values in ascending order, with no NaNs
+        pctls (list) = percentiles as fractions
+        rng (numpy Generator) = random number generator
+        max_draws (int) = largest number of random indices held in memory at once
+    '''
+    n = len(vals_sorted)
+    out = np.full((len(pctls), n_reps), np.nan)
+    if n == 0:
+        return out
+
+    # since vals_sorted is in order, the k-th smallest resampled value is vals_sorted at the k-th smallest index
+    pos = np.array(pctls) * (n - 1)
+    pos_lo = np.floor(pos).astype(np.int64)
+    pos_hi = np.minimum(pos_lo + 1, n - 1)
+    frac = pos - pos_lo
+    kth = np.unique(np.concatenate([pos_lo, pos_hi]))
+
+    reps_per_batch = max(max_draws // n, 1)
+    for rep_start in range(0, n_reps, reps_per_batch):
+        n_batch = min(reps_per_batch, n_reps - rep_start)
+        draws = rng.integers(0, n, size=(n_batch, n), dtype=np.int32)
+        draws.partition(kth, axis=1)
+        vals_lo = vals_sorted[draws[:, pos_lo]].T
+        vals_hi = vals_sorted[draws[:, pos_hi]].T
+        out[:, rep_start:rep_start + n_batch] = vals_lo + (vals_hi - vals_lo) * frac[:, None]
+
+    return out
+
+
+def resample_sums(vals, n_reps, rng, max_draws=20000000):
+    '''Sums of n_reps bootstrap resamples of vals. Returns array of length n_reps.'''
+    n = len(vals)
+    out = np.zeros(n_reps)
+    if n == 0:
+        return out
+
+    reps_per_batch = max(max_draws // n, 1)
+    for rep_start in range(0, n_reps, reps_per_batch):
+        n_batch = min(reps_per_batch, n_reps - rep_start)
+        out[rep_start:rep_start + n_batch] = vals[rng.integers(0, n, size=(n_batch, n))].sum(axis=1)
+
+    return out
+
+
+def bootstrap_tmc_block(block_args):
+    '''Bootstrap replicates for a block of TMCs. Returns list of dicts of replicate arrays, one per TMC.
+    Module-level so that it can be sent to worker processes.'''
+    tmc_inputs, seed_seqs, params, n_reps = block_args
+
+    tmc_reps = []
+    for tmc_input, seed_seq in zip(tmc_inputs, seed_seqs):
+        rng = np.random.default_rng(seed_seq)
+        reps = {}
+
+        for prd_name, tt_sorted in tmc_input['tt'].items():
+            tt_pctls = resample_percentiles(tt_sorted, [params.pctl_congested, 0.5], n_reps, rng)
+            reps[params.lottr_cols[prd_name]] = tt_pctls[0] / tt_pctls[1]
+
+        ff_speed = resample_percentiles(tmc_input['ff_spd'], [tmc_input['ff_pctl']], n_reps, rng)[0]
+        reps[params.ff_col_congratio] = ff_speed
+
+        # replicates take the place of TMCs in worst_hours(): one row per replicate
+        cnt_hr = np.broadcast_to(tmc_input['wkdy_cnt_hr'], (n_reps, 24))
+        inv_spd_hr = np.column_stack([resample_sums(inv_spd, n_reps, rng) for inv_spd in tmc_input['wkdy_inv_spd']])
+        reps['havg_spd_worst4hrs'] = worst_hours(cnt_hr, inv_spd_hr, ff_speed, params)['havg_spd_worst4hrs']
+
+        tmc_reps.append(reps)
+
+    return tmc_reps
+
+
+class BootstrapCI():
+    def __init__(self, tt_source, spec_source, params=None, n_reps=1000, ci_level=0.9, seed=None, n_workers=None,
+                 epoch_filter=None, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000):
+        '''
+        PARAMETERS:
+            tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            params (PPA2Params) = metric parameters. Default is PPA2Params()
+            n_reps (int) = number of bootstrap replicates for each TMC
+            ci_level (float) = confidence level of intervals, e.g. 0.9 for 5th-95th percentile of replicates
+            seed (int) = seed for random numbers. Same seed gives same results. If None, results vary by run.
+            n_workers (int) = number of processes. Default is number of CPUs.
+            epoch_filter (EpochFilter) = optional filter of epochs (see epoch_filter.py), as in PPA2Metrics
+        '''
+        self.metrics = PPA2Metrics(tt_source, spec_source, params, svr_name, db_name, chunk_rows,
+                                   epoch_filter=epoch_filter)
+        self.params = self.metrics.params
+        self.n_reps = n_reps
+        self.ci_level = ci_level
+        self.seed = seed
+        self.n_workers = n_workers if n_workers else os.cpu_count()
+
+    def tmc_inputs(self, epochs):
+        '''Splits epoch arrays from PPA2Metrics.read_epochs() into the inputs bootstrap_tmc_block() needs
+        for each TMC in spec table: sorted travel times for each period, sorted overnight speeds and free-flow
+        percentile, and weekday epoch counts and 1/speed values for each hour of day'''
+        p = self.params
+        n_tmc = len(self.metrics.spec)
+        prd_code_ff = len(p.rel_periods) + 1
+        is_fwy = self.metrics.spec['f_system'].isin(p.fwy_fsystems).values
+
+        # one sort puts each TMC's epochs together, ordered by period and travel time
+        tmc_idx, prd, how = epochs['tmc_idx'], epochs['prd'], epochs['how']
+        order = np.lexsort((epochs['tt'], prd, tmc_idx))
+        bounds = np.searchsorted(tmc_idx[order], np.arange(n_tmc + 1))
+
+        inputs = []
+        for i in range(n_tmc):
+            idx = order[bounds[i]:bounds[i + 1]]
+            prd_i, how_i = prd[idx], how[idx]
+            tt_i, spd_i = epochs['tt'][idx].astype(np.float64), epochs['speed'][idx].astype(np.float64)
+
+            tt_prds = {}
+            for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+                tt_prd = tt_i[prd_i == prd_code]
+                tt_prds[prd_name] = tt_prd[~np.isnan(tt_prd)] # already sorted
+
+            ff_spd = np.sort(spd_i[(prd_i == prd_code_ff) & ~np.isnan(spd_i)])
+
+            is_wkdy = np.isin(how_i // 24, p.weekdays) & (spd_i > 0)
+            hr_wkdy = how_i[is_wkdy] % 24
+            inv_spd_wkdy = 1 / spd_i[is_wkdy]
+
+            inputs.append({'tt': tt_prds, 'ff_spd': ff_spd,
+                           'ff_pctl': p.ff_pctl_fwy if is_fwy[i] else p.ff_pctls_art[p.ff_col_congratio],
+                           'wkdy_cnt_hr': np.bincount(hr_wkdy, minlength=24),
+                           'wkdy_inv_spd': [inv_spd_wkdy[hr_wkdy == hr] for hr in range(24)]})
+
+        return inputs
+
+    def run(self):
+        '''Returns dataframe of PPA2 metrics for each TMC, with lower and upper confidence limits and
+        bootstrap standard error for each LOTTR, free-flow speed and havg_spd_worst4hrs'''
+        start_time = time.perf_counter()
+
+        print(f"reading travel time data from {self.metrics.tt_data.tt_source}...")
+        epochs = self.metrics.read_epochs()
+        df_out = self.metrics.calc_metrics(epochs)
+
+        inputs = self.tmc_inputs(epochs)
+        del epochs
+        seed_seqs = np.random.SeedSequence(self.seed).spawn(len(inputs))
+
+        n_blocks = min(self.n_workers * 4, len(inputs))
+        block_bounds = np.linspace(0, len(inputs), n_blocks + 1).astype(int)
+        block_args = [(inputs[s:e], seed_seqs[s:e], self.params, self.n_reps)
+                      for s, e in zip(block_bounds[:-1], block_bounds[1:])]
+
+        print(f"drawing {self.n_reps} bootstrap replicates for {len(inputs)} TMCs with {self.n_workers} workers...")
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            tmc_reps = [reps for block_reps in executor.map(bootstrap_tmc_block, block_args) for reps in block_reps]
+
+        alpha = (1 - self.ci_level) / 2
+        for col in tmc_reps[0] if tmc_reps else []:
+            reps = np.vstack([r[col] for r in tmc_reps]) # shape (number of TMCs, n_reps)
+            with np.errstate(invalid='ignore'):
+                has_reps = ~np.isnan(reps).all(axis=1)
+                ci = np.full((2, len(reps)), np.nan)
+                ci[:, has_reps] = np.nanquantile(reps[has_reps], [alpha, 1 - alpha], axis=1)
+                se = np.full(len(reps), np.nan)
+                se[has_reps] = np.nanstd(reps[has_reps], axis=1, ddof=1)
+            df_out[f"{col}_ci_lo"] = ci[0]
+            df_out[f"{col}_ci_hi"] = ci[1]
+            df_out[f"{col}_se"] = se
+
+        ci_cols = [c for c in df_out.columns if c.endswith(('_ci_lo', '_ci_hi', '_se'))]
+        df_out[ci_cols] = df_out[ci_cols].fillna(-1)
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"bootstrap intervals calculated for {len(df_out)} TMCs in {elapsed_time}mins")
+
+        return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    replicates = 1000
+    random_seed = 2023
+
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_npmrds_metrics_2023_bootstrap_ci.csv"
+
+    #=================RUN SCRIPT===========================
+    df_ci = BootstrapCI(tt_table, spec_table, PPA2Params(), n_reps=replicates, seed=random_seed).run()
+    df_ci.to_csv(output_csv, index=False)
@@ -0,0 +1,95 @@
+"""
+Name: congestion_hours.py
+Purpose: Worst-4-hour and slowest-hour congestion metrics for every TMC at once, from dense
+    TMC x hour-of-day arrays of weekday epoch counts and sums of 1/speed.
+
+    The #avspd_x_tmc_hour, #most_congd_hrs and #slowest_hr steps of PPA2_NPMRDS_metrics_latest.sql
+    rescan the travel time table and need a ROW_NUMBER() step to drop duplicates when hours tie.
+    Here, each TMC's hours are ranked with one stable argsort over the whole TMC x 24 array:
+        -hours with fewer than the minimum epochs are masked out and sort last
+        -tied hours keep hour-of-day order, so the slowest hour is always the earliest of any tie
+        -tied hours get the same rank, as with SQL RANK(), so more than 4 hours can be "worst 4"
+            if hours tie at 4th place, matching the SQL script
+    Harmonic average speed over the worst hours is then a masked sum over the same arrays.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import numpy as np
+
+
+def hourly_speed_sums(tmc_idx, hours, speeds, n_tmc):
+    '''Returns TMC x hour-of-day arrays of epoch counts and sums of 1/speed, for epochs with speed > 0.
+    PARAMETERS:
+        tmc_idx (int array) = TMC number, 0 to n_tmc - 1, of each epoch
+        hours (int array) = hour of day of each epoch
+        speeds (float array) = speed of each epoch
+        n_tmc (int) = number of TMCs
+    '''
+    has_spd = speeds > 0
+    tmc_hr = tmc_idx[has_spd].astype(np.int64) * 24 + hours[has_spd]
+    cnt_hr = np.bincount(tmc_hr, minlength=n_tmc * 24).reshape(n_tmc, 24)
+    inv_spd_hr = np.bincount(tmc_hr, weights=1 / speeds[has_spd].astype(np.float64),
+                             minlength=n_tmc * 24).reshape(n_tmc, 24)
+
+    return cnt_hr, inv_spd_hr
+
+
+def rank_hours(cong_ratio, is_ranked):
+    '''Ranks each row's hours from most to least congested (lowest to highest congestion ratio).
+    Returns (hour order, rank of each hour). Tied hours get the lowest rank in the tie, as with
+    SQL RANK(). Hours not in is_ranked come last in hour order.'''
+    sort_vals = np.where(is_ranked, cong_ratio, np.inf)
+    hr_order = np.argsort(sort_vals, axis=1, kind='stable') # stable sort keeps tied hours in hour order
+    vals_sorted = np.take_along_axis(sort_vals, hr_order, axis=1)
+
+    # each hour in a tie gets the sorted position of the first hour in the tie
+    pos = np.broadcast_to(np.arange(vals_sorted.shape[1]), vals_sorted.shape)
+    starts_tie = np.ones(vals_sorted.shape, dtype=bool)
+    starts_tie[:, 1:] = vals_sorted[:, 1:] != vals_sorted[:, :-1]
+    rank_sorted = np.maximum.accumulate(np.where(starts_tie, pos, 0), axis=1) + 1
+
+    hr_rank = np.empty_like(rank_sorted)
+    np.put_along_axis(hr_rank, hr_order, rank_sorted, axis=1)
+
+    return hr_order, hr_rank
+
+
+def worst_hours(cnt_hr, inv_spd_hr, ff_speed, params):
+    '''Worst-4-hour and slowest-hour metrics. Hours are ranked by congestion ratio (harmonic average
+    speed divided by free-flow speed).
+    PARAMETERS:
+        cnt_hr (array) = weekday epochs with speed > 0, shape (number of TMCs, 24)
+        inv_spd_hr (array) = sums of 1/speed for the same epochs, shape (number of TMCs, 24)
+        ff_speed (array) = free-flow speed used for congestion ratio, for each TMC
+        params (PPA2Params) = gives min_epochs_hr and n_worst_hrs
+
+    Returns dict of arrays with one value per TMC, NaN where TMC has no ranked hours.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        havg_spd_hr = cnt_hr / inv_spd_hr
+        cong_ratio = havg_spd_hr / ff_speed[:, None]
+
+    # hours with too little data, or TMCs with no free-flow speed, are not ranked
+    is_ranked = (cnt_hr >= params.min_epochs_hr) & ~np.isnan(cong_ratio)
+    hr_order, hr_rank = rank_hours(cong_ratio, is_ranked)
+
+    is_worst = is_ranked & (hr_rank <= params.n_worst_hrs)
+    epochs_worst = np.where(is_worst, cnt_hr, 0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        havg_spd_worst = epochs_worst / np.where(is_worst, inv_spd_hr, 0).sum(axis=1)
+
+    has_slowest = is_ranked.any(axis=1)
+    slowest_hr = hr_order[:, 0]
+    rows = np.arange(len(slowest_hr))
+
+    return {'havg_spd_worst4hrs': havg_spd_worst,
+            'epochs_worst4hrs': np.where(epochs_worst > 0, epochs_worst, np.nan),
+            'slowest_hr': np.where(has_slowest, slowest_hr, np.nan),
+            'slowest_hr_speed': np.where(has_slowest, havg_spd_hr[rows, slowest_hr], np.nan),
+            'epochs_slowest_hr': np.where(has_slowest, cnt_hr[rows, slowest_hr], np.nan)}
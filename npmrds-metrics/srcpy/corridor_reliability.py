@@ -0,0 +1,221 @@
+"""
+Name: corridor_reliability.py
+Purpose: Travel time reliability of whole corridors (tmclinear and direction), for the CMP. Averaging the LOTTRs of a
+    corridor's TMCs is not the corridor's LOTTR, since TMCs are not slow at the same times; instead,
+    each epoch's corridor travel time is the sum of its TMCs' travel times in that epoch, and percentiles
+    are taken of those sums.
+
+    A corridor is the TMCs with the same tmclinear and direction (both directions of a road share a
+    tmclinear), in road_order. Uses a matrix store (tt_matrix_store.py), whose TMC rows are in that order.
+    TMCs missing from an epoch are filled before summing:
+        -gaps of up to max_gap_epochs in a row are linearly interpolated from the TMC's epochs on each side
+        -longer gaps are filled with the TMC's average travel time for that hour of the week
+    An epoch's corridor travel time is only used if at least min_obs_share of the corridor's miles have
+    observed (not filled) data in that epoch.
+
+    For each corridor and reliability period (PPA2Params.rel_periods):
+        tt_p50_<prd>, tt_p80_<prd> - 50th and 80th percentile corridor travel time, seconds
+        LOTTR (PPA2Params.lottr_cols, e.g. lottr_ampk) - tt_p80 / tt_p50
+        tti_<prd> - travel time index, mean corridor travel time / free-flow corridor travel time
+    Free-flow corridor travel time (ff_tt) is the (1 - PPA2Params.ff_pctl_fwy) percentile of corridor travel
+    time in the overnight free-flow period, i.e. the travel time at the free-flow speed percentile.
+
+    Epochs are processed in blocks of columns. Gap filling works on the TMC x epoch block for all TMCs at
+    once, and np.add.reduceat() sums each corridor's consecutive rows, so every corridor is done in the
+    same array operations.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from epoch_calendar import hour_of_week_prd_codes, HRS_PER_WEEK
+from tt_matrix_store import TTMatrixStore
+
+
+def interpolate_gaps(block, max_gap):
+    '''Linearly interpolates runs of up to max_gap NaNs along each row of block, in place. Returns boolean
+    array, True where values were filled. Gaps at the start or end of a row are not filled.'''
+    n_col = block.shape[1]
+    has_val = ~np.isnan(block)
+    cols = np.arange(n_col)
+
+    # column of the last value before and the next value after each position in its row
+    prev_col = np.maximum.accumulate(np.where(has_val, cols, -1), axis=1)
+    next_col = np.minimum.accumulate(np.where(has_val, cols, n_col)[:, ::-1], axis=1)[:, ::-1]
+
+    is_filled = ~has_val & (prev_col >= 0) & (next_col < n_col) & (next_col - prev_col - 1 <= max_gap)
+    rows, fill_cols = np.nonzero(is_filled)
+    col_prev, col_next = prev_col[is_filled], next_col[is_filled]
+    share = (fill_cols - col_prev) / (col_next - col_prev)
+    block[rows, fill_cols] = block[rows, col_prev] + share * (block[rows, col_next] - block[rows, col_prev])
+
+    return is_filled
+
+
+class CorridorReliability():
+    def __init__(self, store_dir, store_name, spec_source, params=None, max_gap_epochs=4, min_obs_share=0.75,
+                 block_epochs=2000, svr_name='SQL-SVR', db_name='NPMRDS'):
+        '''
+        PARAMETERS:
+            store_dir, store_name (string) = matrix store written by tt_matrix_store.write_matrix_store()
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv.
+                Needs tmclinear, direction and road_order columns.
+            params (PPA2Params) = reliability periods, free-flow period and percentiles. Default is PPA2Params()
+            max_gap_epochs (int) = longest run of missing epochs that is interpolated
+            min_obs_share (float) = smallest share of corridor miles with observed data for an epoch to be used
+            block_epochs (int) = epoch columns processed at a time
+        '''
+        self.store = TTMatrixStore(store_dir, store_name)
+        self.params = params if params else PPA2Params()
+        self.max_gap_epochs = max_gap_epochs
+        self.min_obs_share = min_obs_share
+        self.block_epochs = block_epochs
+
+        spec_cols = [ttd.COL_SPEC_TMC, 'road', 'direction', 'miles', 'tmclinear', 'road_order']
+        spec = ttd.load_tmc_spec(spec_source, svr_name, db_name, cols=spec_cols)
+        spec[ttd.COL_SPEC_TMC] = spec[ttd.COL_SPEC_TMC].astype(str)
+        spec = spec.loc[spec['tmclinear'].notnull() & spec[ttd.COL_SPEC_TMC].isin(self.store.tmcs)]
+        spec['direction'] = spec['direction'].fillna('')
+        self.spec = spec.sort_values(['tmclinear', 'direction', 'road_order', ttd.COL_SPEC_TMC]) \
+            .drop_duplicates(ttd.COL_SPEC_TMC).reset_index(drop=True)
+
+        # a new corridor starts wherever tmclinear or direction changes
+        self.tmc_rows = self.store.tmc_rows(self.spec[ttd.COL_SPEC_TMC])
+        corr_keys = self.spec[['tmclinear', 'direction']].values
+        is_first = np.r_[True, (corr_keys[1:] != corr_keys[:-1]).any(axis=1)]
+        self.corr_starts = np.flatnonzero(is_first)
+        self.miles = self.spec['miles'].values.astype(np.float64)
+        self.corr_miles = np.add.reduceat(self.miles, self.corr_starts)
+
+    def block_rows(self, col_start, col_end):
+        '''Travel times of corridor TMCs for epoch columns col_start to col_end, as float64'''
+        matrix = self.store.get(ttd.COL_TT)
+        rows = self.tmc_rows
+        if (np.diff(rows) == 1).all():
+            return np.array(matrix[rows[0]:rows[-1] + 1, col_start:col_end], dtype=np.float64)
+
+        return np.array(matrix[rows, col_start:col_end], dtype=np.float64)
+
+    def how_profiles(self):
+        '''Average travel time of each corridor TMC in each hour of week, shape (number of TMCs, 168)'''
+        how = self.store.calendar.how
+        sums = np.zeros((len(self.tmc_rows), HRS_PER_WEEK))
+        cnts = np.zeros((len(self.tmc_rows), HRS_PER_WEEK))
+        for col_start in range(0, len(how), self.block_epochs):
+            block = self.block_rows(col_start, col_start + self.block_epochs)
+            in_how = (how[col_start:col_start + block.shape[1], None] == np.arange(HRS_PER_WEEK)).astype(np.float64)
+            has_val = ~np.isnan(block)
+            sums += np.where(has_val, block, 0) @ in_how
+            cnts += has_val @ in_how
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return sums / cnts
+
+    def corridor_epochs(self):
+        '''Returns (corridor x epoch array of summed travel times, NaN where epoch is not used; dict of
+        corridor x epoch arrays of miles observed, interpolated and filled from hour-of-week averages)'''
+        how = self.store.calendar.how
+        n_epochs = len(how)
+        profiles = self.how_profiles()
+        margin = self.max_gap_epochs + 1 # so gaps crossing block edges are interpolated the same way
+
+        corr_tt = np.full((len(self.corr_starts), n_epochs), np.nan, dtype=np.float32)
+        fill_miles = {k: np.zeros((len(self.corr_starts), n_epochs), dtype=np.float32)
+                      for k in ['obs', 'interp', 'profile']}
+
+        for col_start in range(0, n_epochs, self.block_epochs):
+            col_end = min(col_start + self.block_epochs, n_epochs)
+            read_start, read_end = max(col_start - margin, 0), min(col_end + margin, n_epochs)
+            block = self.block_rows(read_start, read_end)
+            has_obs = ~np.isnan(block)
+
+            is_interp = interpolate_gaps(block, self.max_gap_epochs) if self.max_gap_epochs else np.zeros_like(has_obs)
+            is_profile = np.isnan(block)
+            block = np.where(is_profile, profiles[:, how[read_start:read_end]], block)
+            is_profile &= ~np.isnan(block)
+
+            inner = slice(col_start - read_start, col_end - read_start)
+            sums = np.add.reduceat(block[:, inner], self.corr_starts, axis=0)
+            for k, is_k in zip(['obs', 'interp', 'profile'], [has_obs, is_interp, is_profile]):
+                k_miles = np.add.reduceat(is_k[:, inner] * self.miles[:, None], self.corr_starts, axis=0)
+                fill_miles[k][:, col_start:col_end] = k_miles
+                if k == 'obs':
+                    is_used = k_miles >= self.min_obs_share * self.corr_miles[:, None]
+
+            corr_tt[:, col_start:col_end] = np.where(is_used, sums, np.nan)
+            print(f"\t{col_end} of {n_epochs} epochs summed...")
+
+        return corr_tt, fill_miles
+
+    def run(self):
+        '''Returns dataframe of reliability metrics for each corridor (tmclinear and direction)'''
+        start_time = time.perf_counter()
+        p = self.params
+        print(f"summing travel times for {len(self.corr_starts)} corridors ({len(self.tmc_rows)} TMCs)...")
+        corr_tt, fill_miles = self.corridor_epochs()
+        is_used = ~np.isnan(corr_tt)
+        prd_codes = hour_of_week_prd_codes(p)[self.store.calendar.how]
+
+        spec_first = self.spec.iloc[self.corr_starts]
+        df_out = pd.DataFrame({'tmclinear': spec_first['tmclinear'].values, 'road': spec_first['road'].values,
+                               'direction': spec_first['direction'].values,
+                               'tmcs': np.diff(np.r_[self.corr_starts, len(self.spec)]),
+                               'miles': self.corr_miles, 'epochs_used': is_used.sum(axis=1)})
+
+        # shares of corridor TMC-miles in used epochs that were interpolated or filled from hour-of-week averages
+        used_miles = (self.corr_miles * df_out['epochs_used'].values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in ['interp', 'profile']:
+                df_out[f"pct_{k}"] = np.where(is_used, fill_miles[k], 0).sum(axis=1) / used_miles
+
+        def period_quantile(prd_code, pctls):
+            prd_tt = corr_tt[:, prd_codes == prd_code].astype(np.float64)
+            out = np.full((len(pctls), len(prd_tt)), np.nan)
+            has_data = ~np.isnan(prd_tt).all(axis=1)
+            if has_data.any():
+                out[:, has_data] = np.nanquantile(prd_tt[has_data], pctls, axis=1)
+            return out, prd_tt, has_data
+
+        ff_tt = period_quantile(len(p.rel_periods) + 1, [1 - p.ff_pctl_fwy])[0][0]
+        df_out['ff_tt'] = ff_tt
+
+        for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+            tt_pctls, prd_tt, has_data = period_quantile(prd_code, [0.5, p.pctl_congested])
+            tt_mean = np.full(len(prd_tt), np.nan)
+            tt_mean[has_data] = np.nanmean(prd_tt[has_data], axis=1)
+
+            df_out[f"tt_p50_{prd_name}"] = tt_pctls[0]
+            df_out[f"tt_p80_{prd_name}"] = tt_pctls[1]
+            df_out[p.lottr_cols[prd_name]] = tt_pctls[1] / tt_pctls[0]
+            df_out[f"tti_{prd_name}"] = tt_mean / ff_tt
+
+        df_out = df_out.fillna(-1)
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"reliability calculated for {len(df_out)} corridors in {elapsed_time}mins")
+
+        return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    store_folder = r"P:\NPMRDS data\MatrixStore"
+    store = 'npmrds_2023_alltmc_paxtruck_comb' # matrix store written by tt_matrix_store.py
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+
+    output_csv = r"P:\NPMRDS data\CMP\corridor_reliability_2023.csv"
+
+    #=================RUN SCRIPT===========================
+    df_corridors = CorridorReliability(store_folder, store, spec_table).run()
+    df_corridors.to_csv(output_csv, index=False)
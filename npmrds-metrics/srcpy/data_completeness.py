@@ -0,0 +1,156 @@
+"""
+Name: data_completeness.py
+Purpose: Data completeness (observed epochs / possible epochs) for each TMC x hour of day, summarized
+    by f_system, data year and hour of day, for any number of years in one run. Python version of
+    data-compare/SQL/test_script/DataCompleteNess_AllVeh_Jan2020v2021.sql, without the recursive calendar
+    CTE, the TMC x hour cross join, or the DATEPART() join to the travel time table:
+        -possible epochs for each hour of day are worked out with arithmetic from the start and end
+            dates and epoch length
+        -observed epochs for each TMC x month x hour of day are counted with bincount, in one pass
+            over each year's travel time data; rows from other years are ignored
+    Unlike the SQL script, which only has rows for TMCs with data, every TMC in the spec table is
+    reported, and TMCs with no data in an hour count as 0% complete for that hour. Averages by f_system
+    will be lower than the SQL script's where some TMCs have no data.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from epoch_calendar import EPOCH_MINS
+
+
+def possible_epochs_hod(start_date, end_date, epoch_mins=EPOCH_MINS):
+    '''Number of possible epochs in each hour of day (array of 24) from start_date (inclusive) to
+    end_date (exclusive). Dates can be strings or datetime64 values; times are rounded down to the hour.'''
+    hr_start = np.datetime64(start_date, 'h').astype(np.int64)
+    n_hours = max(np.datetime64(end_date, 'h').astype(np.int64) - hr_start, 0)
+    first_hod = hr_start % 24
+
+    # every hour of day gets the full days in the range, and the first (n_hours % 24) hours
+    # from first_hod get one more
+    hods_from_first = (np.arange(24) - first_hod) % 24
+    hours_per_hod = n_hours // 24 + (hods_from_first < n_hours % 24)
+
+    return hours_per_hod * (60 // epoch_mins)
+
+
+def possible_epochs_month_hod(data_year, months=range(1, 13), epoch_mins=EPOCH_MINS):
+    '''Array of possible epochs, shape (12, 24), for each month and hour of day. Months not in months are 0.'''
+    poss = np.zeros((12, 24), dtype=np.int64)
+    for month in months:
+        month_start = np.datetime64(f"{data_year}-{month:02d}", 'M')
+        poss[month - 1] = possible_epochs_hod(month_start, month_start + 1, epoch_mins)
+
+    return poss
+
+
+class DataCompleteness():
+    def __init__(self, data_years, months=range(1, 13), nhs_only=False, epoch_mins=EPOCH_MINS,
+                 svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000):
+        '''
+        PARAMETERS:
+            data_years (dict) = {data year: (travel time table or raw CSV, TMC spec table or TMC_Identification.csv)}
+            months (list) = months (1-12) to include, e.g. [1] for January only
+            nhs_only (boolean) = if True, only NHS TMCs are included
+            epoch_mins (int) = epoch length in minutes
+        '''
+        self.data_years = data_years
+        self.months = list(months)
+        self.nhs_only = nhs_only
+        self.epoch_mins = epoch_mins
+        self.svr_name = svr_name
+        self.db_name = db_name
+        self.chunk_rows = chunk_rows
+
+    def observed_epochs(self, tt_source, tmcs, data_year):
+        '''Array of observed epochs, shape (number of TMCs, 12, 24), for each TMC x month x hour of day.
+        Only epochs in data_year are counted.'''
+        tmc_index = pd.Index(tmcs)
+        n_groups = len(tmcs) * 12 * 24
+        obs = np.zeros(n_groups, dtype=np.int64)
+
+        tt_data = ttd.TTData(tt_source, self.svr_name, self.db_name, self.chunk_rows)
+        rows_read = 0
+        for df in tt_data.iter_chunks(cols=[ttd.COL_TMC, ttd.COL_TSTAMP]):
+            tmc_idx = tmc_index.get_indexer(df[ttd.COL_TMC])
+            tstamps = df[ttd.COL_TSTAMP].values
+            year = tstamps.astype('datetime64[Y]').astype(np.int64) + 1970
+            month_idx = tstamps.astype('datetime64[M]').astype(np.int64) % 12
+            hod = tstamps.astype('datetime64[h]').astype(np.int64) % 24
+
+            keep = (tmc_idx >= 0) & (year == data_year)
+            groups = (tmc_idx[keep].astype(np.int64) * 12 + month_idx[keep]) * 24 + hod[keep]
+            obs += np.bincount(groups, minlength=n_groups)
+
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+        return obs.reshape(len(tmcs), 12, 24)
+
+    def year_completeness(self, data_year, tt_source, spec_source):
+        '''Returns dataframe with possible and observed epochs and completeness for each TMC x hour of day'''
+        spec = ttd.load_tmc_spec(spec_source, self.svr_name, self.db_name,
+                                 cols=[ttd.COL_SPEC_TMC, 'road', 'f_system', 'nhs'])
+        if self.nhs_only:
+            spec = spec.loc[spec['nhs'] == 1]
+
+        month_mask = np.isin(np.arange(1, 13), self.months)
+        poss = possible_epochs_month_hod(data_year, self.months, self.epoch_mins).sum(axis=0)
+
+        print(f"counting observed epochs in {tt_source}...")
+        obs = self.observed_epochs(tt_source, spec[ttd.COL_SPEC_TMC].values, data_year)
+        obs = obs[:, month_mask, :].sum(axis=1)
+
+        n_tmc = len(spec)
+        df_out = pd.DataFrame({ttd.COL_SPEC_TMC: np.repeat(spec[ttd.COL_SPEC_TMC].values, 24),
+                               'road': np.repeat(spec['road'].values, 24),
+                               'f_system': np.repeat(spec['f_system'].values, 24),
+                               'data_year': data_year,
+                               'hour_of_day': np.tile(np.arange(24), n_tmc),
+                               'poss_epochs_hod': np.tile(poss, n_tmc),
+                               'obs_epochs': obs.ravel()})
+        df_out['data_compl_pct'] = df_out['obs_epochs'] / df_out['poss_epochs_hod']
+
+        return df_out
+
+    def run(self):
+        '''Returns (TMC x hour of day completeness dataframe, pivot of average completeness with a row for each
+        f_system and data year and a column for each hour of day)'''
+        start_time = time.perf_counter()
+
+        df_tmc_hr = pd.concat([self.year_completeness(data_year, tt_source, spec_source)
+                               for data_year, (tt_source, spec_source) in self.data_years.items()],
+                              ignore_index=True)
+        df_pivot = df_tmc_hr.pivot_table(index=['f_system', 'data_year'], columns='hour_of_day',
+                                         values='data_compl_pct', aggfunc='mean').reset_index()
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"data completeness calculated for {len(self.data_years)} years in {elapsed_time}mins")
+
+        return df_tmc_hr, df_pivot
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    # {data year: (travel time table or raw CSV, TMC spec table or TMC_Identification.csv)}
+    years_to_check = {2020: ('npmrds_2020_alltmc_paxtruck_comb', 'npmrds_2020_alltmc_txt'),
+                      2021: ('npmrds_2021_alltmc_paxtruck_comb', 'npmrds_2021_alltmc_txt')}
+    months_to_check = [1] # e.g. [1] for January only; range(1, 13) for full year
+    nhs_tmcs_only = True
+
+    output_csv_pivot = r"P:\NPMRDS data\DataCompleteness\completeness_x_fsys_hod.csv"
+
+    #=================RUN SCRIPT===========================
+    df_tmcs, df_fsys_hod = DataCompleteness(years_to_check, months_to_check, nhs_tmcs_only).run()
+    df_fsys_hod.to_csv(output_csv_pivot, index=False)
+    print(df_fsys_hod)
@@ -0,0 +1,173 @@
+"""
+Name: epoch_calendar.py
+Purpose: Calendar of every epoch (15-minute period) in a year, giving integer codes for each epoch's
+    day of week, hour, hour of week, PPA2 period and holiday status.
+
+    In SQL, the calendar table is joined to travel time tables on an integer epoch ID, instead of
+    running DATENAME()/DATEPART() on every row, which is slow, can't use indexes, and relies on English
+    day names. Epoch ID is minutes since 12am Jan 1 divided by epoch length, so for a travel time row:
+        epoch_id = DATEDIFF(mi, '<year>-01-01', measurement_tstamp) / 15
+    In python, the same epoch ID is an index into the calendar's arrays, so engines get each epoch's
+    period with one array lookup (see EpochCalendar.epoch_index()).
+
+    Period codes: 1, 2, ... for reliability periods in PPA2Params.rel_periods (in order), the next code
+    for the overnight free-flow period, 0 for all other hours.
+
+    Holidays are US federal holidays, from pandas' holiday calendar. They are flagged but keep their
+    normal period codes, as in PPA2_NPMRDS_metrics_latest.sql.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+import tt_data as ttd
+
+
+EPOCH_MINS = 15
+HRS_PER_WEEK = 168
+
+
+def hour_of_week(tstamps):
+    '''Hour of week (0 = Monday 12am-1am, 167 = Sunday 11pm-12am) for array of datetime64 values'''
+    hrs = tstamps.astype('datetime64[h]').astype(np.int64)
+    day_of_week = (hrs // 24 + 3) % 7 # 1/1/1970 was a Thursday; Monday = 0
+    return (day_of_week * 24 + hrs % 24).astype(np.uint8)
+
+
+def hours_of_week(days, hr_start, hr_end):
+    '''List of hours of week for the given days of week (Monday = 0), from hr_start (>=) to hr_end (<).
+    If hr_end is less than hr_start, period wraps past midnight (e.g. 20 to 6 for overnight).'''
+    if hr_end > hr_start:
+        hrs = range(hr_start, hr_end)
+    else:
+        hrs = list(range(hr_start, 24)) + list(range(0, hr_end))
+
+    return [day * 24 + hr for day in days for hr in hrs]
+
+
+def hour_of_week_prd_codes(params):
+    '''Array giving the period code for each hour of the week. The free-flow period cannot overlap a
+    reliability period, since each hour can only have one code.
+    PARAMETERS:
+        params (PPA2Params) = gives reliability periods and free-flow period hours
+    '''
+    lookup = params.hour_of_week_periods()
+    prd_code_ff = len(params.rel_periods) + 1
+
+    hrs = np.arange(HRS_PER_WEEK) % 24
+    is_night = (hrs >= params.ff_prd_start) | (hrs < params.ff_prd_end)
+    if (lookup[is_night] > 0).any():
+        raise Exception("Free-flow period overlaps one or more reliability periods. Each hour " \
+                        "of the week can only be in one period.")
+    lookup[is_night] = prd_code_ff
+
+    return lookup
+
+
+class EpochCalendar():
+    def __init__(self, data_year, params, epoch_mins=EPOCH_MINS):
+        '''
+        PARAMETERS:
+            data_year (int) = year to make calendar for
+            params (PPA2Params) = gives period definitions
+            epoch_mins (int) = length of each epoch in minutes
+        '''
+        self.data_year = data_year
+        self.params = params
+        self.epoch_mins = epoch_mins
+        self.prd_code_ff = len(params.rel_periods) + 1
+
+        self.start = np.datetime64(f"{data_year}-01-01T00:00", 'm')
+        end = np.datetime64(f"{data_year + 1}-01-01T00:00", 'm')
+        epoch_starts = np.arange(self.start, end, np.timedelta64(epoch_mins, 'm'))
+
+        # lookup arrays, indexed by epoch ID
+        self.how = hour_of_week(epoch_starts)
+        self.prd_code = hour_of_week_prd_codes(params)[self.how]
+
+        dates = epoch_starts.astype('datetime64[D]')
+        holidays = USFederalHolidayCalendar().holidays(start=f"{data_year}-01-01", end=f"{data_year}-12-31",
+                                                       return_name=True)
+        self.is_holiday = np.isin(dates, holidays.index.values.astype('datetime64[D]'))
+        self.holiday_names = pd.Series(dates).map(pd.Series(holidays.values, index=holidays.index.values
+                                                            .astype('datetime64[D]'))).values
+
+        self.epoch_starts = epoch_starts
+
+    @classmethod
+    def for_tstamps(cls, tstamps, params, epoch_mins=EPOCH_MINS):
+        '''Calendar for the year of the earliest timestamp in tstamps'''
+        data_year = int(str(np.min(tstamps).astype('datetime64[Y]')))
+        return cls(data_year, params, epoch_mins)
+
+    def epoch_index(self, tstamps):
+        '''Epoch ID (index into the calendar arrays) of each datetime64 value in tstamps'''
+        epoch_idx = (tstamps.astype('datetime64[m]') - self.start).astype(np.int64) // self.epoch_mins
+        if len(epoch_idx) > 0 and (epoch_idx.min() < 0 or epoch_idx.max() >= len(self.epoch_starts)):
+            raise Exception(f"Timestamps found outside of calendar year {self.data_year}. Use a calendar " \
+                            "for each year of data.")
+
+        return epoch_idx
+
+    def to_df(self):
+        '''Returns calendar as a dataframe, one row per epoch'''
+        return pd.DataFrame({'epoch_id': np.arange(len(self.epoch_starts)),
+                             'epoch_start': self.epoch_starts,
+                             'dow': self.how // 24,
+                             'hr': self.how % 24,
+                             'hour_of_week': self.how,
+                             'prd_code': self.prd_code,
+                             'is_weekday': np.isin(self.how // 24, self.params.weekdays).astype(int),
+                             'is_holiday': self.is_holiday.astype(int),
+                             'holiday_name': self.holiday_names})
+
+    def to_sql_table(self, tbl_name, svr_name='SQL-SVR', db_name='NPMRDS'):
+        '''Creates calendar table in SQL Server, replacing it if it already exists. Epoch ID is the
+        clustered primary key.'''
+        df = self.to_df()
+        df['epoch_start'] = df['epoch_start'].dt.to_pydatetime()
+        df['holiday_name'] = df['holiday_name'].where(df['holiday_name'].notnull(), None)
+
+        sql_create = f"""IF OBJECT_ID('{tbl_name}', 'U') IS NOT NULL DROP TABLE {tbl_name};
+            CREATE TABLE {tbl_name} (
+                epoch_id int NOT NULL PRIMARY KEY CLUSTERED,
+                epoch_start datetime NOT NULL,
+                dow tinyint NOT NULL, --0 = Monday
+                hr tinyint NOT NULL,
+                hour_of_week tinyint NOT NULL,
+                prd_code tinyint NOT NULL,
+                is_weekday bit NOT NULL,
+                is_holiday bit NOT NULL,
+                holiday_name varchar(50)
+                )"""
+        sql_insert = f"INSERT INTO {tbl_name} VALUES ({', '.join(['?'] * len(df.columns))})"
+
+        # ttd.conn_str() uses the "SQL Server" driver, which does not support fast_executemany; a year is
+        # only ~35,000 rows, so a plain executemany() is fine
+        import pyodbc
+        with pyodbc.connect(ttd.conn_str(svr_name, db_name)) as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql_create)
+            cursor.executemany(sql_insert, df.astype(object).values.tolist())
+            conn.commit()
+
+        print(f"created calendar table {tbl_name} with {len(df)} epochs")
+
+
+if __name__ == '__main__':
+    from ppa2_metrics import PPA2Params
+
+    #================INPUT PARAMETERS======================
+    year = 2023
+    calendar_tbl = f"npmrds_calendar_{year}"
+
+    #=================RUN SCRIPT===========================
+    EpochCalendar(year, PPA2Params()).to_sql_table(calendar_tbl)
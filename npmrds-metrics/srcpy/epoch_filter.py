@@ -0,0 +1,158 @@
+"""
+Name: epoch_filter.py
+Purpose: Drops low-confidence and implausible epochs before percentiles are calculated, e.g. by
+    ppa2_metrics.py (PPA2Metrics(epoch_filter=EpochFilter())). Without it, every epoch goes into the
+    percentiles whatever its data_density, and noisy speeds are why congratio_worst4hrs has to be
+    capped at 1. Filters, each of which can be turned off:
+        -data_density below min_density (A = 1-4 probe vehicles, B = 5-9, C = 10 or more)
+        -speed outside min_speed-max_speed
+        -travel time that does not match the TMC's miles / speed by more than tt_speed_tol (share)
+        -speed with a robust z-score more than max_rolling_z from the other epochs around it on the same
+            TMC: (speed - rolling median) / (1.4826 x rolling median absolute deviation), over the
+            rolling_epochs epochs on each side in time order. The MAD is at least min_rolling_mad mph,
+            so steady free-flow speeds do not make every small change look like an outlier.
+    The first three filters work on each chunk of travel time data as it is read. The rolling filter
+    needs each TMC's whole series in time order, so it works on the epochs kept from all chunks, in
+    blocks of rows to limit memory use.
+
+    Epochs dropped by each filter are counted for each TMC (drop_report()).
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+
+
+DENSITY_RANKS = {'A': 1, 'B': 2, 'C': 3} # missing data_density ranks 0
+MAD_SCALE = 1.4826
+FILTER_NAMES = ['density', 'speed_range', 'tt_speed', 'rolling_z']
+
+
+class EpochFilter():
+    def __init__(self, min_density=None, min_speed=1, max_speed=100, tt_speed_tol=0.1, rolling_epochs=4,
+                 max_rolling_z=5, min_rolling_mad=2, block_rows=1000000):
+        '''
+        PARAMETERS (set any filter's parameter to None to turn it off):
+            min_density (string) = lowest data_density kept, 'A', 'B' or 'C'
+            min_speed, max_speed (float) = range of speeds kept, mph
+            tt_speed_tol (float) = largest share travel time can differ from miles / speed
+            rolling_epochs (int) = epochs on each side of an epoch used for its rolling median
+            max_rolling_z (float) = largest robust z-score kept
+            min_rolling_mad (float) = smallest rolling median absolute deviation used, mph
+            block_rows (int) = epochs processed at a time by the rolling filter
+        '''
+        self.min_density = min_density
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.tt_speed_tol = tt_speed_tol
+        self.rolling_epochs = rolling_epochs
+        self.max_rolling_z = max_rolling_z
+        self.min_rolling_mad = min_rolling_mad
+        self.block_rows = block_rows
+
+        self.tmcs = None
+        self.dropped = {}
+
+    def settings(self):
+        '''Dict of filter parameters, without drop counts from the last run (e.g. for metrics_cache.py)'''
+        return {k: v for k, v in vars(self).items() if k not in ['tmcs', 'dropped']}
+
+    def start(self, tmcs):
+        '''Resets drop counts for a new run over the TMCs in tmcs (spec table order)'''
+        self.tmcs = pd.Index(tmcs)
+        self.dropped = {name: np.zeros(len(tmcs), dtype=np.int64) for name in FILTER_NAMES}
+
+    def chunk_cols(self):
+        '''Travel time columns needed by chunk_mask(), besides TMC, timestamp, speed and travel time'''
+        return [ttd.COL_DENSITY] if self.min_density else []
+
+    def count_drops(self, name, tmc_idx, is_dropped):
+        '''Adds rows where is_dropped is True to filter name's drop count for their TMC'''
+        self.dropped[name] += np.bincount(tmc_idx[is_dropped], minlength=len(self.tmcs))
+
+    def chunk_mask(self, df, tmc_idx, miles):
+        '''Returns boolean array, True for each row of a travel time chunk to keep. Each dropped row is counted
+        under the first filter that drops it.
+        PARAMETERS:
+            df (dataframe) = chunk of travel time data, only rows for TMCs in spec table
+            tmc_idx (array) = row number in spec table of each row's TMC
+            miles (array) = miles of each TMC in spec table
+        '''
+        keep = np.ones(len(df), dtype=bool)
+        speed = df[ttd.COL_SPEED].values
+        tt = df[ttd.COL_TT].values
+
+        if self.min_density:
+            density_rank = df[ttd.COL_DENSITY].map(DENSITY_RANKS).fillna(0).values
+            is_dropped = keep & (density_rank < DENSITY_RANKS[self.min_density])
+            self.count_drops('density', tmc_idx, is_dropped)
+            keep &= ~is_dropped
+
+        if self.min_speed is not None or self.max_speed is not None:
+            lo = self.min_speed if self.min_speed is not None else -np.inf
+            hi = self.max_speed if self.max_speed is not None else np.inf
+            is_dropped = keep & ~((speed >= lo) & (speed <= hi))
+            self.count_drops('speed_range', tmc_idx, is_dropped)
+            keep &= ~is_dropped
+
+        if self.tt_speed_tol is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                tt_from_speed = miles[tmc_idx] / speed * 3600
+                is_dropped = keep & ~(np.abs(tt / tt_from_speed - 1) <= self.tt_speed_tol)
+            self.count_drops('tt_speed', tmc_idx, is_dropped)
+            keep &= ~is_dropped
+
+        return keep
+
+    def rolling_mask(self, tmc_idx, epoch_idx, speed):
+        '''Returns boolean array, True for each epoch to keep after the rolling robust z-score filter. Epochs
+        are put in TMC and time order; each epoch's window is the rolling_epochs epochs on each side of it
+        on the same TMC (fewer at the ends of the series).'''
+        keep = np.ones(len(speed), dtype=bool)
+        if self.max_rolling_z is None or len(speed) == 0:
+            return keep
+
+        order = np.lexsort((epoch_idx, tmc_idx))
+        tmc_sorted = tmc_idx[order]
+        spd_sorted = speed[order].astype(np.float64)
+
+        # first and last position of each epoch's TMC in the sorted arrays, so windows do not cross TMCs
+        is_new_tmc = np.r_[True, tmc_sorted[1:] != tmc_sorted[:-1]]
+        grp_start = np.maximum.accumulate(np.where(is_new_tmc, np.arange(len(order)), 0))
+        is_last = np.r_[tmc_sorted[1:] != tmc_sorted[:-1], True]
+        grp_end = np.minimum.accumulate(np.where(is_last, np.arange(len(order)), len(order))[::-1])[::-1]
+
+        offsets = np.arange(-self.rolling_epochs, self.rolling_epochs + 1)
+        is_outlier = np.zeros(len(order), dtype=bool)
+        for row_start in range(0, len(order), self.block_rows):
+            pos = np.arange(row_start, min(row_start + self.block_rows, len(order)))
+            win_pos = pos[:, None] + offsets[None, :]
+            in_grp = (win_pos >= grp_start[pos, None]) & (win_pos <= grp_end[pos, None])
+            window = np.where(in_grp, spd_sorted[np.clip(win_pos, 0, len(order) - 1)], np.nan)
+
+            med = np.nanmedian(window, axis=1)
+            mad = np.nanmedian(np.abs(window - med[:, None]), axis=1) * MAD_SCALE
+            mad = np.maximum(mad, self.min_rolling_mad) if self.min_rolling_mad else np.where(mad > 0, mad, np.nan)
+            is_outlier[pos] = np.abs(spd_sorted[pos] - med) / mad > self.max_rolling_z
+
+        keep[order] = ~is_outlier
+        self.count_drops('rolling_z', tmc_idx, ~keep)
+
+        return keep
+
+    def drop_report(self):
+        '''Dataframe of epochs dropped by each filter, and in total, for each TMC'''
+        df_out = pd.DataFrame({ttd.COL_SPEC_TMC: self.tmcs})
+        for name in FILTER_NAMES:
+            df_out[f"dropped_{name}"] = self.dropped[name]
+        df_out['dropped_total'] = df_out[[f"dropped_{name}" for name in FILTER_NAMES]].sum(axis=1)
+
+        return df_out
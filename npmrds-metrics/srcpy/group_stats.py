@@ -0,0 +1,59 @@
+"""
+Name: group_stats.py
+Purpose: Vectorized statistics over many groups at once (e.g. every TMC x time period),
+    for use by the metrics engines in this folder. Groups are given as integer IDs
+    from 0 to n_groups - 1, so results come back as dense arrays indexed by group ID.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import numpy as np
+
+
+def grouped_percentiles(group_ids, values, n_groups, pctls):
+    '''Percentile of values within each group, using linear interpolation between the
+    closest ranks. This is the same method as SQL Server's PERCENTILE_CONT and numpy's
+    default percentile method. NaN values are ignored, like NULLs in PERCENTILE_CONT.
+
+    PARAMETERS:
+        group_ids (int array) = group ID, 0 to n_groups - 1, for each value
+        values (float array) = values to get percentiles of
+        n_groups (int) = number of groups
+        pctls (list) = percentiles to get, as fractions (e.g. 0.8 for 80th percentile)
+
+    Returns array of shape (len(pctls), n_groups). Groups with no values are NaN.
+    '''
+    valid = ~np.isnan(values)
+    group_ids = group_ids[valid]
+    values = values[valid]
+
+    # one sort puts every group's values together and in order
+    order = np.lexsort((values, group_ids))
+    vals_sorted = values[order].astype(np.float64)
+
+    counts = np.bincount(group_ids, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    has_data = counts > 0
+    n = counts[has_data]
+    start = starts[has_data]
+
+    out = np.full((len(pctls), n_groups), np.nan)
+    for i, pctl in enumerate(pctls):
+        pos = pctl * (n - 1)
+        pos_lo = np.floor(pos).astype(np.int64)
+        pos_hi = np.ceil(pos).astype(np.int64)
+        val_lo = vals_sorted[start + pos_lo]
+        val_hi = vals_sorted[start + pos_hi]
+        out[i, has_data] = val_lo + (pos - pos_lo) * (val_hi - val_lo)
+
+    return out
+
+
+def grouped_counts(group_ids, n_groups):
+    '''Number of values in each group'''
+    return np.bincount(group_ids, minlength=n_groups)
@@ -0,0 +1,235 @@
+"""
+Name: how_cube.py
+Purpose: Precomputed hour-of-week cube of travel time and speed distributions for each TMC, built
+    in one pass over a year of travel time data. Once built, PPA2 metrics and ad hoc period
+    questions (e.g. "80th percentile travel time on weekdays 7am-9am", "harmonic average speed
+    in the slowest hour") come from the cube in well under a second instead of a scan of the
+    travel time table.
+
+    For each TMC x hour of week (168 hours, 0 = Monday 12am-1am), the cube holds:
+        -histograms of travel time and speed, using the log-spaced bins of quantile_sketch.py.
+            Percentiles for any set of hours are within SKETCH_ALPHA (0.5%) of the exact values;
+            see quantile_sketch.py for error bounds.
+        -exact counts of epochs, and exact counts and sums of 1/speed of epochs with speed > 0,
+            for harmonic average speeds
+    Only non-empty histogram bins are stored, and the cube is saved as one compressed .npz file.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from congestion_hours import worst_hours
+from epoch_calendar import EpochCalendar, HRS_PER_WEEK, hours_of_week
+from quantile_sketch import SketchSet, SKETCH_ALPHA, SKETCH_MEASURES, value_bins, sum_bins
+
+
+class HOWCube():
+    def __init__(self, sketches, epochs, spd_cnt, inv_spd_sum):
+        '''Usually made with build_how_cube() or HOWCube.load().
+        PARAMETERS:
+            sketches (SketchSet) = travel time and speed histograms, with hour of week as period code
+            epochs (array) = epochs for each TMC x hour of week, shape (number of TMCs, 168)
+            spd_cnt (array) = epochs with speed > 0, same shape as epochs
+            inv_spd_sum (array) = sum of 1/speed for epochs with speed > 0, same shape as epochs
+        '''
+        self.sketches = sketches
+        self.tmcs = sketches.tmcs
+        self.epochs = epochs
+        self.spd_cnt = spd_cnt
+        self.inv_spd_sum = inv_spd_sum
+
+    def save(self, out_path):
+        arrays = {'tmcs': self.tmcs, 'alpha': self.sketches.alpha, 'epochs': self.epochs,
+                  'spd_cnt': self.spd_cnt, 'inv_spd_sum': self.inv_spd_sum}
+        for measure, (groups, bin_nums, counts) in self.sketches.bins.items():
+            arrays.update({f"{measure}_groups": groups, f"{measure}_bins": bin_nums, f"{measure}_counts": counts})
+
+        np.savez_compressed(out_path, **arrays)
+
+    @classmethod
+    def load(cls, cube_path):
+        with np.load(cube_path) as f_in:
+            bins = {measure: (f_in[f"{measure}_groups"], f_in[f"{measure}_bins"], f_in[f"{measure}_counts"])
+                    for measure in SKETCH_MEASURES}
+            sketches = SketchSet(f_in['tmcs'], HRS_PER_WEEK, bins, float(f_in['alpha']))
+            return cls(sketches, f_in['epochs'], f_in['spd_cnt'], f_in['inv_spd_sum'])
+
+    def period_stats(self, days, hr_start, hr_end, pctls=[0.5, 0.8]):
+        '''Returns dataframe with, for each TMC, the epoch count, travel time and speed percentiles, and
+        harmonic average speed for a period.
+        PARAMETERS:
+            days (list) = days of week in period, Monday = 0
+            hr_start (int) = period starts at or after this hour
+            hr_end (int) = period ends before this hour. Can be less than hr_start for overnight periods.
+            pctls (list) = percentiles to get, as fractions
+        '''
+        hows = hours_of_week(days, hr_start, hr_end)
+
+        df_out = pd.DataFrame({ttd.COL_SPEC_TMC: self.tmcs, 'epochs': self.epochs[:, hows].sum(axis=1)})
+        for measure in SKETCH_MEASURES:
+            measure_pctls = self.sketches.percentiles(measure, pctls, prd_codes=hows)
+            for pctl, vals in zip(pctls, measure_pctls):
+                df_out[f"{measure}_p{int(round(pctl * 100))}"] = vals
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df_out['havg_spd'] = self.spd_cnt[:, hows].sum(axis=1) / self.inv_spd_sum[:, hows].sum(axis=1)
+
+        return df_out
+
+    def ppa2_metrics(self, spec, params=None):
+        '''Returns dataframe with the same columns as PPA2Metrics.run(), for each TMC in spec. Epoch counts,
+        worst hours and slowest hours are exact; percentiles are within the sketch error bounds.
+        PARAMETERS:
+            spec (dataframe) = TMC spec data, with tmc and f_system columns (see tt_data.load_tmc_spec)
+            params (PPA2Params) = metric parameters. Default is PPA2Params()
+        '''
+        p = params if params else PPA2Params()
+
+        df_out = spec.copy()
+        tmc_pos = pd.Index(self.tmcs).get_indexer(df_out[ttd.COL_SPEC_TMC].astype(str))
+        in_cube = tmc_pos >= 0
+
+        def by_spec_tmc(arr):
+            out = np.full(len(df_out), np.nan)
+            out[in_cube] = arr[tmc_pos[in_cube]]
+            return out
+
+        #---------travel time percentiles and LOTTRs---------
+        prd_pctls = {}
+        for prd_name, (hr_start, hr_end, days) in p.rel_periods.items():
+            hows = hours_of_week(days, hr_start, hr_end)
+            prd_pctls[prd_name] = self.sketches.percentiles('tt', [p.pctl_congested, 0.5], prd_codes=hows)
+            df_out[f"tt_p80_{prd_name}"] = by_spec_tmc(prd_pctls[prd_name][0])
+            df_out[f"tt_p50_{prd_name}"] = by_spec_tmc(prd_pctls[prd_name][1])
+
+        for prd_name, tt_pctls in prd_pctls.items():
+            df_out[p.lottr_cols[prd_name]] = by_spec_tmc(tt_pctls[0] / tt_pctls[1])
+
+        #---------free-flow speeds---------
+        hows_night = hours_of_week(range(7), p.ff_prd_start, p.ff_prd_end)
+        ff_pctls = [p.ff_pctl_fwy] + list(p.ff_pctls_art.values())
+        ff_spds = self.sketches.percentiles('speed', ff_pctls, prd_codes=hows_night)
+
+        is_fwy = df_out['f_system'].isin(p.fwy_fsystems).values
+        for i, ff_col in enumerate(p.ff_pctls_art, start=1):
+            df_out[ff_col] = np.where(is_fwy, by_spec_tmc(ff_spds[0]), by_spec_tmc(ff_spds[i]))
+        ff_speed = df_out[p.ff_col_congratio].values
+
+        #---------worst hours, from weekday hours of week folded into hours of day---------
+        hows_wkdy = hours_of_week(p.weekdays, 0, 24)
+        cnt_hr = np.zeros((len(df_out), 24))
+        inv_spd_hr = np.zeros((len(df_out), 24))
+        cnt_hr[in_cube] = self.spd_cnt[tmc_pos[in_cube]][:, hows_wkdy].reshape(-1, len(p.weekdays), 24).sum(axis=1)
+        inv_spd_hr[in_cube] = self.inv_spd_sum[tmc_pos[in_cube]][:, hows_wkdy].reshape(-1, len(p.weekdays), 24).sum(axis=1)
+        worst = worst_hours(cnt_hr, inv_spd_hr, ff_speed, p)
+
+        df_out['havg_spd_worst4hrs'] = worst['havg_spd_worst4hrs']
+        # overnight speed can be slower than worst-hour speed if there are few overnight data
+        df_out['congratio_worst4hrs'] = np.minimum(worst['havg_spd_worst4hrs'] / ff_speed, 1.0)
+        df_out['slowest_hr'] = worst['slowest_hr']
+        df_out['slowest_hr_speed'] = worst['slowest_hr_speed']
+        df_out['congratio_worsthr'] = worst['slowest_hr_speed'] / ff_speed
+
+        #---------epoch counts---------
+        has_data = by_spec_tmc(self.epochs.sum(axis=1)) > 0
+        for prd_name, (hr_start, hr_end, days) in p.rel_periods.items():
+            prd_epochs = by_spec_tmc(self.epochs[:, hours_of_week(days, hr_start, hr_end)].sum(axis=1))
+            df_out[f"epochs_{prd_name}"] = np.where(has_data, prd_epochs, np.nan)
+        df_out['epochs_worst4hrs'] = worst['epochs_worst4hrs']
+        df_out['epochs_slowest_hr'] = worst['epochs_slowest_hr']
+        epochs_night = by_spec_tmc(self.epochs[:, hows_night].sum(axis=1))
+        df_out['epochs_night'] = np.where(epochs_night > 0, epochs_night, np.nan)
+
+        df_out = df_out.fillna(-1)
+        int_cols = ['slowest_hr'] + [c for c in df_out.columns if c.startswith('epochs_')]
+        df_out[int_cols] = df_out[int_cols].astype(int)
+
+        return df_out
+
+
+def build_how_cube(tt_source, alpha=SKETCH_ALPHA, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000,
+                   calendar=None):
+    '''Reads travel time data once and returns HOWCube.
+    PARAMETERS:
+        tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+        alpha (float) = relative error of percentiles
+        calendar (EpochCalendar) = gives each epoch's hour of week. Default is a calendar for the year
+            of the first travel time rows read.
+    '''
+    start_time = time.perf_counter()
+    tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+
+    tmcs = pd.Index([])
+    bin_parts = {measure: [] for measure in SKETCH_MEASURES}
+    epochs = np.zeros(0, dtype=np.int64)
+    spd_cnt = np.zeros(0, dtype=np.int64)
+    inv_spd_sum = np.zeros(0, dtype=np.float64)
+
+    print(f"reading travel time data from {tt_source}...")
+    rows_read = 0
+    for df in tt_data.iter_chunks():
+        # TMCs get their position in the order they are first seen
+        tmcs = tmcs.append(pd.Index(df[ttd.COL_TMC].unique()).difference(tmcs))
+        if calendar is None:
+            calendar = EpochCalendar.for_tstamps(df[ttd.COL_TSTAMP].values, PPA2Params())
+        n_groups = len(tmcs) * HRS_PER_WEEK
+        groups = tmcs.get_indexer(df[ttd.COL_TMC]).astype(np.int64) * HRS_PER_WEEK \
+            + calendar.how[calendar.epoch_index(df[ttd.COL_TSTAMP].values)]
+
+        for measure, col in SKETCH_MEASURES.items():
+            values = df[col].values
+            has_val = ~np.isnan(values)
+            bin_parts[measure].append(sum_bins(groups[has_val], value_bins(values[has_val], alpha),
+                                               np.ones(has_val.sum())))
+
+        speed = df[ttd.COL_SPEED].values.astype(np.float64)
+        has_spd = speed > 0
+        epochs = np.pad(epochs, (0, n_groups - len(epochs))) + np.bincount(groups, minlength=n_groups)
+        spd_cnt = np.pad(spd_cnt, (0, n_groups - len(spd_cnt))) + np.bincount(groups[has_spd], minlength=n_groups)
+        inv_spd_sum = np.pad(inv_spd_sum, (0, n_groups - len(inv_spd_sum))) \
+            + np.bincount(groups[has_spd], weights=1 / speed[has_spd], minlength=n_groups)
+
+        rows_read += len(df)
+        print(f"\t{rows_read} rows read...")
+
+    bins = {measure: tuple(np.concatenate(arrays) for arrays in zip(*parts)) for measure, parts in bin_parts.items()}
+    sketches = SketchSet(tmcs.values, HRS_PER_WEEK, bins, alpha)
+    cube = HOWCube(sketches, epochs.reshape(-1, HRS_PER_WEEK), spd_cnt.reshape(-1, HRS_PER_WEEK),
+                   inv_spd_sum.reshape(-1, HRS_PER_WEEK))
+
+    elapsed_time = round((time.perf_counter() - start_time)/60,1)
+    print(f"hour-of-week cube built for {len(tmcs)} TMCs in {elapsed_time}mins")
+
+    return cube
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    cube_file = r"P:\NPMRDS data\Cubes\npmrds_2023_alltmc_paxtruck_comb_howcube.npz"
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_cube_metrics_2023.csv"
+
+    build_cube = True # if False, loads cube_file instead of building it
+
+    #=================RUN SCRIPT===========================
+    if build_cube:
+        build_how_cube(tt_table).save(cube_file)
+
+    cube = HOWCube.load(cube_file)
+    df_spec = ttd.load_tmc_spec(spec_table, cols=[ttd.COL_SPEC_TMC, 'road', 'route_numb', 'f_system', 'nhs', 'miles'])
+    cube.ppa2_metrics(df_spec).to_csv(output_csv, index=False)
+
+    # example ad hoc query: weekday 7am-9am travel time percentiles
+    # df_am = cube.period_stats(days=[0, 1, 2, 3, 4], hr_start=7, hr_end=9, pctls=[0.5, 0.8, 0.95])
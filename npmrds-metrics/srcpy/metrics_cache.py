@@ -0,0 +1,144 @@
+"""
+Name: metrics_cache.py
+Purpose: Cache of metrics results, so that re-running PPA2 (or any other engine in this folder) on
+    data and parameters that have not changed returns the saved result right away.
+
+    Each cached result is keyed on:
+        -the version of each data source it was made from. For SQL Server tables, this is the table's
+            object_id and create_date (from sys.objects, which change when a reload is published with
+            the side-table rename swap) plus its row count (from sys.partitions). Both come from catalog
+            views, so no table is scanned. For CSVs, it is the file size and last-modified time.
+        -a hash of the engine's parameters (e.g. every attribute of PPA2Params: @PctlCongested,
+            period boundaries, @FFprdStart, etc.), plus any other settings that change the result, such
+            as the EpochFilter parameters (epoch_filter.py)
+    Appending a month of data to a travel time table changes its row count, and publishing a reloaded table
+    changes its object_id, so the old result is no longer used, and is deleted the next time the result
+    is saved.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import glob
+import json
+import hashlib
+
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Metrics, PPA2Params
+
+
+CACHE_EXT = '.pkl'
+
+
+def hash_str(obj):
+    '''Short hash of any object that can be written to JSON'''
+    str_obj = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha256(str_obj.encode()).hexdigest()[:16]
+
+
+class MetricsCache():
+    def __init__(self, cache_dir, svr_name='SQL-SVR', db_name='NPMRDS'):
+        '''
+        PARAMETERS:
+            cache_dir (string) = folder to save cached results in
+            svr_name (string) = SQL Server instance, for data sources that are SQL Server tables
+            db_name (string) = SQL Server database, for data sources that are SQL Server tables
+        '''
+        self.cache_dir = cache_dir
+        self.svr_name = svr_name
+        self.db_name = db_name
+
+    def source_version(self, data_source):
+        '''Returns dict describing the current version of a data source (SQL Server table or CSV)'''
+        if ttd.is_csv(data_source):
+            return {'source': data_source, 'bytes': os.path.getsize(data_source),
+                    'modified': os.path.getmtime(data_source)}
+
+        # object_id and create_date change when a reload is published by renaming a new table into place
+        sql_version = f"""SELECT o.object_id, o.create_date, SUM(p.rows)
+            FROM sys.objects o JOIN sys.partitions p ON p.object_id = o.object_id AND p.index_id IN (0, 1)
+            WHERE o.object_id = OBJECT_ID('{data_source}')
+            GROUP BY o.object_id, o.create_date"""
+
+        import pyodbc
+        with pyodbc.connect(ttd.conn_str(self.svr_name, self.db_name)) as conn:
+            row = conn.cursor().execute(sql_version).fetchone()
+        if row is None:
+            raise Exception(f"Table {data_source} not found in {self.db_name}.")
+
+        return {'source': data_source, 'object_id': row[0], 'created': row[1], 'rows': row[2]}
+
+    def cache_paths(self, engine_name, data_sources, params, run_settings=None):
+        '''Returns (path of cache file for current data versions, glob pattern matching every version)'''
+        run_keys = [engine_name, list(data_sources), vars(params)]
+        if run_settings:
+            run_keys.append(run_settings)
+        run_hash = hash_str(run_keys)
+        version_hash = hash_str([self.source_version(s) for s in data_sources])
+        file_prefix = f"{engine_name}_{run_hash}"
+
+        return os.path.join(self.cache_dir, f"{file_prefix}_{version_hash}{CACHE_EXT}"), \
+            os.path.join(self.cache_dir, f"{file_prefix}_*{CACHE_EXT}")
+
+    def get_or_run(self, engine_name, data_sources, params, run_func, run_settings=None):
+        '''Returns cached result if there is one for the current data versions and params. Otherwise calls
+        run_func(), caches its result, deletes results for older data versions, and returns the result.
+        PARAMETERS:
+            engine_name (string) = name of engine, e.g. 'ppa2'
+            data_sources (list) = SQL Server table names or CSV paths the result is made from
+            params (object) = parameter object (e.g. PPA2Params) whose attributes define the run
+            run_func (function) = function with no arguments that returns the result (e.g. a dataframe)
+            run_settings (dict) = optional other settings that change the result, e.g. EpochFilter.settings()
+        '''
+        cache_path, all_versions = self.cache_paths(engine_name, data_sources, params, run_settings)
+
+        if os.path.exists(cache_path):
+            print(f"using cached {engine_name} result {cache_path}")
+            return pd.read_pickle(cache_path)
+
+        result = run_func()
+
+        for old_path in glob.glob(all_versions):
+            os.remove(old_path)
+        pd.to_pickle(result, cache_path)
+        print(f"cached {engine_name} result to {cache_path}")
+
+        return result
+
+    def clear(self, engine_name='*'):
+        '''Deletes all cached results, or all results for one engine'''
+        for cache_path in glob.glob(os.path.join(self.cache_dir, f"{engine_name}_*{CACHE_EXT}")):
+            os.remove(cache_path)
+
+
+def cached_ppa2_metrics(cache_dir, tt_source, spec_source, params=None, svr_name='SQL-SVR', db_name='NPMRDS',
+                        epoch_filter=None):
+    '''PPA2Metrics(tt_source, spec_source, params, epoch_filter=epoch_filter).run(), using cached result if
+    data, params and epoch filter settings have not changed'''
+    params = params if params else PPA2Params()
+    cache = MetricsCache(cache_dir, svr_name, db_name)
+    filter_settings = {'epoch_filter': epoch_filter.settings()} if epoch_filter else None
+
+    return cache.get_or_run('ppa2', [tt_source, spec_source], params,
+                            lambda: PPA2Metrics(tt_source, spec_source, params, svr_name, db_name,
+                                                epoch_filter=epoch_filter).run(),
+                            filter_settings)
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    cache_folder = r"P:\NPMRDS data\MetricsCache"
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_npmrds_metrics_2023.csv"
+
+    #=================RUN SCRIPT===========================
+    df_metrics = cached_ppa2_metrics(cache_folder, tt_table, spec_table)
+    df_metrics.to_csv(output_csv, index=False)
@@ -0,0 +1,220 @@
+"""
+Name: parallel_metrics.py
+Purpose: Runs PPA2Metrics across a pool of processes, with each process handling one shard of TMCs.
+    All PPA2 metrics are calculated TMC by TMC, so shards never need each other's data and there is
+    no shuffle between processes.
+
+    Each worker reads only its own shard's rows:
+        -SQL Server tables: each shard is a contiguous range of tmc_code values, split evenly across the
+            sorted TMC codes in the spec table, so each worker's query is a range seek on the
+            (tmc_code, measurement_tstamp) clustered index rather than a scan of the whole table
+        -raw CSVs: the CSV is first split into one file per shard with shard_csv(), in one pass.
+            Shard files are kept, so later runs on the same data can skip the split. A marker file is
+            written when a split finishes; shards are only reused if the marker is there and newer
+            than the CSV.
+    Workers send back only their finished metrics table (one row per TMC), never epoch data, so
+    very little is copied between processes. Since each worker sorts only its own TMCs' epochs,
+    run time drops close to linearly with the number of workers, up to the speed of the data source.
+    If an EpochFilter is given, each worker filters its own shard; every TMC is in only one shard, so
+    its epochs_dropped count comes from that shard.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Metrics, EPOCH_DTYPES
+
+
+def shard_numbers(tmcs, n_shards):
+    '''Shard number of each TMC code in tmcs, from CRC32 hash of the TMC code'''
+    return np.array([zlib.crc32(str(tmc).encode()) % n_shards for tmc in tmcs], dtype=np.int32)
+
+
+def shard_paths(in_csv, out_dir, n_shards):
+    '''Returns (list of shard file paths, path of marker file written when split is finished)'''
+    csv_name = os.path.splitext(os.path.basename(in_csv))[0]
+    shard_files = [os.path.join(out_dir, f"{csv_name}_shard{k}.csv") for k in range(n_shards)]
+
+    return shard_files, os.path.join(out_dir, f"{csv_name}_shards{n_shards}.done")
+
+
+def shards_are_current(in_csv, out_dir, n_shards):
+    '''True if a split of in_csv into n_shards finished after in_csv was last modified'''
+    done_file = shard_paths(in_csv, out_dir, n_shards)[1]
+    return os.path.exists(done_file) and os.path.getmtime(done_file) >= os.path.getmtime(in_csv)
+
+
+def shard_csv(in_csv, out_dir, n_shards, chunk_rows=5000000):
+    '''Splits raw travel time CSV into n_shards CSVs, with all rows for a TMC in the same shard.
+    Shard files are named <in_csv name>_shard<shard number>.csv. When the split finishes, an empty
+    <in_csv name>_shards<n_shards>.done marker file is written. Returns list of shard file paths.'''
+    shard_files, done_file = shard_paths(in_csv, out_dir, n_shards)
+    for f in shard_files + [done_file]:
+        if os.path.exists(f):
+            os.remove(f)
+
+    print(f"splitting {in_csv} into {n_shards} shards...")
+    rows_read = 0
+    for df in pd.read_csv(in_csv, chunksize=chunk_rows, dtype={ttd.COL_TMC: str, ttd.COL_DENSITY: str}):
+        # hash each distinct TMC once, not every row
+        tmc_codes, tmcs = pd.factorize(df[ttd.COL_TMC])
+        row_shards = shard_numbers(tmcs, n_shards)[tmc_codes]
+
+        for k in np.unique(row_shards):
+            df.loc[row_shards == k].to_csv(shard_files[k], mode='a', index=False,
+                                           header=not os.path.exists(shard_files[k]))
+
+        rows_read += len(df)
+        print(f"\t{rows_read} rows split...")
+
+    open(done_file, 'w').close()
+
+    return shard_files
+
+
+def tmc_range_conditions(bounds):
+    '''SQL WHERE conditions for the len(bounds) + 1 contiguous ranges of tmc_code split at bounds, which must
+    be in the order SQL Server sorts them. The first and last ranges are open-ended. None if bounds is empty.'''
+    conditions = []
+    for k in range(len(bounds) + 1):
+        cond = []
+        if k > 0:
+            cond.append(f"{ttd.COL_TMC} >= '{bounds[k - 1]}'")
+        if k < len(bounds):
+            cond.append(f"{ttd.COL_TMC} < '{bounds[k]}'")
+        conditions.append(' AND '.join(cond) if cond else None)
+
+    return conditions
+
+
+def run_shard(shard_args):
+    '''Runs PPA2Metrics on one shard. Returns metrics for only the TMCs that have data in the shard, or
+    that had epochs dropped by the epoch filter.'''
+    tt_source, spec_source, params, svr_name, db_name, chunk_rows, sql_where, epoch_filter = shard_args
+
+    metrics = PPA2Metrics(tt_source, spec_source, params, svr_name, db_name, chunk_rows, sql_where=sql_where,
+                          epoch_filter=epoch_filter)
+    epochs = metrics.read_epochs()
+    df_out = metrics.calc_metrics(epochs)
+    in_shard = np.isin(np.arange(len(df_out)), epochs['tmc_idx'])
+
+    if epoch_filter:
+        df_out['epochs_dropped'] = epoch_filter.drop_report()['dropped_total'].values
+        in_shard |= df_out['epochs_dropped'].values > 0
+
+    return df_out.loc[in_shard]
+
+
+class ParallelPPA2Metrics():
+    def __init__(self, tt_source, spec_source, params=None, svr_name='SQL-SVR', db_name='NPMRDS',
+                 chunk_rows=2000000, n_workers=None, shard_dir=None, epoch_filter=None):
+        '''
+        PARAMETERS:
+            tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            params (PPA2Params) = metric parameters. Default is PPA2Params()
+            chunk_rows (int) = number of travel time rows each worker reads into memory at a time
+            n_workers (int) = number of processes, which is also the number of shards. Default is number of CPUs.
+            shard_dir (string) = folder for shard files, if tt_source is a CSV. Default is same folder as tt_source.
+                If a finished split of tt_source into n_workers shards is already there and newer than
+                tt_source, it is used as-is.
+            epoch_filter (EpochFilter) = optional filter of low-confidence and implausible epochs (see epoch_filter.py)
+        '''
+        self.tt_source = tt_source
+        self.spec_source = spec_source
+        self.params = params
+        self.svr_name = svr_name
+        self.db_name = db_name
+        self.chunk_rows = chunk_rows
+        self.n_workers = n_workers if n_workers else os.cpu_count()
+        self.shard_dir = shard_dir if shard_dir else os.path.dirname(os.path.abspath(tt_source))
+        self.epoch_filter = epoch_filter
+
+    def shard_bounds(self):
+        '''TMC codes splitting the spec table's sorted TMCs into n_workers ranges of about the same number of TMCs,
+        in the order SQL Server sorts them (using the collation of the travel time table's tmc_code column)'''
+        spec = ttd.load_tmc_spec(self.spec_source, self.svr_name, self.db_name, cols=[ttd.COL_SPEC_TMC])
+        tmcs = np.unique(spec[ttd.COL_SPEC_TMC].astype(str).values)
+        bound_pos = np.unique(np.linspace(0, len(tmcs), self.n_workers + 1).astype(int)[1:-1])
+        bounds = tmcs[bound_pos[bound_pos > 0]]
+        if len(bounds) == 0:
+            return []
+
+        sql_collation = f"""SELECT collation_name FROM sys.columns
+            WHERE object_id = OBJECT_ID('{self.tt_source}') AND name = '{ttd.COL_TMC}'"""
+        import pyodbc
+        with pyodbc.connect(ttd.conn_str(self.svr_name, self.db_name)) as conn:
+            cursor = conn.cursor()
+            collation = cursor.execute(sql_collation).fetchone()[0]
+            bound_vals = ', '.join(f"('{b}')" for b in bounds)
+            sql_sort = f"SELECT b FROM (VALUES {bound_vals}) AS bounds(b) ORDER BY b COLLATE {collation}"
+            bounds = [row[0] for row in cursor.execute(sql_sort).fetchall()]
+
+        return bounds
+
+    def shard_args(self):
+        '''Arguments for run_shard() for each shard'''
+        n = self.n_workers
+        base_args = (self.spec_source, self.params, self.svr_name, self.db_name, self.chunk_rows)
+
+        if ttd.is_csv(self.tt_source):
+            if shards_are_current(self.tt_source, self.shard_dir, n):
+                shard_files = shard_paths(self.tt_source, self.shard_dir, n)[0]
+            else:
+                shard_files = shard_csv(self.tt_source, self.shard_dir, n)
+            return [(f, *base_args, None, self.epoch_filter) for f in shard_files if os.path.exists(f)]
+        else:
+            return [(self.tt_source, *base_args, cond, self.epoch_filter)
+                    for cond in tmc_range_conditions(self.shard_bounds())]
+
+    def run(self):
+        '''Returns dataframe of PPA 2.0 metrics for each TMC, in the same format as PPA2Metrics.run()'''
+        start_time = time.perf_counter()
+        shard_args = self.shard_args()
+
+        print(f"calculating metrics for {len(shard_args)} shards with {self.n_workers} workers...")
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            shard_dfs = list(executor.map(run_shard, shard_args))
+
+        # TMCs with no data in any shard get the same -1 values as in PPA2Metrics
+        metrics = PPA2Metrics(self.tt_source, self.spec_source, self.params, self.svr_name, self.db_name)
+        df_nodata = metrics.calc_metrics({k: np.zeros(0, dtype=v) for k, v in EPOCH_DTYPES.items()})
+        if self.epoch_filter:
+            df_nodata['epochs_dropped'] = 0
+
+        df_data = pd.concat(shard_dfs)
+        df_out = pd.concat([df_data, df_nodata.loc[~df_nodata[ttd.COL_SPEC_TMC].isin(df_data[ttd.COL_SPEC_TMC])]])
+        df_out = df_out.loc[df_nodata.index].reset_index(drop=True) # same TMC order as spec table
+
+        if self.epoch_filter:
+            print(f"{df_out['epochs_dropped'].sum()} epochs dropped by epoch filter")
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"metrics calculated for {len(df_out)} TMCs in {elapsed_time}mins")
+
+        return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_npmrds_metrics_2023.csv"
+    n_processes = None # None to use all CPUs
+
+    #=================RUN SCRIPT===========================
+    df_metrics = ParallelPPA2Metrics(tt_table, spec_table, n_workers=n_processes).run()
+    df_metrics.to_csv(output_csv, index=False)
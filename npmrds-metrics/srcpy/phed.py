@@ -0,0 +1,202 @@
+"""
+Name: phed.py
+Purpose: Peak hours of excessive delay (PHED) for each TMC, and totals by corridor (tmclinear and
+    direction, since both directions of a road share a tmclinear) and urban area (urban_code), following the method of the federal PHED measure (23 CFR 490.711):
+        -threshold speed for each TMC = the larger of min_threshold_spd (20mph) and threshold_ff_share (60%)
+            of its free-flow speed. Free-flow speeds come from the PPA2 free-flow logic (85th percentile
+            overnight speed on freeways, 60th percentile on arterials), e.g. the output of ppa2_metrics.py.
+        -excessive delay for each peak-period epoch = travel time minus threshold travel time, no less than
+            0 and no more than the epoch length (900 seconds)
+        -volume for each epoch = directional AADT x hourly share of daily traffic (from a configurable
+            hourly profile) / epochs per hour, split into passenger vehicles and trucks using aadt_singl
+            and aadt_combi. AADT on two-way TMCs (faciltype 2) is split by dir_split to get directional AADT.
+        -person-hours of excessive delay = excessive delay x (passenger volume x passenger occupancy
+            + truck volume x truck occupancy)
+    Epochs with no travel time data add no delay.
+
+    Delay for every epoch is computed with array operations, and totals are added up with bincount,
+    so each month of travel time data is read and summed in one pass without holding the year in memory.
+    For SQL Server tables, each month is read as its own query.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from epoch_calendar import HRS_PER_WEEK, EPOCH_MINS, hour_of_week, hours_of_week
+
+
+class PHEDParams():
+    '''Parameters for PHED calculation'''
+    def __init__(self):
+        self.weekdays = [0, 1, 2, 3, 4] # Monday = 0
+        self.peak_periods = [(6, 10), (16, 20)] # (start hour (>=), end hour (<)) on weekdays
+
+        self.min_threshold_spd = 20 # mph
+        self.threshold_ff_share = 0.6 # threshold speed is this share of free-flow speed, if above min_threshold_spd
+        self.ff_col = PPA2Params().ff_col_congratio # free-flow speed column in ff_speeds
+
+        # share of daily traffic in each hour of the day, 12am-1am first. Normalized to add up to 1.
+        self.hourly_profile = [0.010, 0.006, 0.005, 0.005, 0.009, 0.022, 0.048, 0.070, 0.066, 0.054, 0.050, 0.053,
+                               0.056, 0.057, 0.062, 0.071, 0.076, 0.077, 0.060, 0.045, 0.036, 0.030, 0.022, 0.015]
+        self.dir_split = 0.5 # share of two-way AADT in each direction
+        self.twoway_faciltypes = [2]
+
+        self.occ_pax = 1.7
+        self.occ_truck = 1.0
+
+    def peak_hours_of_week(self):
+        '''Boolean array, True for each hour of the week in a peak period'''
+        is_peak = np.zeros(HRS_PER_WEEK, dtype=bool)
+        for hr_start, hr_end in self.peak_periods:
+            is_peak[hours_of_week(self.weekdays, hr_start, hr_end)] = True
+
+        return is_peak
+
+
+class PHED():
+    def __init__(self, tt_source, spec_source, ff_speeds, data_year=None, params=None, svr_name='SQL-SVR',
+                 db_name='NPMRDS', chunk_rows=5000000):
+        '''
+        PARAMETERS:
+            tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            ff_speeds (dataframe) = free-flow speed for each TMC, with tmc column and params.ff_col column,
+                e.g. output of PPA2Metrics.run()
+            data_year (int) = year of data. Needed to read SQL Server tables one month at a time.
+            params (PHEDParams) = PHED parameters. Default is PHEDParams()
+            chunk_rows (int) = number of travel time rows read into memory at a time
+        '''
+        self.tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+        self.data_year = data_year
+        self.params = params if params else PHEDParams()
+
+        spec_cols = [ttd.COL_SPEC_TMC, 'road', 'f_system', 'miles', 'tmclinear', 'direction', 'urban_code',
+                     'faciltype', 'aadt', 'aadt_singl', 'aadt_combi']
+        self.spec = ttd.load_tmc_spec(spec_source, svr_name, db_name, cols=spec_cols)
+        self.spec['direction'] = self.spec['direction'].fillna('')
+
+        ff = ff_speeds.assign(**{ttd.COL_SPEC_TMC: ff_speeds[ttd.COL_SPEC_TMC].astype(str)}) \
+            .set_index(ttd.COL_SPEC_TMC)[self.params.ff_col]
+        self.spec['ff_speed'] = self.spec[ttd.COL_SPEC_TMC].map(ff.where(ff > 0))
+
+    def tmc_arrays(self):
+        '''Per-TMC arrays used for each epoch: threshold travel time in seconds, and person-weighted and
+        vehicle volume per epoch for each hour of day, shape (number of TMCs, 24)'''
+        p = self.params
+        spec = self.spec
+
+        threshold_spd = np.maximum(p.min_threshold_spd, p.threshold_ff_share * spec['ff_speed'].values)
+        tt_threshold = spec['miles'].values / threshold_spd * 3600 # NaN if TMC has no free-flow speed
+
+        dir_factor = np.where(spec['faciltype'].isin(p.twoway_faciltypes), p.dir_split, 1.0)
+        aadt_truck = (spec['aadt_singl'].fillna(0) + spec['aadt_combi'].fillna(0)).values * dir_factor
+        aadt_all = spec['aadt'].fillna(0).values * dir_factor
+        aadt_pax = np.maximum(aadt_all - aadt_truck, 0)
+
+        hr_share = np.array(p.hourly_profile) / np.sum(p.hourly_profile)
+        epochs_per_hr = 60 // EPOCH_MINS
+        veh_epoch = aadt_all[:, None] * hr_share[None, :] / epochs_per_hr
+        persons_epoch = (aadt_pax * p.occ_pax + aadt_truck * p.occ_truck)[:, None] * hr_share[None, :] / epochs_per_hr
+
+        return tt_threshold, veh_epoch, persons_epoch
+
+    def month_chunks(self):
+        '''Yields travel time chunks one month at a time for SQL Server tables, or straight through for CSVs'''
+        cols = [ttd.COL_TMC, ttd.COL_TSTAMP, ttd.COL_TT]
+        if self.tt_data.source_is_csv or self.data_year is None:
+            yield from self.tt_data.iter_chunks(cols=cols)
+        else:
+            for month in range(1, 13):
+                month_start = f"{self.data_year}-{month:02d}-01"
+                month_end = f"{self.data_year + month // 12}-{month % 12 + 1:02d}-01"
+                print(f"\treading {month_start} to {month_end}...")
+                sql_where = f"{ttd.COL_TSTAMP} >= '{month_start}' AND {ttd.COL_TSTAMP} < '{month_end}'"
+                yield from self.tt_data.iter_chunks(cols=cols, sql_where=sql_where)
+
+    def tmc_delay(self):
+        '''Returns dataframe of vehicle- and person-hours of excessive delay for each TMC in spec table'''
+        tmcs = pd.Index(self.spec[ttd.COL_SPEC_TMC])
+        n_tmc = len(tmcs)
+        is_peak_how = self.params.peak_hours_of_week()
+        tt_threshold, veh_epoch, persons_epoch = self.tmc_arrays()
+        max_delay = EPOCH_MINS * 60
+
+        veh_hrs = np.zeros(n_tmc)
+        person_hrs = np.zeros(n_tmc)
+        peak_epochs = np.zeros(n_tmc, dtype=np.int64)
+        delay_epochs = np.zeros(n_tmc, dtype=np.int64)
+
+        rows_read = 0
+        for df in self.month_chunks():
+            tmc_idx = tmcs.get_indexer(df[ttd.COL_TMC])
+            how = hour_of_week(df[ttd.COL_TSTAMP].values)
+            keep = (tmc_idx >= 0) & is_peak_how[how]
+            tmc_idx = tmc_idx[keep]
+            hr = how[keep] % 24
+
+            delay_sec = np.clip(df[ttd.COL_TT].values[keep] - tt_threshold[tmc_idx], 0, max_delay)
+            delay_sec = np.nan_to_num(delay_sec) # no data or no free-flow speed adds no delay
+            delay_hrs = delay_sec / 3600
+
+            veh_hrs += np.bincount(tmc_idx, weights=delay_hrs * veh_epoch[tmc_idx, hr], minlength=n_tmc)
+            person_hrs += np.bincount(tmc_idx, weights=delay_hrs * persons_epoch[tmc_idx, hr], minlength=n_tmc)
+            peak_epochs += np.bincount(tmc_idx, minlength=n_tmc)
+            delay_epochs += np.bincount(tmc_idx[delay_sec > 0], minlength=n_tmc)
+
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+        df_out = self.spec.copy()
+        df_out['tt_threshold'] = tt_threshold
+        df_out['peak_epochs'] = peak_epochs
+        df_out['delay_epochs'] = delay_epochs
+        df_out['excess_delay_veh_hrs'] = veh_hrs
+        df_out['phed_person_hrs'] = person_hrs
+
+        return df_out
+
+    def run(self):
+        '''Returns dict of dataframes of PHED totals by TMC, corridor (tmclinear and direction) and urban area
+        (urban_code)'''
+        start_time = time.perf_counter()
+
+        print(f"calculating PHED from {self.tt_data.tt_source}...")
+        df_tmc = self.tmc_delay()
+
+        sum_cols = ['miles', 'peak_epochs', 'delay_epochs', 'excess_delay_veh_hrs', 'phed_person_hrs']
+        df_corridor = df_tmc.groupby(['tmclinear', 'direction'], as_index=False)[sum_cols].sum()
+        df_urban = df_tmc.groupby('urban_code', as_index=False)[sum_cols].sum()
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"PHED calculated for {len(df_tmc)} TMCs in {elapsed_time}mins. " \
+              f"Total PHED: {round(df_tmc['phed_person_hrs'].sum())} person-hours")
+
+        return {'tmc': df_tmc, 'corridor': df_corridor, 'urban_area': df_urban}
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    year = 2023
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    ff_speed_csv = r"P:\NPMRDS data\PPA2\ppa2_npmrds_metrics_2023.csv" # output of ppa2_metrics.py
+
+    output_csv_prefix = r"P:\NPMRDS data\PHED\phed_2023"
+
+    #=================RUN SCRIPT===========================
+    df_ff = pd.read_csv(ff_speed_csv)
+    phed_dfs = PHED(tt_table, spec_table, df_ff, data_year=year).run()
+
+    for level, df in phed_dfs.items():
+        df.to_csv(f"{output_csv_prefix}_{level}.csv", index=False)
@@ -0,0 +1,219 @@
+"""
+Name: pm3_measures.py
+Purpose: Federal PM3 system reliability and freight measures (23 CFR 490, subparts E and F) from
+    NPMRDS travel time data, in one pass over each data set:
+        -segment LOTTR (level of travel time reliability) for each of the four federal periods,
+            from the all-vehicle travel time data. LOTTR = 80th / 50th percentile travel time.
+            A segment is reliable if its LOTTR is under 1.5 in all four periods.
+        -segment TTTR (truck travel time reliability) for each of the five federal periods, from
+            the truck travel time data loaded by RawTTCSV(vehtype='truck').
+            TTTR = 95th / 50th percentile travel time; segment TTTR is the largest of the five.
+        -network measures for Interstate and non-Interstate NHS:
+            percent of person-miles traveled that are reliable, with person-miles for each segment
+            = miles x (passenger AADT x passenger occupancy + truck AADT x truck occupancy), using
+            aadt, aadt_singl and aadt_combi from the TMC spec table;
+            Truck Travel Time Reliability Index (Interstate only) = miles-weighted average of segment TTTR.
+
+    LOTTRs and TTTRs are rounded to 2 decimal places before being compared or averaged, as in the
+    federal rule. PHED is not calculated here; see phed.py.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from group_stats import grouped_percentiles, grouped_counts
+from epoch_calendar import HRS_PER_WEEK, hour_of_week, hours_of_week
+
+
+class PM3Params():
+    '''Federal PM3 period definitions and thresholds'''
+    def __init__(self):
+        self.weekdays = [0, 1, 2, 3, 4] # Monday = 0
+        self.weekend_days = [5, 6]
+
+        # {period name: (start hour (>=), end hour (<), days of week)}. End hour less than start hour
+        # means the period wraps past midnight.
+        self.periods = {'amp': (6, 10, self.weekdays),
+                        'midd': (10, 16, self.weekdays),
+                        'pmp': (16, 20, self.weekdays),
+                        'we': (6, 20, self.weekend_days),
+                        'ovn': (20, 6, self.weekdays + self.weekend_days)}
+        self.lottr_periods = ['amp', 'midd', 'pmp', 'we']
+        self.tttr_periods = ['amp', 'midd', 'pmp', 'we', 'ovn']
+
+        self.lottr_pctl = 0.8
+        self.tttr_pctl = 0.95
+        self.lottr_reliable_max = 1.5 # segment is reliable if LOTTR < this value in every LOTTR period
+
+        # vehicle occupancy factors for person-miles traveled
+        self.occ_pax = 1.7
+        self.occ_truck = 1.0
+
+        self.interstate_fsystems = [1]
+
+    def hour_of_week_periods(self):
+        '''Array giving the period code (1, 2, ... in order of self.periods; 0 = none) for each hour of the week'''
+        lookup = np.zeros(HRS_PER_WEEK, dtype=np.uint8)
+        for prd_code, (hr_start, hr_end, days) in enumerate(self.periods.values(), start=1):
+            hows = hours_of_week(days, hr_start, hr_end)
+            if (lookup[hows] > 0).any():
+                raise Exception("PM3 periods overlap. Each hour of the week can only be in one period.")
+            lookup[hows] = prd_code
+
+        return lookup
+
+
+class PM3Measures():
+    def __init__(self, tt_source_all, spec_source, tt_source_truck=None, params=None, svr_name='SQL-SVR',
+                 db_name='NPMRDS', chunk_rows=5000000):
+        '''
+        PARAMETERS:
+            tt_source_all (string) = all-vehicle travel time table name in SQL Server, or path to raw CSV
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            tt_source_truck (string) = truck travel time table or raw CSV. If None, TTTR is not calculated.
+            params (PM3Params) = period definitions and thresholds. Default is PM3Params()
+            chunk_rows (int) = number of travel time rows read into memory at a time
+        '''
+        self.tt_source_all = tt_source_all
+        self.tt_source_truck = tt_source_truck
+        self.svr_name = svr_name
+        self.db_name = db_name
+        self.chunk_rows = chunk_rows
+        self.params = params if params else PM3Params()
+
+        self.spec_cols = [ttd.COL_SPEC_TMC, 'road', 'f_system', 'nhs', 'miles', 'aadt', 'aadt_singl', 'aadt_combi']
+        self.spec = ttd.load_tmc_spec(spec_source, svr_name, db_name, cols=self.spec_cols)
+
+    def read_tt(self, tt_source):
+        '''Single pass over travel time data. Returns arrays of TMC's row number in spec table, period code,
+        and travel time, for epochs in a PM3 period on TMCs in the spec table.'''
+        tmcs = pd.Index(self.spec[ttd.COL_SPEC_TMC])
+        prd_lookup = self.params.hour_of_week_periods()
+        tt_data = ttd.TTData(tt_source, self.svr_name, self.db_name, self.chunk_rows)
+
+        tmc_idx_parts, prd_parts, tt_parts = [], [], []
+        rows_read = 0
+        print(f"reading travel time data from {tt_source}...")
+        for df in tt_data.iter_chunks(cols=[ttd.COL_TMC, ttd.COL_TSTAMP, ttd.COL_TT]):
+            tmc_idx = tmcs.get_indexer(df[ttd.COL_TMC])
+            prd_code = prd_lookup[hour_of_week(df[ttd.COL_TSTAMP].values)]
+            keep = (tmc_idx >= 0) & (prd_code > 0)
+
+            tmc_idx_parts.append(tmc_idx[keep].astype(np.int32))
+            prd_parts.append(prd_code[keep])
+            tt_parts.append(df[ttd.COL_TT].values[keep].astype(np.float32))
+
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+        if not tmc_idx_parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.float32)
+
+        return np.concatenate(tmc_idx_parts), np.concatenate(prd_parts), np.concatenate(tt_parts)
+
+    def period_ratios(self, tt_source, pctl_hi, prd_names, col_prefix):
+        '''Returns dataframe of pctl_hi / 50th percentile travel time ratios, rounded to 2 decimals, for each
+        TMC in spec table and each period in prd_names. All periods come from one sort.'''
+        tmc_idx, prd_codes, tt = self.read_tt(tt_source)
+        n_tmc = len(self.spec)
+        n_prd_codes = len(self.params.periods) + 1
+        tmc_prd = tmc_idx.astype(np.int64) * n_prd_codes + prd_codes
+
+        pctls = grouped_percentiles(tmc_prd, tt, n_tmc * n_prd_codes, [pctl_hi, 0.5]).reshape(2, n_tmc, n_prd_codes)
+        epochs = grouped_counts(tmc_prd, n_tmc * n_prd_codes).reshape(n_tmc, n_prd_codes)
+
+        df_out = pd.DataFrame(index=self.spec.index)
+        prd_codes_all = {prd_name: prd_code for prd_code, prd_name in enumerate(self.params.periods, start=1)}
+        for prd_name in prd_names:
+            prd_code = prd_codes_all[prd_name]
+            df_out[f"{col_prefix}_{prd_name}"] = np.round(pctls[0, :, prd_code] / pctls[1, :, prd_code], 2)
+            df_out[f"epochs_{col_prefix}_{prd_name}"] = epochs[:, prd_code]
+
+        return df_out
+
+    def segment_measures(self):
+        '''Returns dataframe of LOTTR, reliability and, if truck data given, TTTR for each TMC in spec table'''
+        p = self.params
+        df_seg = self.spec.copy()
+
+        df_lottr = self.period_ratios(self.tt_source_all, p.lottr_pctl, p.lottr_periods, 'lottr')
+        df_seg = df_seg.join(df_lottr)
+        lottr_cols = [f"lottr_{prd}" for prd in p.lottr_periods]
+        df_seg['lottr_max'] = df_seg[lottr_cols].max(axis=1, skipna=False)
+        df_seg['is_reliable'] = (df_seg['lottr_max'] < p.lottr_reliable_max).astype(int)
+        df_seg['has_lottr'] = df_seg['lottr_max'].notnull().astype(int)
+
+        if self.tt_source_truck:
+            df_tttr = self.period_ratios(self.tt_source_truck, p.tttr_pctl, p.tttr_periods, 'tttr')
+            df_seg = df_seg.join(df_tttr)
+            df_seg['tttr_max'] = df_seg[[f"tttr_{prd}" for prd in p.tttr_periods]].max(axis=1, skipna=False)
+
+        aadt_truck = df_seg['aadt_singl'].fillna(0) + df_seg['aadt_combi'].fillna(0)
+        aadt_pax = (df_seg['aadt'].fillna(0) - aadt_truck).clip(lower=0)
+        df_seg['person_miles'] = df_seg['miles'] * (aadt_pax * p.occ_pax + aadt_truck * p.occ_truck)
+
+        return df_seg
+
+    def network_measures(self, df_seg):
+        '''Returns dataframe with percent of person-miles reliable and truck travel time reliability index
+        for Interstate and non-Interstate NHS, from output of segment_measures(). Segments with no LOTTR
+        (or TTTR) are left out of that measure, and their miles are reported.'''
+        p = self.params
+        is_interstate = df_seg['f_system'].isin(p.interstate_fsystems)
+        networks = {'Interstate': is_interstate, 'Non-Interstate NHS': ~is_interstate & (df_seg['nhs'] > 0)}
+
+        net_rows = []
+        for net_name, in_net in networks.items():
+            df_net = df_seg.loc[in_net]
+            df_lottr = df_net.loc[df_net['has_lottr'] == 1]
+            net_row = {'network': net_name, 'tmcs': len(df_net), 'miles': df_net['miles'].sum(),
+                       'miles_no_lottr': df_net.loc[df_net['has_lottr'] == 0, 'miles'].sum(),
+                       'pct_person_miles_reliable': round((df_lottr['person_miles'] * df_lottr['is_reliable']).sum() \
+                                                          / df_lottr['person_miles'].sum() * 100, 1)}
+
+            if 'tttr_max' in df_seg.columns and net_name == 'Interstate':
+                df_tttr = df_net.loc[df_net['tttr_max'].notnull()]
+                net_row['tttr_index'] = round((df_tttr['miles'] * df_tttr['tttr_max']).sum() / df_tttr['miles'].sum(), 2)
+                net_row['miles_no_tttr'] = df_net.loc[df_net['tttr_max'].isnull(), 'miles'].sum()
+
+            net_rows.append(net_row)
+
+        return pd.DataFrame(net_rows)
+
+    def run(self):
+        '''Returns (segment measures dataframe, network measures dataframe)'''
+        start_time = time.perf_counter()
+
+        df_seg = self.segment_measures()
+        df_net = self.network_measures(df_seg)
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"PM3 measures calculated for {len(df_seg)} TMCs in {elapsed_time}mins")
+
+        return df_seg, df_net
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table_all = 'npmrds_2023_nhstmc_paxtruck_comb' # table name or path to raw CSV
+    tt_table_truck = 'npmrds_2023_nhstmc_trucks' # table name or path to raw CSV; None to skip TTTR
+    spec_table = 'npmrds_2023_nhstmc_txt' # table name or path to TMC_Identification.csv
+
+    output_csv_segments = r"P:\NPMRDS data\PM3\pm3_segments_2023.csv"
+    output_csv_network = r"P:\NPMRDS data\PM3\pm3_network_2023.csv"
+
+    #=================RUN SCRIPT===========================
+    df_segments, df_network = PM3Measures(tt_table_all, spec_table, tt_table_truck).run()
+    df_segments.to_csv(output_csv_segments, index=False)
+    df_network.to_csv(output_csv_network, index=False)
+    print(df_network)
@@ -0,0 +1,290 @@
+"""
+Name: ppa2_metrics.py
+Purpose: Python version of npmrds-projline-conflate/PPA2_NPMRDS_metrics_latest.sql.
+    The SQL script scans the travel time table at least eight times (once per reliability
+    period, plus epoch counts, free-flow speed, speed by hour, worst 4 hours and slowest hour).
+    This script reads the travel time data once, in chunks, tags each epoch with its period
+    using the lookup arrays in epoch_calendar.py, and computes every column of the SQL
+    script's final table from that one pass:
+        -50th and 80th percentile travel times and LOTTRs for each period
+        -free-flow speeds (85th percentile for freeways, 70th/60th percentile for arterials)
+        -harmonic average speed and congestion ratio during the worst 4 weekday hours
+        -slowest weekday hour, its speed and congestion ratio
+        -epoch counts
+    As in the SQL, TMCs with no value for a column get -1.
+
+    Optionally, low-confidence and implausible epochs can be dropped before any metrics are calculated,
+    by passing an EpochFilter (epoch_filter.py). Output then has an epochs_dropped column, and counts
+    for each filter are in PPA2Metrics.epoch_filter.drop_report().
+
+    Use compare_to_sql() to check results against the output of the SQL script.
+
+    NOTE: the weekend block of the SQL script filters on @weekdays, so its "weekend" travel times
+    are really weekday 6am-8pm travel times. This script uses Saturday and Sunday, as intended, so
+    compare_to_sql() will show differences in the weekend columns. Each hour of the week can only be
+    in one period, so the SQL's weekend columns cannot be reproduced by changing the weekend days.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from group_stats import grouped_percentiles, grouped_counts
+from epoch_calendar import EpochCalendar
+from congestion_hours import hourly_speed_sums, worst_hours
+
+
+# arrays returned by PPA2Metrics.read_epochs(), with one value per epoch
+EPOCH_DTYPES = {'tmc_idx': np.int32, 'epoch': np.int32, 'how': np.uint8, 'prd': np.uint8, 'speed': np.float32,
+                'tt': np.float32}
+
+
+class PPA2Params():
+    '''Parameters for PPA 2.0 metrics. Defaults match the variables at the top of PPA2_NPMRDS_metrics_latest.sql'''
+    def __init__(self):
+        self.pctl_congested = 0.8 # "bad" travel time percentile (@PctlCongested)
+
+        # free-flow speed period, all days of week
+        self.ff_prd_start = 20 # free-flow period starts at or after this time at night (@FFprdStart)
+        self.ff_prd_end = 6 # free-flow period ends before this time in the morning (@FFprdEnd)
+
+        self.weekdays = [0, 1, 2, 3, 4] # Monday = 0
+        self.weekend_days = [5, 6]
+
+        # reliability periods, as {period name: (start hour (>=), end hour (<), days of week)}
+        self.rel_periods = {'ampk': (6, 10, self.weekdays),
+                            'midday': (10, 16, self.weekdays),
+                            'pmpk': (16, 20, self.weekdays),
+                            'weekend': (6, 20, self.weekend_days)}
+        self.lottr_cols = {'ampk': 'lottr_ampk', 'midday': 'lottr_midday', 'pmpk': 'lottr_pmpk',
+                           'weekend': 'lottr_wknd'}
+
+        # free-flow speed percentiles. Freeways always use ff_pctl_fwy; arterials use
+        # a different percentile for each free-flow speed column
+        self.fwy_fsystems = [1, 2]
+        self.ff_pctl_fwy = 0.85
+        self.ff_pctls_art = {'ff_speed_art70thp': 0.7, 'ff_speed_art60thp': 0.6}
+        self.ff_col_congratio = 'ff_speed_art60thp' # free-flow speed used for congestion ratios
+
+        self.min_epochs_hr = 100 # weekday hours with fewer epochs are not ranked for worst hours
+        self.n_worst_hrs = 4
+
+    def hour_of_week_periods(self):
+        '''Array giving the reliability period code for each hour of the week. Codes are
+        1, 2, ... in the order of rel_periods; 0 if hour is not in any reliability period.'''
+        lookup = np.zeros(168, dtype=np.uint8)
+        for prd_code, (hr_start, hr_end, days) in enumerate(self.rel_periods.values(), start=1):
+            for day in days:
+                if (lookup[day * 24 + hr_start : day * 24 + hr_end] > 0).any():
+                    raise Exception("Reliability periods overlap. Each hour of the week can only be in " \
+                                    "one period.")
+                lookup[day * 24 + hr_start : day * 24 + hr_end] = prd_code
+
+        return lookup
+
+
+class PPA2Metrics():
+    def __init__(self, tt_source, spec_source, params=None, svr_name='SQL-SVR', db_name='NPMRDS',
+                 chunk_rows=5000000, calendar=None, sql_where=None, epoch_filter=None):
+        '''
+        PARAMETERS:
+            tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+            spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            params (PPA2Params) = metric parameters. Default is PPA2Params()
+            chunk_rows (int) = number of travel time rows read into memory at a time
+            calendar (EpochCalendar) = gives each epoch's hour of week and period. Default is a calendar
+                for the year of the first travel time rows read, made with params.
+            sql_where (string) = optional SQL WHERE condition (without "WHERE") to read only some travel time
+                rows from SQL Server, e.g. one shard of TMCs (see parallel_metrics.py)
+            epoch_filter (EpochFilter) = optional filter of low-confidence and implausible epochs (see epoch_filter.py)
+        '''
+        self.tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+        self.spec_cols = [ttd.COL_SPEC_TMC, 'road', 'route_numb', 'f_system', 'nhs', 'miles']
+        self.spec = ttd.load_tmc_spec(spec_source, svr_name, db_name, cols=self.spec_cols)
+        self.params = params if params else PPA2Params()
+        self.calendar = calendar
+        self.sql_where = sql_where
+        self.epoch_filter = epoch_filter
+
+    def read_epochs(self):
+        '''Single pass over the travel time data. Returns dict of arrays with one value per epoch:
+        TMC's row number in spec table, epoch ID, hour of week, period code, speed, and travel time. Epochs for
+        TMCs not in the spec table are left out, as they are in the SQL script, as are epochs dropped by
+        self.epoch_filter.'''
+        tmcs = pd.Index(self.spec[ttd.COL_SPEC_TMC])
+        epoch_parts = {k: [] for k in EPOCH_DTYPES}
+
+        cols = [ttd.COL_TMC, ttd.COL_TSTAMP, ttd.COL_SPEED, ttd.COL_TT]
+        if self.epoch_filter:
+            self.epoch_filter.start(tmcs)
+            cols += self.epoch_filter.chunk_cols()
+
+        rows_read = 0
+        for df in self.tt_data.iter_chunks(cols=cols, sql_where=self.sql_where):
+            rows_read += len(df)
+            print(f"\t{rows_read} rows read...")
+
+            tmc_idx = tmcs.get_indexer(df[ttd.COL_TMC])
+            in_spec = tmc_idx >= 0
+            if self.epoch_filter and in_spec.any():
+                in_spec[in_spec] = self.epoch_filter.chunk_mask(df.loc[in_spec], tmc_idx[in_spec],
+                                                                self.spec['miles'].values)
+            if not in_spec.any():
+                continue
+
+            tstamps = df[ttd.COL_TSTAMP].values[in_spec]
+            if self.calendar is None:
+                self.calendar = EpochCalendar.for_tstamps(tstamps, self.params)
+            epoch_idx = self.calendar.epoch_index(tstamps)
+
+            epoch_parts['tmc_idx'].append(tmc_idx[in_spec].astype(np.int32))
+            epoch_parts['epoch'].append(epoch_idx.astype(np.int32))
+            epoch_parts['how'].append(self.calendar.how[epoch_idx])
+            epoch_parts['prd'].append(self.calendar.prd_code[epoch_idx])
+            epoch_parts['speed'].append(df[ttd.COL_SPEED].values[in_spec].astype(np.float32))
+            epoch_parts['tt'].append(df[ttd.COL_TT].values[in_spec].astype(np.float32))
+
+        epochs = {k: np.concatenate(v) if v else np.zeros(0, dtype=EPOCH_DTYPES[k]) for k, v in epoch_parts.items()}
+
+        if self.epoch_filter:
+            keep = self.epoch_filter.rolling_mask(epochs['tmc_idx'], epochs['epoch'], epochs['speed'])
+            epochs = {k: v[keep] for k, v in epochs.items()}
+
+        return epochs
+
+    def calc_metrics(self, epochs):
+        '''Returns dataframe of PPA 2.0 metrics, one row per TMC in spec table, from epoch arrays
+        returned by read_epochs()'''
+        p = self.params
+        n_tmc = len(self.spec)
+        tmc_idx = epochs['tmc_idx']
+        how = epochs['how']
+        hour = how % 24
+        speed = epochs['speed']
+        tt = epochs['tt']
+
+        df_out = self.spec[self.spec_cols].copy()
+        has_data = grouped_counts(tmc_idx, n_tmc) > 0
+
+        #---------travel time percentiles, all periods from one sort---------
+        prd_code_ff = len(p.rel_periods) + 1
+        n_prd_codes = prd_code_ff + 1 # includes 0 = not in any period
+        prd_codes = epochs['prd']
+        tmc_prd = tmc_idx.astype(np.int64) * n_prd_codes + prd_codes
+
+        tt_pctls = grouped_percentiles(tmc_prd, tt, n_tmc * n_prd_codes, [p.pctl_congested, 0.5])
+        tt_pctls = tt_pctls.reshape(2, n_tmc, n_prd_codes)
+        prd_epochs = grouped_counts(tmc_prd, n_tmc * n_prd_codes).reshape(n_tmc, n_prd_codes)
+
+        for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+            df_out[f"tt_p80_{prd_name}"] = tt_pctls[0, :, prd_code]
+            df_out[f"tt_p50_{prd_name}"] = tt_pctls[1, :, prd_code]
+
+        for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+            df_out[p.lottr_cols[prd_name]] = tt_pctls[0, :, prd_code] / tt_pctls[1, :, prd_code]
+
+        #---------free-flow speeds, from overnight epochs on all days---------
+        is_night = prd_codes == prd_code_ff
+        ff_pctls = [p.ff_pctl_fwy] + list(p.ff_pctls_art.values())
+        ff_spds = grouped_percentiles(tmc_idx[is_night], speed[is_night], n_tmc, ff_pctls)
+
+        is_fwy = df_out['f_system'].isin(p.fwy_fsystems).values
+        for i, ff_col in enumerate(p.ff_pctls_art, start=1):
+            df_out[ff_col] = np.where(is_fwy, ff_spds[0], ff_spds[i])
+        ff_speed = df_out[p.ff_col_congratio].values
+
+        #---------worst hours, from weekday speeds by hour of day---------
+        is_wkdy = np.isin(how // 24, p.weekdays)
+        cnt_hr, inv_spd_hr = hourly_speed_sums(tmc_idx[is_wkdy], hour[is_wkdy], speed[is_wkdy], n_tmc)
+        worst = worst_hours(cnt_hr, inv_spd_hr, ff_speed, p)
+
+        df_out['havg_spd_worst4hrs'] = worst['havg_spd_worst4hrs']
+        # overnight speed can be slower than worst-hour speed if there are few overnight data
+        df_out['congratio_worst4hrs'] = np.minimum(worst['havg_spd_worst4hrs'] / ff_speed, 1.0)
+        df_out['slowest_hr'] = worst['slowest_hr']
+        df_out['slowest_hr_speed'] = worst['slowest_hr_speed']
+        df_out['congratio_worsthr'] = worst['slowest_hr_speed'] / ff_speed
+
+        #---------epoch counts---------
+        for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+            df_out[f"epochs_{prd_name}"] = np.where(has_data, prd_epochs[:, prd_code], np.nan)
+        df_out['epochs_worst4hrs'] = worst['epochs_worst4hrs']
+        df_out['epochs_slowest_hr'] = worst['epochs_slowest_hr']
+        epochs_night = grouped_counts(tmc_idx[is_night], n_tmc)
+        df_out['epochs_night'] = np.where(epochs_night > 0, epochs_night, np.nan)
+
+        df_out = df_out.fillna(-1)
+        int_cols = ['slowest_hr'] + [c for c in df_out.columns if c.startswith('epochs_')]
+        df_out[int_cols] = df_out[int_cols].astype(int)
+
+        return df_out
+
+    def run(self):
+        '''Reads travel time data and returns dataframe of PPA 2.0 metrics for each TMC'''
+        start_time = time.perf_counter()
+
+        print(f"reading travel time data from {self.tt_data.tt_source}...")
+        epochs = self.read_epochs()
+
+        print("calculating metrics...")
+        df_out = self.calc_metrics(epochs)
+
+        if self.epoch_filter:
+            df_out['epochs_dropped'] = self.epoch_filter.drop_report()['dropped_total'].values
+            print(f"{df_out['epochs_dropped'].sum()} epochs dropped by epoch filter")
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"metrics calculated for {len(df_out)} TMCs in {elapsed_time}mins")
+
+        return df_out
+
+
+def compare_to_sql(df_py, df_sql, tol=0.01):
+    '''Compares PPA2Metrics.run() output with output of PPA2_NPMRDS_metrics_latest.sql, for every
+    numeric column in both. Returns dataframe with, for each column, the number of TMCs compared,
+    number of TMCs whose values differ by more than tol, and largest difference.
+    PARAMETERS:
+        df_py (dataframe) = output of PPA2Metrics.run()
+        df_sql (dataframe) = output of SQL script, e.g. read from CSV export
+        tol (float) = largest difference counted as a match
+    '''
+    col_tmc = ttd.COL_SPEC_TMC
+    df_sql = df_sql.assign(**{col_tmc: df_sql[col_tmc].astype(str)})
+    df_comp = df_py.merge(df_sql, on=col_tmc, suffixes=('_py', '_sql'))
+
+    num_cols = [c for c in df_py.select_dtypes('number').columns if c in df_sql.columns and c != col_tmc]
+
+    comp_rows = []
+    for col in num_cols:
+        diff = (df_comp[f"{col}_py"] - df_comp[f"{col}_sql"]).abs()
+        comp_rows.append({'column': col, 'tmcs_compared': len(diff),
+                          'tmcs_over_tol': (diff > tol).sum(), 'max_abs_diff': diff.max()})
+
+    return pd.DataFrame(comp_rows)
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_npmrds_metrics_2023.csv"
+
+    # optional: CSV export of PPA2_NPMRDS_metrics_latest.sql output to check results against
+    sql_output_csv = None
+
+    #=================RUN SCRIPT===========================
+    df_metrics = PPA2Metrics(tt_table, spec_table).run()
+    df_metrics.to_csv(output_csv, index=False)
+
+    if sql_output_csv:
+        df_check = compare_to_sql(df_metrics, pd.read_csv(sql_output_csv))
+        print(df_check)
@@ -0,0 +1,323 @@
+"""
+Name: ppa2_sql_generator.py
+Purpose: Generates a SQL Server query that returns the same table as
+    npmrds-projline-conflate/PPA2_NPMRDS_metrics_latest.sql, for any year, TMC extent and
+    vehicle type, without hand-editing table names.
+
+    The hand-written script scans the travel time table once per period and once more for each
+    of the epoch counts, free-flow speed, speed by hour, worst-4-hour and slowest-hour steps.
+    The generated query tags each epoch with a period code and scans the travel time table
+    once, computing the percentiles for every period in one windowed pass partitioned by
+    TMC and period. That pass is aggregated to a small TMC x period x hour-of-day table, and
+    all remaining steps run against that small table.
+
+    Periods and parameters come from ppa2_metrics.PPA2Params, so the generated SQL and the
+    python engine in ppa2_metrics.py use the same definitions. If calendar_tbl is given, each
+    epoch's period, hour and weekday flag come from a calendar table made by epoch_calendar.py,
+    joined on integer epoch ID. Otherwise they are worked out on each row, with day of week from
+    DATEDIFF(dd, 0, <timestamp>) % 7 (0 = Monday) instead of DATENAME, so the query does not
+    depend on the server's language setting.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import datetime as dt
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from epoch_calendar import hour_of_week_prd_codes, EPOCH_MINS
+
+
+class PPA2SQLGenerator():
+    def __init__(self, data_year, tmc_extent='all', vehtype='all', params=None, db_name='NPMRDS',
+                 tbl_name_addl='', calendar_tbl=None):
+        '''
+        PARAMETERS:
+            data_year (int) = year of data
+            tmc_extent (string) = 'all' or 'nhs'
+            vehtype (string) = 'all', 'passenger', or 'truck'
+            params (PPA2Params) = metric parameters. Default is PPA2Params()
+            db_name (string) = database the query runs in
+            tbl_name_addl (string) = additional text that was put in travel time table name when loading, if any
+            calendar_tbl (string) = optional calendar table made by EpochCalendar.to_sql_table() for data_year,
+                with the same params
+        '''
+        self.data_year = data_year
+        self.tmc_extent = tmc_extent
+        self.vehtype = vehtype
+        self.db_name = db_name
+        self.calendar_tbl = calendar_tbl
+        self.params = params if params else PPA2Params()
+
+        self.tt_table, self.spec_table = ttd.npmrds_table_names(data_year, tmc_extent, vehtype, tbl_name_addl)
+
+        # period code for overnight free-flow period comes after the reliability period codes
+        self.prd_code_ff = len(self.params.rel_periods) + 1
+
+    def check_periods(self):
+        '''Each epoch can only have one period code, so the free-flow period cannot overlap
+        any reliability period'''
+        hour_of_week_prd_codes(self.params)
+
+    def period_case_sql(self):
+        '''CASE expression giving period code from day of week (dow, 0 = Monday) and hour of day (hr)'''
+        p = self.params
+
+        case_lines = []
+        for prd_code, (prd_name, (hr_start, hr_end, days)) in enumerate(p.rel_periods.items(), start=1):
+            str_days = ', '.join(str(d) for d in days)
+            case_lines.append(f"\t\t\tWHEN dow IN ({str_days}) AND hr >= {hr_start} AND hr < {hr_end} " \
+                              f"THEN {prd_code} --{prd_name}")
+        case_lines.append(f"\t\t\tWHEN hr >= {p.ff_prd_start} OR hr < {p.ff_prd_end} " \
+                          f"THEN {self.prd_code_ff} --overnight free-flow")
+
+        return "CASE\n{}\n\t\t\tELSE 0 END".format('\n'.join(case_lines))
+
+    def epochs_from_sql(self):
+        '''FROM clause of the epochs CTE. Gives each travel time row a cal.hr, cal.is_wkdy and cal.prd_code.'''
+        if self.calendar_tbl:
+            return f"""FROM {self.tt_table} tt
+		JOIN (SELECT epoch_id, hr, CAST(is_weekday AS int) AS is_wkdy, prd_code FROM {self.calendar_tbl}) cal
+			ON cal.epoch_id = DATEDIFF(mi, '{self.data_year}-01-01', tt.measurement_tstamp) / {EPOCH_MINS}"""
+
+        str_weekdays = ', '.join(str(d) for d in self.params.weekdays)
+        return f"""FROM {self.tt_table} tt
+		CROSS APPLY (SELECT
+			DATEDIFF(dd, 0, tt.measurement_tstamp) % 7 AS dow, --0 = Monday, regardless of language settings
+			DATEPART(hh, tt.measurement_tstamp) AS hr
+			) dh
+		CROSS APPLY (SELECT
+			dh.hr,
+			CASE WHEN dh.dow IN ({str_weekdays}) THEN 1 ELSE 0 END AS is_wkdy,
+			{self.period_case_sql()} AS prd_code
+			) cal"""
+
+    def make_sql(self):
+        '''Returns string of the full SQL query'''
+        self.check_periods()
+        p = self.params
+
+        str_fwy_fsys = ', '.join(str(f) for f in p.fwy_fsystems)
+        ff_pctls = {'spd_fwy': p.ff_pctl_fwy}
+        ff_pctls.update({f"spd_{col}": pctl for col, pctl in p.ff_pctls_art.items()})
+
+        # percentile columns from the single windowed pass
+        pctl_window_lines = [
+            "\t\tPERCENTILE_CONT(@PctlCongested) WITHIN GROUP (ORDER BY travel_time_seconds)\n" \
+            "\t\t\tOVER (PARTITION BY tmc_code, prd) AS tt_pctl_cong",
+            "\t\tPERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY travel_time_seconds)\n" \
+            "\t\t\tOVER (PARTITION BY tmc_code, prd) AS tt_p50"]
+        for col, pctl in ff_pctls.items():
+            pctl_window_lines.append(f"\t\tPERCENTILE_CONT({pctl}) WITHIN GROUP (ORDER BY speed)\n" \
+                                     f"\t\t\tOVER (PARTITION BY tmc_code, prd) AS {col}")
+        str_pctl_windows = ',\n'.join(pctl_window_lines)
+        str_pctl_maxes = ',\n'.join([f"\tMAX({c}) AS {c}" for c in ['tt_pctl_cong', 'tt_p50'] + list(ff_pctls)])
+
+        # one row per TMC with each reliability period's percentiles and epoch counts
+        prd_pivot_lines = []
+        for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+            prd_pivot_lines += [
+                f"\tMAX(CASE WHEN prd = {prd_code} THEN tt_pctl_cong END) AS tt_p80_{prd_name}",
+                f"\tMAX(CASE WHEN prd = {prd_code} THEN tt_p50 END) AS tt_p50_{prd_name}",
+                f"\tSUM(CASE WHEN prd = {prd_code} THEN epochs ELSE 0 END) AS epochs_{prd_name}"]
+        prd_pivot_lines += [f"\tSUM(CASE WHEN prd = {self.prd_code_ff} THEN epochs ELSE 0 END) AS epochs_night_all"]
+        str_prd_pivot = ',\n'.join(prd_pivot_lines)
+
+        ff_lines = [f"\tMAX(CASE WHEN spec.f_system IN ({str_fwy_fsys}) THEN x.spd_fwy ELSE x.spd_{col} END) AS {col}"
+                    for col in p.ff_pctls_art]
+        str_ff = ',\n'.join(ff_lines)
+
+        # final select, in same column order as PPA2_NPMRDS_metrics_latest.sql
+        final_lines = []
+        for prd_name in p.rel_periods:
+            final_lines += [f"\tISNULL(prd.tt_p80_{prd_name}, -1.0) AS tt_p80_{prd_name}",
+                            f"\tISNULL(prd.tt_p50_{prd_name}, -1.0) AS tt_p50_{prd_name}"]
+        for prd_name in p.rel_periods:
+            final_lines.append(f"\tISNULL(prd.tt_p80_{prd_name} / NULLIF(prd.tt_p50_{prd_name}, 0), -1.0) " \
+                               f"AS {p.lottr_cols[prd_name]}")
+        for col in p.ff_pctls_art:
+            final_lines.append(f"\tISNULL(ff.{col}, -1.0) AS {col}")
+        ffc = f"ff.{p.ff_col_congratio}"
+        final_lines += [
+            "\tISNULL(w4.havg_spd_worst4hrs, -1.0) AS havg_spd_worst4hrs",
+            f"\tCASE WHEN w4.havg_spd_worst4hrs / {ffc} IS NULL THEN -1.0\n" \
+            f"\t\tWHEN w4.havg_spd_worst4hrs / {ffc} > 1 THEN 1.0 --overnight speed may not be fastest if there are few overnight data\n" \
+            f"\t\tELSE w4.havg_spd_worst4hrs / {ffc} END AS congratio_worst4hrs",
+            "\tISNULL(s1.hr, -1) AS slowest_hr",
+            "\tISNULL(s1.havg_spd, -1.0) AS slowest_hr_speed",
+            f"\tISNULL(s1.havg_spd / {ffc}, -1.0) AS congratio_worsthr"]
+        for prd_name in p.rel_periods:
+            final_lines.append(f"\tISNULL(prd.epochs_{prd_name}, -1) AS epochs_{prd_name}")
+        final_lines += [
+            "\tISNULL(w4.epochs_worst4hrs, -1) AS epochs_worst4hrs",
+            "\tISNULL(s1.epochs, -1) AS epochs_slowest_hr",
+            "\tISNULL(NULLIF(prd.epochs_night_all, 0), -1) AS epochs_night"]
+        str_final = ',\n'.join(final_lines)
+
+        sql = f"""/*
+Name: PPA2_NPMRDS_metrics_{self.data_year}_{self.tmc_extent}tmc_{self.vehtype}.sql
+Purpose: Get data for each TMC for PPA 2.0 calcs. Same output as PPA2_NPMRDS_metrics_latest.sql,
+	but scans the travel time table only once.
+
+	**GENERATED BY ppa2_sql_generator.py ON {dt.date.today()}. EDIT PARAMETERS THERE, NOT HERE.**
+
+Travel time table: {self.tt_table}
+TMC spec table: {self.spec_table}
+Calendar table: {self.calendar_tbl if self.calendar_tbl else 'none, periods worked out on each row'}
+SQL Flavor: SQL Server
+*/
+
+USE {self.db_name}
+GO
+
+--"bad" travel time percentile
+DECLARE @PctlCongested FLOAT SET @PctlCongested = {p.pctl_congested}
+DECLARE @MinEpochsHr INT SET @MinEpochsHr = {p.min_epochs_hr} --weekday hours with fewer epochs are not ranked
+;
+
+--===========SINGLE PASS OVER TRAVEL TIME TABLE==============================
+--period codes: {', '.join(f"{i} = {n}" for i, n in enumerate(p.rel_periods, start=1))}, {self.prd_code_ff} = overnight free-flow, 0 = none
+WITH epochs AS (
+	SELECT
+		tt.tmc_code,
+		cal.hr,
+		cal.is_wkdy,
+		cal.prd_code AS prd,
+		tt.travel_time_seconds,
+		tt.speed
+	{self.epochs_from_sql()}
+),
+
+pctls AS (
+	SELECT
+		tmc_code, prd, is_wkdy, hr, travel_time_seconds, speed,
+{str_pctl_windows}
+	FROM epochs
+)
+
+--percentiles are the same for every row in a TMC and period, so MAX() just carries them through
+SELECT
+	tmc_code, prd, is_wkdy, hr,
+{str_pctl_maxes},
+	COUNT(*) AS epochs,
+	SUM(CASE WHEN speed > 0 THEN 1 ELSE 0 END) AS epochs_spd,
+	SUM(CASE WHEN speed > 0 THEN 1.0 / speed END) AS inv_spd
+INTO #tmc_prd_hr
+FROM pctls
+GROUP BY tmc_code, prd, is_wkdy, hr
+
+
+--===========METRICS FROM SMALL TMC x PERIOD x HOUR TABLE==============================
+
+--percentiles and epoch counts for each reliability period
+SELECT
+	tmc_code,
+{str_prd_pivot}
+INTO #prd_metrics
+FROM #tmc_prd_hr
+GROUP BY tmc_code
+
+--free-flow speed
+SELECT
+	x.tmc_code,
+{str_ff}
+INTO #ff_spd_tbl
+FROM #tmc_prd_hr x
+	JOIN {self.spec_table} spec
+		ON x.tmc_code = spec.tmc
+WHERE x.prd = {self.prd_code_ff}
+GROUP BY x.tmc_code
+
+--harmonic average speed and congestion ratio for each weekday hour
+SELECT
+	x.tmc_code,
+	x.hr,
+	SUM(x.epochs_spd) AS epochs,
+	SUM(x.inv_spd) AS inv_spd,
+	SUM(x.epochs_spd) / SUM(x.inv_spd) AS havg_spd,
+	RANK() OVER (
+		PARTITION BY x.tmc_code
+		ORDER BY (SUM(x.epochs_spd) / SUM(x.inv_spd)) / MAX(ff.{p.ff_col_congratio}) ASC
+		) AS hour_cong_rank
+INTO #avspd_x_tmc_hour
+FROM #tmc_prd_hr x
+	JOIN #ff_spd_tbl ff
+		ON x.tmc_code = ff.tmc_code
+WHERE x.is_wkdy = 1
+GROUP BY x.tmc_code, x.hr
+HAVING SUM(x.epochs_spd) >= @MinEpochsHr
+
+--worst {p.n_worst_hrs} weekday hours
+SELECT
+	tmc_code,
+	SUM(epochs) AS epochs_worst4hrs,
+	SUM(epochs) / SUM(inv_spd) AS havg_spd_worst4hrs
+INTO #most_congd_hrs
+FROM #avspd_x_tmc_hour
+WHERE hour_cong_rank <= {p.n_worst_hrs}
+GROUP BY tmc_code
+
+--slowest weekday hour; if hours tie, earliest hour is used
+SELECT tmc_code, hr, havg_spd, epochs
+INTO #slowest_hr
+FROM (
+	SELECT
+		tmc_code, hr, havg_spd, epochs,
+		ROW_NUMBER() OVER (PARTITION BY tmc_code ORDER BY hr) AS hr_n
+	FROM #avspd_x_tmc_hour
+	WHERE hour_cong_rank = 1
+	) s
+WHERE hr_n = 1
+
+
+--=========COMBINE ALL TOGETHER FOR FINAL TABLE==================================
+SELECT
+	spec.tmc,
+	spec.road,
+	spec.route_numb,
+	spec.f_system,
+	spec.nhs,
+	spec.miles,
+{str_final}
+FROM {self.spec_table} spec
+	LEFT JOIN #prd_metrics prd
+		ON spec.tmc = prd.tmc_code
+	LEFT JOIN #ff_spd_tbl ff
+		ON spec.tmc = ff.tmc_code
+	LEFT JOIN #most_congd_hrs w4
+		ON spec.tmc = w4.tmc_code
+	LEFT JOIN #slowest_hr s1
+		ON spec.tmc = s1.tmc_code
+
+
+DROP TABLE #tmc_prd_hr
+DROP TABLE #prd_metrics
+DROP TABLE #ff_spd_tbl
+DROP TABLE #avspd_x_tmc_hour
+DROP TABLE #most_congd_hrs
+DROP TABLE #slowest_hr
+"""
+        return sql
+
+    def write_sql(self, out_sql_file):
+        '''Writes generated query to a .sql file'''
+        with open(out_sql_file, 'w') as f_out:
+            f_out.write(self.make_sql())
+        print(f"wrote query for {self.tt_table} to {out_sql_file}")
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    year = 2023
+    tmc_extent = 'all' # 'all' or 'nhs'
+    vehicle_type = 'all' # 'all', 'passenger', or 'truck'
+    calendar_table = None # e.g. 'npmrds_calendar_2023', made by epoch_calendar.py
+    output_sql_file = rf"P:\NPMRDS data\PPA2\PPA2_NPMRDS_metrics_{year}.sql"
+
+    #=================RUN SCRIPT===========================
+    PPA2SQLGenerator(year, tmc_extent, vehicle_type, calendar_tbl=calendar_table).write_sql(output_sql_file)
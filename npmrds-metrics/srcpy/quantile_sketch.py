@@ -0,0 +1,330 @@
+"""
+Name: quantile_sketch.py
+Purpose: Mergeable quantile sketches of travel time and speed for each TMC x period, stored
+    one file per month, so that annual (or any range of months) LOTTRs and free-flow speeds
+    come from merging a few small files instead of re-sorting a full year of epochs.
+
+    Each sketch is a histogram with log-spaced bins: bin i holds values between
+    gamma^(i-1) and gamma^i, where gamma = (1 + alpha) / (1 - alpha). Only non-empty bins are
+    stored. Merging sketches is adding their bin counts, so months can be combined in any order.
+
+    ERROR BOUNDS:
+    Each value is stood in for by its bin's representative value, 2 * gamma^i / (gamma + 1),
+    which is within a relative error of alpha of every value in the bin. Percentiles are then
+    interpolated between the two closest ranks, the same way as PERCENTILE_CONT, so:
+        -any percentile is within alpha (relative) of the exact PERCENTILE_CONT value
+        -a ratio of two percentiles (e.g. LOTTR = p80 / p50) is within
+            (1 + alpha) / (1 - alpha) - 1, about 2 * alpha, of the exact ratio
+        -epoch counts are exact. Each sketch also stores the number of rows for each TMC x period,
+            including rows with no travel time or speed, so epochs_<prd> counts rows the same way as
+            PPA2Metrics and the SQL script.
+    With the default alpha of 0.005, percentiles are within 0.5% and LOTTRs within about 1%
+    (e.g. +/-0.01 on a LOTTR of 1.0; +/-0.3 seconds on a 60-second travel time).
+    The bounds only hold for values between MIN_VAL and MAX_VAL; values outside that range are
+    put in the lowest or highest bin.
+
+    Periods are the period codes from epoch_calendar.py: the PPA2Params reliability periods, plus
+    an overnight free-flow period. Use compare_to_sql() in ppa2_metrics.py to check sketch_metrics()
+    output against exact values.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import glob
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from epoch_calendar import EpochCalendar
+
+
+SKETCH_ALPHA = 0.005 # relative error of each percentile
+MIN_VAL = 0.1 # smallest value with error bound; smaller values go in lowest bin
+MAX_VAL = 100000.0 # largest value with error bound; larger values go in highest bin
+SKETCH_EXT = '.npz'
+SKETCH_MEASURES = {'tt': ttd.COL_TT, 'speed': ttd.COL_SPEED}
+ROWS_KEY = 'rows' # row counts are stored like a measure, with every row in bin 0
+SKETCH_KEYS = list(SKETCH_MEASURES) + [ROWS_KEY]
+
+
+class SketchSet():
+    def __init__(self, tmcs, n_prd_codes, bins, alpha=SKETCH_ALPHA):
+        '''Histogram sketches for every TMC x period, for each measure in SKETCH_MEASURES, plus row counts.
+        Usually made with build_monthly_sketches(), SketchSet.load() or SketchSet.merge().
+        PARAMETERS:
+            tmcs (array) = TMC codes. Group ID of a TMC x period is tmc position * n_prd_codes + period code.
+            n_prd_codes (int) = number of period codes, including 0
+            bins (dict) = {measure: (group IDs, bin numbers, counts)}, with one entry per non-empty bin, for
+                each key in SKETCH_KEYS
+            alpha (float) = relative error of each percentile
+        '''
+        self.tmcs = np.asarray(tmcs).astype(str)
+        self.n_prd_codes = n_prd_codes
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.bins = {measure: sum_bins(*bin_arrays) for measure, bin_arrays in bins.items()}
+
+    def save(self, out_path):
+        arrays = {'tmcs': self.tmcs, 'n_prd_codes': self.n_prd_codes, 'alpha': self.alpha}
+        for measure, (groups, bin_nums, counts) in self.bins.items():
+            arrays.update({f"{measure}_groups": groups, f"{measure}_bins": bin_nums, f"{measure}_counts": counts})
+
+        np.savez_compressed(out_path, **arrays)
+
+    @classmethod
+    def load(cls, sketch_path):
+        with np.load(sketch_path) as f_in:
+            if f"{ROWS_KEY}_groups" not in f_in:
+                raise Exception(f"{sketch_path} has no row counts. Rebuild it with build_monthly_sketches().")
+            bins = {measure: (f_in[f"{measure}_groups"], f_in[f"{measure}_bins"], f_in[f"{measure}_counts"])
+                    for measure in SKETCH_KEYS}
+            return cls(f_in['tmcs'], int(f_in['n_prd_codes']), bins, float(f_in['alpha']))
+
+    @classmethod
+    def merge(cls, sketch_sets):
+        '''Returns one SketchSet combining all epochs in sketch_sets (e.g. twelve months). TMC lists
+        do not need to match; the merged set has every TMC in any of them.'''
+        if len(sketch_sets) == 0:
+            raise Exception("No sketches to merge. Check that the sketch files being combined exist.")
+
+        n_prd_codes = sketch_sets[0].n_prd_codes
+        alpha = sketch_sets[0].alpha
+        if any(s.n_prd_codes != n_prd_codes or s.alpha != alpha for s in sketch_sets):
+            raise Exception("Can only merge sketches made with the same periods and alpha.")
+
+        tmcs = pd.Index(np.unique(np.concatenate([s.tmcs for s in sketch_sets])))
+
+        bins = {}
+        for measure in SKETCH_KEYS:
+            parts = []
+            for s in sketch_sets:
+                groups, bin_nums, counts = s.bins[measure]
+                new_tmc_pos = tmcs.get_indexer(s.tmcs)[groups // n_prd_codes]
+                parts.append((new_tmc_pos * n_prd_codes + groups % n_prd_codes, bin_nums, counts))
+
+            bins[measure] = tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+        return cls(tmcs.values, n_prd_codes, bins, alpha)
+
+    def bin_values(self, bin_nums):
+        '''Representative value of each bin'''
+        return 2 * self.gamma ** bin_nums.astype(np.float64) / (self.gamma + 1)
+
+    def counts(self, measure=ROWS_KEY):
+        '''Array of epoch counts, shape (number of TMCs, n_prd_codes). Default is all rows; a measure in
+        SKETCH_MEASURES gives the number of rows with a value for that measure.'''
+        groups, bin_nums, counts = self.bins[measure]
+        n_groups = len(self.tmcs) * self.n_prd_codes
+        return np.bincount(groups, weights=counts, minlength=n_groups).astype(np.int64) \
+            .reshape(len(self.tmcs), self.n_prd_codes)
+
+    def percentiles(self, measure, pctls, prd_codes=None):
+        '''Percentiles of measure for each TMC x period, interpolated between the closest ranks like
+        PERCENTILE_CONT. Returns array of shape (len(pctls), number of TMCs, n_prd_codes), or
+        (len(pctls), number of TMCs) if prd_codes is given, in which case the periods in prd_codes are
+        combined (e.g. all overnight and peak periods together). Groups with no epochs are NaN.'''
+        groups, bin_nums, counts = self.bins[measure]
+        n_tmcs = len(self.tmcs)
+
+        if prd_codes is not None:
+            in_prds = np.isin(groups % self.n_prd_codes, prd_codes)
+            groups, bin_nums, counts = sum_bins(groups[in_prds] // self.n_prd_codes, bin_nums[in_prds],
+                                                counts[in_prds])
+            out_shape = (len(pctls), n_tmcs)
+        else:
+            out_shape = (len(pctls), n_tmcs, self.n_prd_codes)
+        n_groups = int(np.prod(out_shape[1:]))
+
+        # bins are sorted by group then bin, so cumulative counts give each bin's last rank
+        cum_counts = np.cumsum(counts)
+        group_n = np.bincount(groups, weights=counts, minlength=n_groups).astype(np.int64)
+        group_start = np.cumsum(group_n) - group_n
+        has_data = group_n > 0
+        n = group_n[has_data]
+        start = group_start[has_data]
+        values = self.bin_values(bin_nums)
+
+        out = np.full((len(pctls), n_groups), np.nan)
+        for i, pctl in enumerate(pctls):
+            pos = pctl * (n - 1)
+            pos_lo = np.floor(pos).astype(np.int64)
+            pos_hi = np.ceil(pos).astype(np.int64)
+            val_lo = values[np.searchsorted(cum_counts, start + pos_lo, side='right')]
+            val_hi = values[np.searchsorted(cum_counts, start + pos_hi, side='right')]
+            out[i, has_data] = val_lo + (pos - pos_lo) * (val_hi - val_lo)
+
+        return out.reshape(out_shape)
+
+
+def value_bins(values, alpha=SKETCH_ALPHA):
+    '''Bin number of each value. Bin i holds values from gamma^(i-1) to gamma^i.'''
+    gamma = (1 + alpha) / (1 - alpha)
+    values = np.clip(values.astype(np.float64), MIN_VAL, MAX_VAL)
+    return np.ceil(np.log(values) / np.log(gamma)).astype(np.int16)
+
+
+def sum_bins(groups, bin_nums, counts):
+    '''Adds up counts for each group and bin. Returns (groups, bins, counts) sorted by group then bin.'''
+    groups = np.asarray(groups, dtype=np.int64)
+    bin_nums = np.asarray(bin_nums, dtype=np.int16)
+    if len(groups) == 0:
+        return groups, bin_nums, np.asarray(counts, dtype=np.int64)
+
+    # bin numbers can be negative for values under 1, so shift them to make a sortable key
+    bin_offset = int(bin_nums.min())
+    bin_range = int(bin_nums.max()) - bin_offset + 1
+    keys, key_idx = np.unique(groups * bin_range + (bin_nums - bin_offset), return_inverse=True)
+    key_counts = np.bincount(key_idx.ravel(), weights=counts).astype(np.int64)
+
+    return keys // bin_range, (keys % bin_range + bin_offset).astype(np.int16), key_counts
+
+
+def build_monthly_sketches(tt_source, out_dir, params=None, alpha=SKETCH_ALPHA, svr_name='SQL-SVR',
+                           db_name='NPMRDS', chunk_rows=5000000, calendar=None):
+    '''Reads travel time data once and writes one SketchSet file per month to out_dir, named
+    <tt_source name>_<yyyy-mm>.npz. Returns list of files written.
+    PARAMETERS:
+        tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+        out_dir (string) = folder to write sketch files to
+        params (PPA2Params) = gives periods to sketch. Default is PPA2Params()
+        alpha (float) = relative error of each percentile
+        calendar (EpochCalendar) = gives each epoch's period. Default is a calendar for the year of
+            the first travel time rows read, made with params.
+    '''
+    start_time = time.perf_counter()
+    params = params if params else PPA2Params()
+    n_prd_codes = len(params.rel_periods) + 2
+
+    tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+    tmcs = pd.Index([])
+    month_parts = {} # {month: {sketch key: [(groups, bins, counts) for each chunk]}}
+
+    print(f"reading travel time data from {tt_source}...")
+    rows_read = 0
+    for df in tt_data.iter_chunks():
+        # TMCs get their position in the order they are first seen
+        tmcs = tmcs.append(pd.Index(df[ttd.COL_TMC].unique()).difference(tmcs))
+        if calendar is None:
+            calendar = EpochCalendar.for_tstamps(df[ttd.COL_TSTAMP].values, params)
+        groups = tmcs.get_indexer(df[ttd.COL_TMC]).astype(np.int64) * n_prd_codes \
+            + calendar.prd_code[calendar.epoch_index(df[ttd.COL_TSTAMP].values)]
+        months = df[ttd.COL_TSTAMP].values.astype('datetime64[M]')
+
+        for month in np.unique(months):
+            in_month = months == month
+            parts = month_parts.setdefault(month, {k: [] for k in SKETCH_KEYS})
+            parts[ROWS_KEY].append(sum_bins(groups[in_month], np.zeros(in_month.sum()), np.ones(in_month.sum())))
+            for measure, col in SKETCH_MEASURES.items():
+                values = df[col].values[in_month]
+                has_val = ~np.isnan(values)
+                chunk_bins = sum_bins(groups[in_month][has_val], value_bins(values[has_val], alpha),
+                                      np.ones(has_val.sum()))
+                parts[measure].append(chunk_bins)
+
+        rows_read += len(df)
+        print(f"\t{rows_read} rows read...")
+
+    tt_name = os.path.splitext(os.path.basename(tt_source))[0]
+    out_files = []
+    for month, measure_parts in sorted(month_parts.items()):
+        bins = {measure: tuple(np.concatenate(arrays) for arrays in zip(*parts))
+                for measure, parts in measure_parts.items()}
+        out_path = os.path.join(out_dir, f"{tt_name}_{month}{SKETCH_EXT}")
+        SketchSet(tmcs.values, n_prd_codes, bins, alpha).save(out_path)
+        out_files.append(out_path)
+
+    elapsed_time = round((time.perf_counter() - start_time)/60,1)
+    print(f"wrote {len(out_files)} monthly sketch files to {out_dir} in {elapsed_time}mins")
+
+    return out_files
+
+
+def load_months(sketch_dir, tt_name, months=None):
+    '''Loads and merges monthly sketch files for a travel time table.
+    PARAMETERS:
+        sketch_dir (string) = folder with sketch files
+        tt_name (string) = travel time table name (or raw CSV name without extension) sketches were made from
+        months (list) = optional list of months to merge, as 'yyyy-mm' strings (e.g. ['2023-06', '2023-07']).
+            Default is all months in sketch_dir for tt_name.
+    '''
+    if months:
+        sketch_files = [os.path.join(sketch_dir, f"{tt_name}_{month}{SKETCH_EXT}") for month in months]
+    else:
+        sketch_files = sorted(glob.glob(os.path.join(sketch_dir, f"{tt_name}_????-??{SKETCH_EXT}")))
+
+    return SketchSet.merge([SketchSet.load(f) for f in sketch_files])
+
+
+def sketch_metrics(sketch_set, spec, params=None):
+    '''Returns dataframe of travel time percentiles, LOTTRs, free-flow speeds and period epoch counts for
+    each TMC in spec, with the same column names as PPA2Metrics.run() output.
+    PARAMETERS:
+        sketch_set (SketchSet) = sketches to get metrics from, e.g. from load_months()
+        spec (dataframe) = TMC spec data with tmc and f_system columns (see tt_data.load_tmc_spec)
+        params (PPA2Params) = must have same periods as params the sketches were built with
+    '''
+    p = params if params else PPA2Params()
+    prd_code_ff = len(p.rel_periods) + 1
+
+    df_out = spec.copy()
+    tmc_pos = pd.Index(sketch_set.tmcs).get_indexer(df_out[ttd.COL_SPEC_TMC].astype(str))
+    in_sketch = tmc_pos >= 0
+
+    def by_spec_tmc(arr):
+        out = np.full(len(df_out), np.nan)
+        out[in_sketch] = arr[tmc_pos[in_sketch]]
+        return out
+
+    tt_pctls = sketch_set.percentiles('tt', [p.pctl_congested, 0.5])
+    for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+        df_out[f"tt_p80_{prd_name}"] = by_spec_tmc(tt_pctls[0, :, prd_code])
+        df_out[f"tt_p50_{prd_name}"] = by_spec_tmc(tt_pctls[1, :, prd_code])
+
+    for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+        df_out[p.lottr_cols[prd_name]] = by_spec_tmc(tt_pctls[0, :, prd_code] / tt_pctls[1, :, prd_code])
+
+    ff_pctls = [p.ff_pctl_fwy] + list(p.ff_pctls_art.values())
+    ff_spds = sketch_set.percentiles('speed', ff_pctls)[:, :, prd_code_ff]
+    is_fwy = df_out['f_system'].isin(p.fwy_fsystems).values
+    for i, ff_col in enumerate(p.ff_pctls_art, start=1):
+        df_out[ff_col] = np.where(is_fwy, by_spec_tmc(ff_spds[0]), by_spec_tmc(ff_spds[i]))
+
+    prd_epochs = sketch_set.counts()
+    for prd_code, prd_name in enumerate(p.rel_periods, start=1):
+        df_out[f"epochs_{prd_name}"] = by_spec_tmc(prd_epochs[:, prd_code])
+    df_out['epochs_night'] = by_spec_tmc(np.where(prd_epochs[:, prd_code_ff] > 0, prd_epochs[:, prd_code_ff], np.nan))
+
+    df_out = df_out.fillna(-1)
+    int_cols = [c for c in df_out.columns if c.startswith('epochs_')]
+    df_out[int_cols] = df_out[int_cols].astype(int)
+
+    return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    sketch_dir = r"P:\NPMRDS data\Sketches"
+    output_csv = r"P:\NPMRDS data\PPA2\ppa2_sketch_metrics_2023.csv"
+
+    build_sketches = True # if False, uses sketch files already in sketch_dir
+    months = None # e.g. ['2023-06', '2023-07', '2023-08'] for summer only; None for all months
+
+    #=================RUN SCRIPT===========================
+    if build_sketches:
+        build_monthly_sketches(tt_table, sketch_dir)
+
+    tt_name = os.path.splitext(os.path.basename(tt_table))[0]
+    sketches = load_months(sketch_dir, tt_name, months)
+    df_spec = ttd.load_tmc_spec(spec_table, cols=[ttd.COL_SPEC_TMC, 'road', 'route_numb', 'f_system', 'nhs', 'miles'])
+    sketch_metrics(sketches, df_spec).to_csv(output_csv, index=False)
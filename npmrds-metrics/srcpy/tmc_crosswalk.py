@@ -0,0 +1,256 @@
+"""
+Name: tmc_crosswalk.py
+Purpose: Crosswalk between the TMCs of two NPMRDS vintages (e.g. npmrds_2022_alltmc_txt and
+    npmrds_2023_alltmc_txt), for tracking locations across years when TMCs are re-segmented.
+
+    Each TMC is treated as a straight line from its start to its end coordinates (the only geometry in the
+    TMC spec table; see create_tmc_spec_tables.sql), projected to miles. A base-year TMC and a comparison-year
+    TMC match where:
+        -they have the same direction and road name (ignoring case, spaces and punctuation)
+        -their headings are within max_angle degrees of each other
+        -both ends of the comparison TMC are within max_offset_mi of the base TMC's line
+        -the comparison TMC, projected onto the base TMC's line, overlaps it
+    Candidate pairs come from an R-tree of the base TMCs' bounding boxes, bulk-loaded with the
+    sort-tile-recursive (STR) method and queried for all comparison TMCs at once, one tree level at a time,
+    so a statewide crosswalk only checks nearby pairs.
+
+    Output has one row per overlapping pair, so a comparison TMC can match many base TMCs and vice versa:
+        tmc_base, tmc_comp
+        overlap_mi - length of overlap, in road miles (share_of_base x base TMC's miles)
+        weight - share of the comparison TMC's length overlapped by the base TMC. Used by
+            yoy_compare.apply_crosswalk() to map base-year values onto comparison-year TMCs.
+        share_of_base - share of the base TMC's length overlapped by the comparison TMC
+        same_code, same_tmclinear - 1 if the two TMCs have the same tmc code / tmclinear ID
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+
+
+MI_PER_DEG_LAT = 69.0
+SPEC_COLS = [ttd.COL_SPEC_TMC, 'road', 'direction', 'tmclinear', 'miles', 'start_latitude', 'start_longitude',
+             'end_latitude', 'end_longitude']
+
+
+class STRTree():
+    def __init__(self, bboxes, node_size=16):
+        '''R-tree of bounding boxes, bulk-loaded with sort-tile-recursive packing. Children of node i on
+        one level are nodes i * node_size to (i + 1) * node_size - 1 on the level below, so no child lists are stored.
+        PARAMETERS:
+            bboxes (array) = shape (n, 4) array of min x, min y, max x, max y for each item. Items with NaN
+                coordinates are kept but never returned by queries.
+            node_size (int) = max children per node
+        '''
+        self.node_size = node_size
+        n_items = len(bboxes)
+
+        # STR order: sort by x center into vertical slices, then by y center within each slice
+        n_leaves = -(-n_items // node_size)
+        n_slices = max(int(np.ceil(np.sqrt(n_leaves))), 1)
+        slice_size = n_slices * node_size
+        ctr_x = (bboxes[:, 0] + bboxes[:, 2]) / 2
+        ctr_y = (bboxes[:, 1] + bboxes[:, 3]) / 2
+        by_x = np.argsort(ctr_x, kind='stable')
+        slice_id = np.empty(n_items, dtype=np.int64)
+        slice_id[by_x] = np.arange(n_items) // slice_size
+        self.item_order = np.lexsort((ctr_y, slice_id))
+
+        # levels[0] = item boxes in STR order; each level above holds boxes enclosing node_size boxes below it
+        self.levels = [bboxes[self.item_order]]
+        while len(self.levels[-1]) > 1:
+            lower = self.levels[-1]
+            parent = np.arange(len(lower)) // node_size
+            n_parents = parent[-1] + 1
+            upper = np.empty((n_parents, 4))
+            # fmin/fmax skip NaN boxes (items with missing coordinates), so one NaN item cannot make its
+            # parent and every ancestor NaN, which would hide every other item from every query
+            node_starts = np.arange(0, len(lower), node_size)
+            upper[:, 0] = np.fmin.reduceat(lower[:, 0], node_starts)
+            upper[:, 1] = np.fmin.reduceat(lower[:, 1], node_starts)
+            upper[:, 2] = np.fmax.reduceat(lower[:, 2], node_starts)
+            upper[:, 3] = np.fmax.reduceat(lower[:, 3], node_starts)
+            self.levels.append(upper)
+
+    def query(self, q_bboxes):
+        '''Returns (query index, item index) arrays of every pair whose bounding boxes intersect, for all
+        query boxes at once'''
+        n_queries = len(q_bboxes)
+        if n_queries == 0 or len(self.levels[0]) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        q_idx = np.arange(n_queries)
+        node_idx = np.zeros(n_queries, dtype=np.int64) # start at root
+        for level_num in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[level_num][node_idx]
+            q_boxes = q_bboxes[q_idx]
+            hits = (boxes[:, 0] <= q_boxes[:, 2]) & (boxes[:, 2] >= q_boxes[:, 0]) \
+                & (boxes[:, 1] <= q_boxes[:, 3]) & (boxes[:, 3] >= q_boxes[:, 1])
+            q_idx, node_idx = q_idx[hits], node_idx[hits]
+
+            if level_num > 0:
+                # expand each hit to its children on the level below
+                n_lower = len(self.levels[level_num - 1])
+                q_idx = np.repeat(q_idx, self.node_size)
+                node_idx = (np.repeat(node_idx * self.node_size, self.node_size)
+                            + np.tile(np.arange(self.node_size), len(node_idx)))
+                in_range = node_idx < n_lower
+                q_idx, node_idx = q_idx[in_range], node_idx[in_range]
+
+        return q_idx, self.item_order[node_idx]
+
+
+def norm_text(values):
+    '''Upper case with spaces and punctuation removed, e.g. "I 5" and "I-5" are both "I5"'''
+    return pd.Series(values).fillna('').astype(str).str.upper().str.replace(r'[^A-Z0-9]', '', regex=True).values
+
+
+def tmc_lines(spec, lat0):
+    '''Start and end x, y coordinates in miles for each TMC, projected around latitude lat0'''
+    mi_per_deg_lon = MI_PER_DEG_LAT * np.cos(np.radians(lat0))
+    x0 = spec['start_longitude'].values * mi_per_deg_lon
+    y0 = spec['start_latitude'].values * MI_PER_DEG_LAT
+    x1 = spec['end_longitude'].values * mi_per_deg_lon
+    y1 = spec['end_latitude'].values * MI_PER_DEG_LAT
+
+    return x0, y0, x1, y1
+
+
+def line_no_geom(lines):
+    '''True for each TMC line with a missing coordinate or zero length'''
+    x0, y0, x1, y1 = lines
+    has_nan = np.isnan(x0) | np.isnan(y0) | np.isnan(x1) | np.isnan(y1)
+    with np.errstate(invalid='ignore'):
+        return has_nan | (np.hypot(x1 - x0, y1 - y0) == 0)
+
+
+class TMCCrosswalk():
+    def __init__(self, spec_source_base, spec_source_comp, match_cols=['direction', 'road'], max_offset_mi=0.05,
+                 max_angle=30, min_weight=0.05, svr_name='SQL-SVR', db_name='NPMRDS'):
+        '''
+        PARAMETERS:
+            spec_source_base (string) = base-year TMC spec table name in SQL Server, or path to TMC_Identification.csv
+            spec_source_comp (string) = comparison-year TMC spec table or TMC_Identification.csv
+            match_cols (list) = text columns that must match (after removing case, spaces and punctuation)
+            max_offset_mi (float) = largest distance, in miles, of comparison TMC ends from base TMC line
+            max_angle (float) = largest difference in heading, in degrees
+            min_weight (float) = pairs overlapping less than this share of the comparison TMC are dropped
+        '''
+        self.spec_base = ttd.load_tmc_spec(spec_source_base, svr_name, db_name, cols=SPEC_COLS)
+        self.spec_comp = ttd.load_tmc_spec(spec_source_comp, svr_name, db_name, cols=SPEC_COLS)
+        self.match_cols = match_cols
+        self.max_offset_mi = max_offset_mi
+        self.max_angle = max_angle
+        self.min_weight = min_weight
+
+    def candidate_pairs(self, base_lines, comp_lines):
+        '''(base index, comparison index) arrays of TMC pairs whose bounding boxes, buffered by max_offset_mi,
+        intersect and whose match_cols match'''
+        def bboxes(lines, buffer):
+            x0, y0, x1, y1 = lines
+            return np.column_stack([np.minimum(x0, x1) - buffer, np.minimum(y0, y1) - buffer,
+                                    np.maximum(x0, x1) + buffer, np.maximum(y0, y1) + buffer])
+
+        tree = STRTree(bboxes(base_lines, self.max_offset_mi))
+        comp_idx, base_idx = tree.query(bboxes(comp_lines, 0))
+
+        for col in self.match_cols:
+            is_match = norm_text(self.spec_base[col].values)[base_idx] == norm_text(self.spec_comp[col].values)[comp_idx]
+            base_idx, comp_idx = base_idx[is_match], comp_idx[is_match]
+
+        return base_idx, comp_idx
+
+    def pair_overlaps(self, base_lines, comp_lines, base_idx, comp_idx):
+        '''Overlap length in miles of each candidate pair, along the base TMC's line. 0 if the pair is
+        not parallel enough or too far apart.'''
+        bx0, by0, bx1, by1 = [a[base_idx] for a in base_lines]
+        cx0, cy0, cx1, cy1 = [a[comp_idx] for a in comp_lines]
+
+        base_len = np.hypot(bx1 - bx0, by1 - by0)
+        comp_len = np.hypot(cx1 - cx0, cy1 - cy0)
+        valid = (base_len > 0) & (comp_len > 0)
+        base_len_safe = np.where(valid, base_len, 1)
+        ux, uy = (bx1 - bx0) / base_len_safe, (by1 - by0) / base_len_safe # base unit vector
+
+        cos_angle = ((cx1 - cx0) * ux + (cy1 - cy0) * uy) / np.where(valid, comp_len, 1)
+        is_parallel = cos_angle >= np.cos(np.radians(self.max_angle))
+
+        # position of comparison TMC ends along base line (t) and distance off it (d)
+        t0 = (cx0 - bx0) * ux + (cy0 - by0) * uy
+        t1 = (cx1 - bx0) * ux + (cy1 - by0) * uy
+        d0 = np.abs((cx0 - bx0) * uy - (cy0 - by0) * ux)
+        d1 = np.abs((cx1 - bx0) * uy - (cy1 - by0) * ux)
+        is_close = (d0 <= self.max_offset_mi) & (d1 <= self.max_offset_mi)
+
+        overlap = np.clip(np.minimum(np.maximum(t0, t1), base_len) - np.maximum(np.minimum(t0, t1), 0), 0, None)
+
+        return np.where(valid & is_parallel & is_close, overlap, 0), base_len, comp_len
+
+    def run(self):
+        '''Returns crosswalk dataframe, with one row per overlapping base TMC / comparison TMC pair'''
+        start_time = time.perf_counter()
+        col_tmc = ttd.COL_SPEC_TMC
+
+        lat0 = np.nanmean(np.concatenate([self.spec_base['start_latitude'].values,
+                                          self.spec_comp['start_latitude'].values]))
+        base_lines = tmc_lines(self.spec_base, lat0)
+        comp_lines = tmc_lines(self.spec_comp, lat0)
+
+        base_idx, comp_idx = self.candidate_pairs(base_lines, comp_lines)
+        overlap, base_len, comp_len = self.pair_overlaps(base_lines, comp_lines, base_idx, comp_idx)
+
+        df_out = pd.DataFrame({'tmc_base': self.spec_base[col_tmc].values[base_idx],
+                               'tmc_comp': self.spec_comp[col_tmc].values[comp_idx],
+                               'weight': overlap / np.where(comp_len > 0, comp_len, 1),
+                               'share_of_base': overlap / np.where(base_len > 0, base_len, 1)})
+        df_out.insert(2, 'overlap_mi', df_out['share_of_base'] * self.spec_base['miles'].values[base_idx])
+        df_out['same_code'] = (df_out['tmc_base'] == df_out['tmc_comp']).astype(int)
+        df_out['same_tmclinear'] = (self.spec_base['tmclinear'].values[base_idx]
+                                    == self.spec_comp['tmclinear'].values[comp_idx]).astype(int)
+        df_out = df_out.loc[df_out['weight'] >= self.min_weight].reset_index(drop=True)
+
+        # TMCs with the same code still match each other if either one has no usable geometry (missing
+        # coordinates or zero length). TMCs with geometry that matched nothing are left unmatched.
+        base_no_geom = pd.Series(line_no_geom(base_lines), index=self.spec_base[col_tmc].values)
+        base_no_geom = base_no_geom[~base_no_geom.index.duplicated()]
+        in_base = self.spec_comp[col_tmc].isin(base_no_geom.index).values
+        either_no_geom = line_no_geom(comp_lines) \
+            | self.spec_comp[col_tmc].map(base_no_geom).fillna(False).values.astype(bool)
+        no_geom = ~self.spec_comp[col_tmc].isin(df_out['tmc_comp']).values & in_base & either_no_geom
+        if no_geom.any():
+            tmcs_same = self.spec_comp.loc[no_geom, col_tmc].values
+            df_same = pd.DataFrame({'tmc_base': tmcs_same, 'tmc_comp': tmcs_same, 'overlap_mi': np.nan, 'weight': 1.0,
+                                    'share_of_base': np.nan, 'same_code': 1, 'same_tmclinear': np.nan})
+            df_out = pd.concat([df_out, df_same], ignore_index=True)
+
+        n_unmatched = (~self.spec_comp[col_tmc].isin(df_out['tmc_comp'])).sum()
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"crosswalk of {len(df_out)} TMC pairs built in {elapsed_time}mins. " \
+              f"{n_unmatched} of {len(self.spec_comp)} comparison TMCs have no match.")
+
+        return df_out
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    spec_table_base = 'npmrds_2022_alltmc_txt' # table name or path to TMC_Identification.csv
+    spec_table_comp = 'npmrds_2023_alltmc_txt'
+
+    output_csv = r"P:\NPMRDS data\TMCCrosswalk\tmc_xwalk_2022_2023.csv"
+
+    #=================RUN SCRIPT===========================
+    df_xwalk = TMCCrosswalk(spec_table_base, spec_table_comp).run()
+    df_xwalk.to_csv(output_csv, index=False)
+
+    # use with yoy_compare.py:
+    # YearCompare(years_to_compare, crosswalks={(2022, 2023): df_xwalk}).run()
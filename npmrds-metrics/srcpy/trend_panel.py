@@ -0,0 +1,306 @@
+"""
+Name: trend_panel.py
+Purpose: Monthly panel of TMC metrics across all loaded years (e.g. npmrds_2016_... through
+    npmrds_2023_... tables), for looking at trends without rerunning PPA2 once per year.
+
+    For each TMC and month, and each PPA2 reliability period plus all hours ('all'):
+        epochs, harmonic average speed (havg_spd), 50th and 80th percentile travel times and LOTTR
+    plus the TMC's data completeness for the month (data_compl_pct, observed / possible epochs).
+
+    The panel is built one month at a time and stored as one columnar .npz file per month, named
+    <panel name>_<yyyy-mm>.npz, with one array per column plus the latest timestamp in the month's data
+    (max_tstamp). Building is incremental: months that already have a file are skipped, except a year's
+    latest built month if its data ended before the month's last epoch (it was built from a partial
+    month), so after a new month of data is loaded only that month and the one before it are read.
+    Months after the current month are never built. Raw CSVs are read in one pass, keeping only rows
+    for months that need building. SQL Server tables are read with one query per month when only a few
+    months (max_month_queries or fewer) need building; otherwise the months are read in one query, since
+    the (tmc_code, measurement_tstamp) clustered index cannot seek on a date range and every query scans
+    the table.
+
+    Trend series are NumPy operations on TMC x month matrices, for every TMC at once:
+        -rolling_mean() - trailing rolling average, ignoring months with no data
+        -seasonal_adjust() - classical additive seasonal adjustment: each TMC's average difference from
+            its centered 12-month moving average in each calendar month is subtracted from its series
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import glob
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from group_stats import grouped_percentiles
+from epoch_calendar import EpochCalendar, EPOCH_MINS
+from data_completeness import possible_epochs_hod
+
+
+PANEL_EXT = '.npz'
+PANEL_MEASURES = ['epochs', 'havg_spd', 'tt_p50', 'tt_p80', 'lottr', 'data_compl_pct']
+
+
+def month_stats(tmcs, tmc_idx, prd_codes, speed, tt, params, poss_epochs):
+    '''Returns dict of panel columns for one month, with a row for each TMC x period that has data.
+    PARAMETERS:
+        tmcs (array) = TMC codes; tmc_idx gives each epoch's position in tmcs
+        prd_codes (array) = PPA2 period code of each epoch (see epoch_calendar.hour_of_week_prd_codes)
+        speed, tt (arrays) = speed and travel time of each epoch
+        params (PPA2Params) = gives periods and congested travel time percentile
+        poss_epochs (int) = possible epochs in the month
+    '''
+    n_tmc = len(tmcs)
+    prd_names = list(params.rel_periods) + ['all']
+    n_prd = len(prd_names)
+
+    # period number for each epoch: 0, 1, ... for reliability periods; every epoch is also in 'all'
+    in_rel = (prd_codes >= 1) & (prd_codes <= len(params.rel_periods))
+    grp_rel = tmc_idx[in_rel].astype(np.int64) * n_prd + prd_codes[in_rel] - 1
+    grp_all = tmc_idx.astype(np.int64) * n_prd + n_prd - 1
+    groups = np.concatenate([grp_rel, grp_all])
+    spd = np.concatenate([speed[in_rel], speed]).astype(np.float64)
+    tts = np.concatenate([tt[in_rel], tt]).astype(np.float64)
+
+    n_groups = n_tmc * n_prd
+    epochs = np.bincount(groups, minlength=n_groups)
+    has_spd = spd > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        havg_spd = np.bincount(groups[has_spd], minlength=n_groups) \
+            / np.bincount(groups[has_spd], weights=1 / spd[has_spd], minlength=n_groups)
+    tt_pctls = grouped_percentiles(groups, tts, n_groups, [params.pctl_congested, 0.5])
+
+    tmc_epochs = np.bincount(tmc_idx, minlength=n_tmc)
+    keep = epochs > 0
+
+    return {ttd.COL_SPEC_TMC: np.repeat(np.asarray(tmcs, dtype=str), n_prd)[keep],
+            'period': np.tile(np.array(prd_names), n_tmc)[keep],
+            'epochs': epochs[keep],
+            'havg_spd': havg_spd[keep],
+            'tt_p50': tt_pctls[1][keep],
+            'tt_p80': tt_pctls[0][keep],
+            'lottr': (tt_pctls[0] / tt_pctls[1])[keep],
+            'data_compl_pct': np.repeat(tmc_epochs / poss_epochs, n_prd)[keep]}
+
+
+def rolling_mean(values, window, min_periods=1):
+    '''Trailing rolling mean along each row of a TMC x month matrix, ignoring NaNs. Months with fewer than
+    min_periods values in their window are NaN.'''
+    has_val = ~np.isnan(values)
+    csum = np.cumsum(np.where(has_val, values, 0), axis=1)
+    ccnt = np.cumsum(has_val, axis=1)
+
+    win_sum = csum.copy()
+    win_cnt = ccnt.copy()
+    win_sum[:, window:] -= csum[:, :-window]
+    win_cnt[:, window:] -= ccnt[:, :-window]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(win_cnt >= min_periods, win_sum / win_cnt, np.nan)
+
+
+def seasonal_adjust(values, months, min_periods=10):
+    '''Seasonally adjusted TMC x month matrix. Returns (adjusted values, seasonal index for each TMC x
+    calendar month). Calendar months with no estimate get an index of 0.
+    PARAMETERS:
+        values (array) = TMC x month matrix, one column per consecutive month
+        months (array) = datetime64[M] month of each column
+        min_periods (int) = fewest months with data in a 12-month window for a moving average
+    '''
+    # centered 2x12 moving average = average of the 12-month means ending 6 and 5 months after each month
+    ma12 = rolling_mean(values, 12, min_periods)
+    n_months = values.shape[1]
+    trend = np.full(values.shape, np.nan)
+    if n_months > 6:
+        trend[:, :n_months - 6] = (ma12[:, 6:] + ma12[:, 5:-1]) / 2
+
+    month_of_yr = months.astype(np.int64) % 12
+    detrended = values - trend
+    has_val = ~np.isnan(detrended)
+    in_month = (month_of_yr[:, None] == np.arange(12)[None, :]).astype(np.float64) # month x calendar month
+
+    # average difference from trend in each calendar month, centered so each TMC's index averages 0
+    dev_sums = np.where(has_val, detrended, 0) @ in_month
+    dev_cnts = has_val.astype(np.float64) @ in_month
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seas_index = np.where(dev_cnts > 0, dev_sums / dev_cnts, np.nan)
+        has_index = ~np.isnan(seas_index)
+        index_means = np.where(has_index, seas_index, 0).sum(axis=1) / has_index.sum(axis=1)
+    seas_index = np.nan_to_num(seas_index - index_means[:, None])
+
+    return values - seas_index[:, month_of_yr], seas_index
+
+
+class TrendPanel():
+    def __init__(self, panel_dir, panel_name='npmrds_trend', params=None, max_month_queries=3):
+        '''
+        PARAMETERS:
+            panel_dir (string) = folder monthly panel files are written to and read from
+            panel_name (string) = name at the start of each monthly file
+            params (PPA2Params) = periods and percentile for panel. Default is PPA2Params()
+            max_month_queries (int) = most months of a SQL Server table read with one query each. If more
+                months need building, they are read with a single query.
+        '''
+        self.panel_dir = panel_dir
+        self.panel_name = panel_name
+        self.params = params if params else PPA2Params()
+        self.max_month_queries = max_month_queries
+        self.df_panel = None
+
+    def month_path(self, month):
+        return os.path.join(self.panel_dir, f"{self.panel_name}_{month}{PANEL_EXT}")
+
+    def month_max_tstamp(self, month):
+        '''Latest timestamp in the data a month's panel file was built from. None if the file has none.'''
+        with np.load(self.month_path(month)) as f_in:
+            return f_in['max_tstamp'][()] if 'max_tstamp' in f_in.files else None
+
+    def months_to_build(self, data_year, overwrite=False):
+        '''Months of data_year up to the current month that need building: those with no file, plus the
+        latest month with a file if its data ended before the month's last epoch'''
+        months = np.arange(np.datetime64(f"{data_year}-01"), np.datetime64(f"{data_year + 1}-01"))
+        months = months[months <= np.datetime64('today', 'M')]
+        if overwrite:
+            return list(months)
+
+        has_file = np.array([os.path.exists(self.month_path(m)) for m in months], dtype=bool)
+        to_build = ~has_file
+        if has_file.any():
+            last_built = np.flatnonzero(has_file)[-1]
+            max_tstamp = self.month_max_tstamp(months[last_built])
+            last_epoch = np.datetime64(months[last_built] + 1, 'm') - EPOCH_MINS
+            if max_tstamp is None or max_tstamp < last_epoch:
+                to_build[last_built] = True
+
+        return list(months[to_build])
+
+    def month_chunks(self, tt_data, months):
+        '''Yields (month, travel time chunk) for the months given. CSVs, and SQL Server tables with more than
+        max_month_queries months to read, are read in one pass; otherwise each month has its own query.'''
+        cols = [ttd.COL_TMC, ttd.COL_TSTAMP, ttd.COL_SPEED, ttd.COL_TT]
+        if tt_data.source_is_csv or len(months) > self.max_month_queries:
+            sql_where = f"{ttd.COL_TSTAMP} >= '{min(months)}-01' AND {ttd.COL_TSTAMP} < '{max(months) + 1}-01'"
+            for df in tt_data.iter_chunks(cols=cols, sql_where=sql_where):
+                df_months = df[ttd.COL_TSTAMP].values.astype('datetime64[M]')
+                for month in np.intersect1d(np.unique(df_months), months):
+                    yield month, df.loc[df_months == month]
+        else:
+            for month in months:
+                print(f"\treading {month}...")
+                sql_where = f"{ttd.COL_TSTAMP} >= '{month}-01' AND {ttd.COL_TSTAMP} < '{month + 1}-01'"
+                for df in tt_data.iter_chunks(cols=cols, sql_where=sql_where):
+                    yield month, df
+
+    def build_year(self, data_year, tt_source, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000,
+                   overwrite=False):
+        '''Writes monthly panel files for one year of travel time data. Returns list of files written.'''
+        months = self.months_to_build(data_year, overwrite)
+        if not months:
+            print(f"panel already built for {data_year}")
+            return []
+
+        print(f"building {len(months)} months of {data_year} panel from {tt_source}...")
+        tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+        calendar = EpochCalendar(data_year, self.params)
+        tmcs = pd.Index([])
+        month_parts = {} # {month: {column: [array for each chunk]}}
+
+        for month, df in self.month_chunks(tt_data, months):
+            tmcs = tmcs.append(pd.Index(df[ttd.COL_TMC].unique()).difference(tmcs))
+            parts = month_parts.setdefault(month, {'tmc_idx': [], 'prd': [], 'speed': [], 'tt': [], 'tstamp': []})
+            parts['tmc_idx'].append(tmcs.get_indexer(df[ttd.COL_TMC]))
+            parts['prd'].append(calendar.prd_code[calendar.epoch_index(df[ttd.COL_TSTAMP].values)])
+            parts['speed'].append(df[ttd.COL_SPEED].values.astype(np.float32))
+            parts['tt'].append(df[ttd.COL_TT].values.astype(np.float32))
+            parts['tstamp'].append(np.array([df[ttd.COL_TSTAMP].values.max()], dtype='datetime64[m]'))
+
+        out_files = []
+        for month, parts in sorted(month_parts.items()):
+            arrays = {k: np.concatenate(v) for k, v in parts.items()}
+            poss_epochs = possible_epochs_hod(month, month + 1, calendar.epoch_mins).sum()
+            cols = month_stats(tmcs.values, arrays['tmc_idx'], arrays['prd'], arrays['speed'], arrays['tt'],
+                               self.params, poss_epochs)
+            np.savez(self.month_path(month), max_tstamp=arrays['tstamp'].max(), **cols)
+            out_files.append(self.month_path(month))
+
+        return out_files
+
+    def build(self, data_years, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000, overwrite=False):
+        '''Builds or updates panel for all years.
+        PARAMETERS:
+            data_years (dict) = {data year: travel time table name or path to raw CSV}
+            overwrite (boolean) = if True, every month is rebuilt
+        '''
+        start_time = time.perf_counter()
+        out_files = []
+        for data_year, tt_source in sorted(data_years.items()):
+            out_files += self.build_year(data_year, tt_source, svr_name, db_name, chunk_rows, overwrite)
+
+        self.df_panel = None
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"{len(out_files)} monthly panel files written in {elapsed_time}mins")
+
+        return out_files
+
+    def load(self):
+        '''Returns long dataframe of every monthly panel file, with month column (yyyy-mm)'''
+        if self.df_panel is None:
+            month_dfs = []
+            for month_file in sorted(glob.glob(os.path.join(self.panel_dir, f"{self.panel_name}_????-??{PANEL_EXT}"))):
+                with np.load(month_file) as f_in:
+                    df = pd.DataFrame({k: f_in[k] for k in f_in.files if k != 'max_tstamp'})
+                df['month'] = os.path.splitext(month_file)[0][-7:]
+                month_dfs.append(df)
+            self.df_panel = pd.concat(month_dfs, ignore_index=True)
+
+        return self.df_panel
+
+    def matrix(self, measure, period='all'):
+        '''Returns (TMC index, array of months, TMC x month matrix of measure). Months run from the first to
+        the last month in the panel with no gaps; months a TMC has no data for are NaN.'''
+        df = self.load()
+        df = df.loc[df['period'] == period]
+        months = np.arange(np.datetime64(df['month'].min()), np.datetime64(df['month'].max()) + 1)
+
+        tmcs = pd.Index(df[ttd.COL_SPEC_TMC].unique())
+        values = np.full((len(tmcs), len(months)), np.nan)
+        col_idx = (np.array(df['month'].tolist(), dtype='datetime64[M]') - months[0]).astype(np.int64)
+        values[tmcs.get_indexer(df[ttd.COL_SPEC_TMC]), col_idx] = df[measure].values
+
+        return tmcs, months, values
+
+    def trends(self, measure, period='all', window=12):
+        '''Returns long dataframe with monthly value, trailing rolling mean over window months and seasonally
+        adjusted value of measure for each TMC and month'''
+        tmcs, months, values = self.matrix(measure, period)
+        rolling = rolling_mean(values, window)
+        seas_adj, _ = seasonal_adjust(values, months)
+
+        return pd.DataFrame({ttd.COL_SPEC_TMC: np.repeat(tmcs.values, len(months)),
+                             'month': np.tile(months.astype(str), len(tmcs)), 'period': period,
+                             measure: values.ravel(), f"{measure}_roll{window}": rolling.ravel(),
+                             f"{measure}_seas_adj": seas_adj.ravel()}).dropna(subset=[measure])
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    # {data year: travel time table name or path to raw CSV}
+    years_in_panel = {yr: f"npmrds_{yr}_alltmc_paxtruck_comb" for yr in range(2016, 2024)}
+    panel_folder = r"P:\NPMRDS data\TrendPanel"
+
+    output_csv = r"P:\NPMRDS data\TrendPanel\lottr_ampk_trends.csv"
+
+    #=================RUN SCRIPT===========================
+    panel = TrendPanel(panel_folder)
+    panel.build(years_in_panel)
+
+    df_trends = panel.trends('lottr', 'ampk')
+    df_trends.to_csv(output_csv, index=False)
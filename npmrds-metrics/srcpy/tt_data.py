@@ -0,0 +1,119 @@
+"""
+Name: tt_data.py
+Purpose: Read NPMRDS travel time data and TMC specification data into pandas, either from
+    SQL Server tables loaded by data-prep/LoadRawData, or straight from raw CSVs.
+    Travel time data are read in chunks so that a full year never has to fit in memory
+    as a dataframe.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+
+import pandas as pd
+
+
+# column names, as used in raw NPMRDS data and the tables loaded from them
+COL_TMC = 'tmc_code'
+COL_TSTAMP = 'measurement_tstamp'
+COL_SPEED = 'speed'
+COL_TT = 'travel_time_seconds'
+COL_DENSITY = 'data_density'
+
+COL_SPEC_TMC = 'tmc' # TMC code column in TMC specification table
+
+# vehicle type part of travel time table names
+VEHTYPE_TBLNAMES = {'all': 'paxtruck_comb', 'passenger': 'paxveh', 'truck': 'trucks'}
+
+
+def npmrds_table_names(data_year, tmc_extent='all', vehtype='all', tbl_name_addl=''):
+    '''Returns (travel time table name, TMC spec table name) for a year of data, named the same
+    way as by RawTTCSV and DataSet in data-prep/LoadRawData/load_raw_npmrds_data.py
+    PARAMETERS:
+        data_year (int) = year of data
+        tmc_extent (string) = 'all' or 'nhs'
+        vehtype (string) = 'all', 'passenger', or 'truck'
+        tbl_name_addl (string) = additional text that was put in table name when loading, if any
+    '''
+    tmc_extent = f"{tmc_extent}tmc"
+    other_tblname_info = f"_{tbl_name_addl[:10]}" if tbl_name_addl else ''
+
+    tt_table = f"npmrds_{data_year}_{tmc_extent}_{VEHTYPE_TBLNAMES[vehtype]}{other_tblname_info}"
+    spec_table = f"npmrds_{data_year}_{tmc_extent}_txt"
+
+    return tt_table, spec_table
+
+
+def conn_str(svr_name='SQL-SVR', db_name='NPMRDS'):
+    '''pyodbc connection string for trusted connection to SQL Server database'''
+    return f"Driver={{SQL Server}}; Server={svr_name}; Database={db_name}; Trusted_Connection=yes;"
+
+
+def is_csv(data_source):
+    return os.path.splitext(data_source)[1].lower() == '.csv'
+
+
+class TTData():
+    def __init__(self, tt_source, svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000):
+        '''
+        PARAMETERS:
+            tt_source (string) = either path to a raw NPMRDS travel time CSV, or name of
+                travel time table in SQL Server (e.g. npmrds_2023_alltmc_paxtruck_comb)
+            svr_name (string) = SQL Server instance. Not used if tt_source is a CSV.
+            db_name (string) = SQL Server database. Not used if tt_source is a CSV.
+            chunk_rows (int) = number of rows read into memory at a time
+        '''
+        self.tt_source = tt_source
+        self.source_is_csv = is_csv(tt_source)
+        self.str_conn_info = conn_str(svr_name, db_name)
+        self.chunk_rows = chunk_rows
+
+    def iter_chunks(self, cols=[COL_TMC, COL_TSTAMP, COL_SPEED, COL_TT], sql_where=None):
+        '''Yields dataframes of travel time data, chunk_rows rows at a time.
+        PARAMETERS:
+            cols (list) = columns to read
+            sql_where (string) = optional SQL WHERE condition (without "WHERE") to filter rows
+                when reading from SQL Server. Not used if source is a CSV.
+        '''
+        dtypes = {COL_TMC: str, COL_DENSITY: str}
+        date_cols = [COL_TSTAMP] if COL_TSTAMP in cols else None
+
+        if self.source_is_csv:
+            for df in pd.read_csv(self.tt_source, usecols=cols, chunksize=self.chunk_rows,
+                                  dtype={k: v for k, v in dtypes.items() if k in cols},
+                                  parse_dates=date_cols):
+                yield df
+        else:
+            sql = f"SELECT {', '.join(cols)} FROM {self.tt_source}"
+            if sql_where:
+                sql = f"{sql} WHERE {sql_where}"
+
+            import pyodbc # only needed for SQL Server sources, so CSVs can be read without it
+            with pyodbc.connect(self.str_conn_info) as conn:
+                for df in pd.read_sql(sql, conn, chunksize=self.chunk_rows, parse_dates=date_cols):
+                    yield df
+
+
+def load_tmc_spec(spec_source, svr_name='SQL-SVR', db_name='NPMRDS', cols=None):
+    '''Returns dataframe of TMC specification data.
+    PARAMETERS:
+        spec_source (string) = path to TMC_Identification.csv, or name of TMC spec table in
+            SQL Server (e.g. npmrds_2023_alltmc_txt)
+        cols (list) = optional list of columns to read. Default is all columns.
+    '''
+    if is_csv(spec_source):
+        df = pd.read_csv(spec_source, usecols=cols)
+    else:
+        import pyodbc
+        str_cols = ', '.join(cols) if cols else '*'
+        with pyodbc.connect(conn_str(svr_name, db_name)) as conn:
+            df = pd.read_sql(f"SELECT {str_cols} FROM {spec_source}", conn)
+
+    df[COL_SPEC_TMC] = df[COL_SPEC_TMC].astype(str)
+
+    return df
@@ -0,0 +1,180 @@
+"""
+Name: tt_matrix_store.py
+Purpose: Stores a year of travel time data as dense TMC x epoch matrices, one memory-mapped float32
+    .npy file per measure (speed, travel time), so per-TMC time series never have to be pivoted out
+    of the long tmc_code/measurement_tstamp table again.
+
+    Each store is:
+        <name>_<measure>.npy - float32 matrix, one row per TMC and one column per epoch (35,040 columns
+            for a year of 15-minute epochs; epoch ID as in epoch_calendar.py). Missing epochs are NaN.
+        <name>_index.json - TMC for each row, data year, epoch length and measures.
+    TMC rows are in order of tmclinear, direction and road_order, so the TMCs of a corridor are next to
+    each other.
+
+    Because the files are memory-mapped, only the parts that are used are read from disk. Slicing a
+    block of consecutive TMCs (e.g. a corridor) and a range of dates returns a view, without copying.
+    Period percentiles and completeness are NumPy reductions along each row.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Params
+from epoch_calendar import EpochCalendar, EPOCH_MINS, hours_of_week
+
+
+STORE_MEASURES = [ttd.COL_SPEED, ttd.COL_TT]
+INDEX_SUFFIX = '_index.json'
+
+
+def store_tmc_order(spec):
+    '''TMC codes in the order they are stored: by tmclinear, direction and road_order, for those columns spec
+    has. tmclinear is shared by both directions of a road, so direction keeps each direction together.'''
+    sort_cols = [c for c in ['tmclinear', 'direction', 'road_order'] if c in spec.columns]
+    spec_sorted = spec.sort_values(sort_cols + [ttd.COL_SPEC_TMC]) if sort_cols else spec
+
+    return spec_sorted[ttd.COL_SPEC_TMC].astype(str).drop_duplicates().tolist()
+
+
+def write_matrix_store(tt_source, spec_source, store_dir, store_name, data_year, measures=STORE_MEASURES,
+                       svr_name='SQL-SVR', db_name='NPMRDS', chunk_rows=5000000):
+    '''Reads travel time data once and writes a matrix store. Epochs for TMCs not in the spec table are skipped.
+    PARAMETERS:
+        tt_source (string) = travel time table name in SQL Server, or path to raw travel time CSV
+        spec_source (string) = TMC spec table name in SQL Server, or path to TMC_Identification.csv
+        store_dir (string) = folder to write store to
+        store_name (string) = name for store files, e.g. npmrds_2023_alltmc_paxtruck_comb
+        data_year (int) = year of data
+        measures (list) = travel time data columns to store
+    '''
+    start_time = time.perf_counter()
+    spec = ttd.load_tmc_spec(spec_source, svr_name, db_name)
+    tmcs = store_tmc_order(spec)
+    tmc_index = pd.Index(tmcs)
+    calendar = EpochCalendar(data_year, PPA2Params())
+    shape = (len(tmcs), len(calendar.epoch_starts))
+
+    matrices = {}
+    for measure in measures:
+        out_path = os.path.join(store_dir, f"{store_name}_{measure}.npy")
+        matrices[measure] = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=shape)
+        matrices[measure][:] = np.nan
+
+    print(f"writing {shape[0]} TMC x {shape[1]} epoch matrices from {tt_source}...")
+    tt_data = ttd.TTData(tt_source, svr_name, db_name, chunk_rows)
+    rows_read = 0
+    for df in tt_data.iter_chunks(cols=[ttd.COL_TMC, ttd.COL_TSTAMP] + measures):
+        tmc_rows = tmc_index.get_indexer(df[ttd.COL_TMC])
+        in_spec = tmc_rows >= 0
+        epoch_cols = calendar.epoch_index(df[ttd.COL_TSTAMP].values[in_spec])
+
+        for measure in measures:
+            matrices[measure][tmc_rows[in_spec], epoch_cols] = df[measure].values[in_spec]
+
+        rows_read += len(df)
+        print(f"\t{rows_read} rows read...")
+
+    for matrix in matrices.values():
+        matrix.flush()
+
+    index = {'data_year': data_year, 'epoch_mins': calendar.epoch_mins, 'measures': measures, 'tmcs': tmcs}
+    with open(os.path.join(store_dir, f"{store_name}{INDEX_SUFFIX}"), 'w') as f_out:
+        json.dump(index, f_out)
+
+    elapsed_time = round((time.perf_counter() - start_time)/60,1)
+    print(f"matrix store {store_name} written in {elapsed_time}mins")
+
+
+class TTMatrixStore():
+    def __init__(self, store_dir, store_name):
+        '''Reader for a store written by write_matrix_store(). Matrices are opened read-only and memory-mapped.'''
+        with open(os.path.join(store_dir, f"{store_name}{INDEX_SUFFIX}"), 'r') as f_in:
+            index = json.load(f_in)
+
+        self.data_year = index['data_year']
+        self.tmcs = pd.Index(index['tmcs'])
+        self.calendar = EpochCalendar(self.data_year, PPA2Params(), index.get('epoch_mins', EPOCH_MINS))
+        self.matrices = {measure: np.load(os.path.join(store_dir, f"{store_name}_{measure}.npy"), mmap_mode='r')
+                         for measure in index['measures']}
+
+    def tmc_rows(self, tmcs):
+        '''Row number of each TMC in tmcs. TMCs not in store get -1.'''
+        return self.tmcs.get_indexer(pd.Index(tmcs).astype(str))
+
+    def epoch_cols(self, start_date=None, end_date=None):
+        '''slice of epoch columns from start_date (inclusive) to end_date (exclusive), as 'yyyy-mm-dd' strings'''
+        col_start = self.calendar.epoch_index(np.array([start_date], dtype='datetime64[m]'))[0] if start_date else None
+        col_end = None
+        if end_date:
+            col_end = (np.datetime64(end_date, 'm') - self.calendar.start).astype(np.int64) // self.calendar.epoch_mins
+
+        return slice(col_start, col_end)
+
+    def get(self, measure, tmcs=None, start_date=None, end_date=None):
+        '''Returns matrix of measure for tmcs (all TMCs if None) from start_date to end_date. If tmcs are
+        consecutive rows in the store (e.g. one corridor), returns a view without copying any data.
+        Otherwise rows are copied into a new array, in the order given.'''
+        cols = self.epoch_cols(start_date, end_date)
+        matrix = self.matrices[measure]
+        if tmcs is None:
+            return matrix[:, cols]
+
+        rows = self.tmc_rows(tmcs)
+        if (rows < 0).any():
+            raise Exception(f"{(rows < 0).sum()} TMCs not found in matrix store.")
+        if len(rows) > 0 and (np.diff(rows) == 1).all():
+            return matrix[rows[0]:rows[-1] + 1, cols]
+
+        return matrix[rows][:, cols]
+
+    def period_cols(self, days, hr_start, hr_end):
+        '''Epoch columns (epoch IDs) whose hour of week is in the period. Can be used to index a matrix.'''
+        return np.flatnonzero(np.isin(self.calendar.how, hours_of_week(days, hr_start, hr_end)))
+
+    def period_percentiles(self, measure, pctls, days, hr_start, hr_end, tmcs=None, block_rows=2000):
+        '''Percentiles of measure for each TMC over the epochs in a period, ignoring missing epochs.
+        Uses linear interpolation, like PERCENTILE_CONT. Returns array of shape (len(pctls), number of TMCs).
+        Rows are processed block_rows at a time to limit memory use.'''
+        period_cols = self.period_cols(days, hr_start, hr_end)
+        matrix = self.get(measure, tmcs)
+
+        out = np.full((len(pctls), matrix.shape[0]), np.nan)
+        for row_start in range(0, matrix.shape[0], block_rows):
+            block = np.asarray(matrix[row_start:row_start + block_rows][:, period_cols], dtype=np.float64)
+            has_data = ~np.isnan(block).all(axis=1)
+            out[:, row_start:row_start + len(block)][:, has_data] = np.nanquantile(block[has_data], pctls, axis=1)
+
+        return out
+
+    def completeness(self, measure=ttd.COL_TT, tmcs=None, start_date=None, end_date=None):
+        '''Share of possible epochs that have data, for each TMC'''
+        matrix = self.get(measure, tmcs, start_date, end_date)
+        return (~np.isnan(matrix)).sum(axis=1) / matrix.shape[1]
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    year = 2023
+    tt_table = 'npmrds_2023_alltmc_paxtruck_comb' # table name or path to raw CSV
+    spec_table = 'npmrds_2023_alltmc_txt' # table name or path to TMC_Identification.csv
+    store_folder = r"P:\NPMRDS data\MatrixStore"
+
+    #=================RUN SCRIPT===========================
+    write_matrix_store(tt_table, spec_table, store_folder, tt_table, year)
+
+    # example: weekday AM peak 80th percentile travel times for a corridor, June only
+    # store = TTMatrixStore(store_folder, tt_table)
+    # tt_june = store.get(ttd.COL_TT, tmcs=['105+04687', '105+04688'], start_date='2023-06-01', end_date='2023-07-01')
+    # tt_p80_ampk = store.period_percentiles(ttd.COL_TT, [0.8], [0, 1, 2, 3, 4], 6, 10)
@@ -0,0 +1,217 @@
+"""
+Name: yoy_compare.py
+Purpose: Year-over-year comparison of NPMRDS TMC metrics, replacing the manual comparisons in
+    data-compare/CompareNPMRDSyears.xlsx. For each year given:
+        -PPA2 metrics for each TMC (ppa2_metrics.py, using metrics_cache.py if a cache folder is given)
+        -data completeness for each TMC (data_completeness.py)
+    Then, for each pair of years (each year vs. the year before, or each year vs. a base year):
+        -TMCs are joined on tmc code. If a crosswalk between the two years' TMC networks is given
+            (e.g. from tmc_crosswalk.py, for years where TMC codes changed), base-year values are
+            mapped onto comparison-year TMCs as weighted averages of the overlapping base-year TMCs.
+        -every metric except slowest_hr (an hour of day, not an amount) gets a change (comparison minus
+            base) and percent change
+        -changes are flagged if their robust z-score (distance from the median change for TMCs with
+            the same f_system, in units of 1.4826 x median absolute deviation) is more than z_threshold
+            and the change is at least min_pct_change of the base value. Unlike a standard z-score, a few
+            very large changes do not hide each other.
+
+    Output is a long table with one row per TMC x year pair x metric, and a summary with one row per
+    year pair x metric.
+
+
+Author: Darren Conly
+Last Updated: Oct 2026
+Updated by: <name>
+Copyright:   (c) SACOG
+Python Version: 3.x
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import tt_data as ttd
+from ppa2_metrics import PPA2Metrics, PPA2Params
+from metrics_cache import cached_ppa2_metrics
+from data_completeness import DataCompleteness
+
+
+COL_TMC = ttd.COL_SPEC_TMC
+MAD_SCALE = 1.4826 # MAD x this = standard deviation, for normally distributed values
+MEANAD_SCALE = 1.2533 # same for mean absolute deviation; used when more than half the values equal the median
+CATEGORY_COLS = ['slowest_hr'] # numeric codes, not amounts, so changes and averages are meaningless
+
+
+def robust_z(values, groups):
+    '''Robust z-score of each value relative to the other values in its group:
+    (value - group median) / (MAD_SCALE x group median absolute deviation). If MAD is 0 (e.g. most TMCs
+    did not change), MEANAD_SCALE x mean absolute deviation is used instead. NaN if every value is the same.'''
+    s_vals = pd.Series(values)
+    dev = s_vals - s_vals.groupby(groups).transform('median')
+    abs_dev = dev.abs().groupby(groups)
+    scale = (abs_dev.transform('median') * MAD_SCALE).where(lambda mad: mad > 0, abs_dev.transform('mean') * MEANAD_SCALE)
+
+    return (dev / scale.where(scale > 0)).values
+
+
+def apply_crosswalk(df_base, crosswalk, value_cols):
+    '''Maps base-year values onto comparison-year TMCs. Each comparison-year TMC gets the weighted average
+    of the values of the base-year TMCs it overlaps, ignoring missing values.
+    PARAMETERS:
+        df_base (dataframe) = base-year values, with tmc column and value_cols
+        crosswalk (dataframe) = tmc_base, tmc_comp and weight columns (e.g. share of comp TMC's length
+            that overlaps the base TMC)
+    '''
+    df_cw = crosswalk.merge(df_base, left_on='tmc_base', right_on=COL_TMC, how='inner')
+    vals = df_cw[value_cols]
+    weights = vals.notnull().mul(df_cw['weight'], axis=0)
+
+    weighted_sums = vals.fillna(0).mul(df_cw['weight'], axis=0).groupby(df_cw['tmc_comp']).sum()
+    weight_sums = weights.groupby(df_cw['tmc_comp']).sum()
+
+    df_out = (weighted_sums / weight_sums.where(weight_sums > 0)).reset_index()
+
+    return df_out.rename(columns={'tmc_comp': COL_TMC})
+
+
+class YearCompare():
+    def __init__(self, data_years, crosswalks=None, base_year=None, params=None, cache_dir=None,
+                 z_threshold=3.5, min_pct_change=0.05, svr_name='SQL-SVR', db_name='NPMRDS'):
+        '''
+        PARAMETERS:
+            data_years (dict) = {data year: (travel time table or raw CSV, TMC spec table or TMC_Identification.csv)}
+            crosswalks (dict) = optional {(base year, comparison year): crosswalk dataframe with tmc_base,
+                tmc_comp and weight columns}. Year pairs without a crosswalk are joined on tmc code.
+            base_year (int) = year every other year is compared to. If None, each year is compared
+                to the year before it.
+            params (PPA2Params) = PPA2 metric parameters. Default is PPA2Params()
+            cache_dir (string) = optional metrics_cache.py folder, so re-runs do not recalculate PPA2 metrics
+            z_threshold (float) = changes with robust z-scores larger than this (in absolute value) are flagged
+            min_pct_change (float) = changes smaller than this share of the base value are never flagged
+        '''
+        self.data_years = data_years
+        self.crosswalks = crosswalks if crosswalks else {}
+        self.base_year = base_year
+        self.params = params if params else PPA2Params()
+        self.cache_dir = cache_dir
+        self.z_threshold = z_threshold
+        self.min_pct_change = min_pct_change
+        self.svr_name = svr_name
+        self.db_name = db_name
+
+    def year_pairs(self):
+        '''List of (base year, comparison year) pairs to compare'''
+        years = sorted(self.data_years)
+        if self.base_year is None:
+            return list(zip(years[:-1], years[1:]))
+
+        return [(self.base_year, yr) for yr in years if yr != self.base_year]
+
+    def year_metrics(self, data_year):
+        '''Returns dataframe of PPA2 metrics and data completeness for each TMC for one year.
+        PPA2's -1 "no data" values are set to NaN.'''
+        tt_source, spec_source = self.data_years[data_year]
+
+        if self.cache_dir:
+            df_ppa2 = cached_ppa2_metrics(self.cache_dir, tt_source, spec_source, self.params,
+                                          self.svr_name, self.db_name)
+        else:
+            df_ppa2 = PPA2Metrics(tt_source, spec_source, self.params, self.svr_name, self.db_name).run()
+
+        df_compl = DataCompleteness({data_year: (tt_source, spec_source)}, svr_name=self.svr_name,
+                                    db_name=self.db_name).year_completeness(data_year, tt_source, spec_source)
+        df_compl = df_compl.groupby(COL_TMC, sort=False)[['obs_epochs', 'poss_epochs_hod']].sum()
+
+        df_out = df_ppa2.copy()
+        df_out['data_compl_pct'] = df_out[COL_TMC].map(df_compl['obs_epochs'] / df_compl['poss_epochs_hod'])
+
+        metric_cols = self.metric_cols(df_out)
+        df_out[metric_cols] = df_out[metric_cols].where(df_out[metric_cols] != -1)
+
+        return df_out
+
+    def metric_cols(self, df_metrics):
+        '''Numeric metric columns to compare (all numeric columns except TMC attributes and CATEGORY_COLS)'''
+        attr_cols = ['route_numb', 'f_system', 'nhs', 'miles'] + CATEGORY_COLS
+        return [c for c in df_metrics.select_dtypes('number').columns if c not in attr_cols]
+
+    def compare_pair(self, df_base, df_comp, base_year, comp_year):
+        '''Returns long dataframe of base and comparison values, change, percent change, robust z-score
+        and flag for each comparison-year TMC and metric'''
+        metric_cols = self.metric_cols(df_comp)
+        crosswalk = self.crosswalks.get((base_year, comp_year))
+
+        if crosswalk is not None:
+            df_base_vals = apply_crosswalk(df_base, crosswalk, metric_cols)
+        else:
+            df_base_vals = df_base[[COL_TMC] + metric_cols]
+
+        df_joined = df_comp[[COL_TMC, 'road', 'f_system', 'miles'] + metric_cols] \
+            .merge(df_base_vals, on=COL_TMC, how='inner', suffixes=('_comp', '_base'))
+        n_tmc = len(df_joined)
+        print(f"\t{base_year} vs. {comp_year}: {n_tmc} of {len(df_comp)} {comp_year} TMCs matched.")
+
+        # stack metrics so every metric's changes and z-scores come from one set of array operations
+        vals_base = df_joined[[f"{c}_base" for c in metric_cols]].values.ravel(order='F')
+        vals_comp = df_joined[[f"{c}_comp" for c in metric_cols]].values.ravel(order='F')
+        metrics = np.repeat(metric_cols, n_tmc)
+        f_systems = np.tile(df_joined['f_system'].values, len(metric_cols))
+
+        df_out = pd.DataFrame({COL_TMC: np.tile(df_joined[COL_TMC].values, len(metric_cols)),
+                               'road': np.tile(df_joined['road'].values, len(metric_cols)),
+                               'f_system': f_systems,
+                               'miles': np.tile(df_joined['miles'].values, len(metric_cols)),
+                               'year_base': base_year, 'year_comp': comp_year, 'metric': metrics,
+                               'val_base': vals_base, 'val_comp': vals_comp})
+        df_out['change'] = df_out['val_comp'] - df_out['val_base']
+        df_out['pct_change'] = df_out['change'] / df_out['val_base'].where(df_out['val_base'] != 0)
+        df_out['robust_z'] = robust_z(df_out['change'].values, [metrics, f_systems])
+        is_big_change = (df_out['pct_change'].abs() >= self.min_pct_change) \
+            | ((df_out['val_base'] == 0) & (df_out['change'] != 0))
+        df_out['is_flagged'] = ((df_out['robust_z'].abs() > self.z_threshold) & is_big_change).astype(int)
+
+        return df_out.dropna(subset=['change'])
+
+    def run(self):
+        '''Returns (long dataframe with one row per TMC x year pair x metric, summary dataframe with one row
+        per year pair x metric)'''
+        start_time = time.perf_counter()
+
+        year_dfs = {}
+        for data_year in sorted(self.data_years):
+            print(f"getting {data_year} metrics...")
+            year_dfs[data_year] = self.year_metrics(data_year)
+
+        print("comparing years...")
+        df_long = pd.concat([self.compare_pair(year_dfs[yr_base], year_dfs[yr_comp], yr_base, yr_comp)
+                             for yr_base, yr_comp in self.year_pairs()], ignore_index=True)
+
+        df_summary = df_long.groupby(['year_base', 'year_comp', 'metric'], as_index=False, sort=False) \
+            .agg(tmcs=(COL_TMC, 'count'), median_base=('val_base', 'median'), median_comp=('val_comp', 'median'),
+                 median_change=('change', 'median'), median_pct_change=('pct_change', 'median'),
+                 tmcs_flagged=('is_flagged', 'sum'))
+
+        elapsed_time = round((time.perf_counter() - start_time)/60,1)
+        print(f"{len(self.data_years)} years compared in {elapsed_time}mins. " \
+              f"{df_long['is_flagged'].sum()} TMC-metric changes flagged.")
+
+        return df_long, df_summary
+
+
+if __name__ == '__main__':
+    #================INPUT PARAMETERS======================
+    # {data year: (travel time table or raw CSV, TMC spec table or TMC_Identification.csv)}
+    years_to_compare = {2021: ('npmrds_2021_alltmc_paxtruck_comb', 'npmrds_2021_alltmc_txt'),
+                        2022: ('npmrds_2022_alltmc_paxtruck_comb', 'npmrds_2022_alltmc_txt'),
+                        2023: ('npmrds_2023_alltmc_paxtruck_comb', 'npmrds_2023_alltmc_txt')}
+    cache_folder = r"P:\NPMRDS data\MetricsCache"
+
+    output_csv_long = r"P:\NPMRDS data\YearCompare\yoy_tmc_changes.csv"
+    output_csv_summary = r"P:\NPMRDS data\YearCompare\yoy_summary.csv"
+
+    #=================RUN SCRIPT===========================
+    df_changes, df_yoy_summary = YearCompare(years_to_compare, cache_dir=cache_folder).run()
+    df_changes.loc[df_changes['is_flagged'] == 1].to_csv(output_csv_long, index=False)
+    df_yoy_summary.to_csv(output_csv_summary, index=False)
+    print(df_yoy_summary)
@@ -0,0 +1,24 @@
+"""
+Shared setup for npmrds-metrics tests. Modules in srcpy import each other by module name, so srcpy
+is put on the path the same way it is when the scripts are run from that folder.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'srcpy'))
+
+import pytest
+
+from synthetic_data import make_tt_data
+
+
+@pytest.fixture
+def synthetic_csvs(tmp_path):
+    '''(travel time CSV path, spec CSV path, travel time dataframe, spec dataframe) for one month of data'''
+    df_tt, spec = make_tt_data()
+    tt_csv, spec_csv = str(tmp_path / 'tt.csv'), str(tmp_path / 'spec.csv')
+    df_tt.to_csv(tt_csv, index=False)
+    spec.to_csv(spec_csv, index=False)
+
+    return tt_csv, spec_csv, df_tt, spec
@@ -0,0 +1,40 @@
+"""
+Synthetic NPMRDS travel time and TMC spec data for tests, with known speeds so results can be checked
+against plain pandas calculations.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# TMC spec for synthetic data: a two-TMC northbound freeway corridor, one southbound TMC with the same
+# tmclinear, and an arterial on its own tmclinear
+SPEC_ROWS = [['T1', 'I-5', 5, 1, 1, 0.5, 'NORTHBOUND', 100, 1, 38.500, -121.5, 38.507, -121.5],
+             ['T2', 'I-5', 5, 1, 1, 0.8, 'NORTHBOUND', 100, 2, 38.507, -121.5, 38.519, -121.5],
+             ['T3', 'I-5', 5, 1, 1, 1.2, 'SOUTHBOUND', 100, 1, 38.519, -121.501, 38.500, -121.501],
+             ['T4', 'J ST', None, 4, 0, 0.3, 'EASTBOUND', 200, 1, 38.580, -121.49, 38.580, -121.484]]
+SPEC_COLS = ['tmc', 'road', 'route_numb', 'f_system', 'nhs', 'miles', 'direction', 'tmclinear', 'road_order',
+             'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude']
+
+
+def make_tt_data(start='2023-01-01', end='2023-02-01', drop_share=0.1, seed=0):
+    '''Raw-format travel time data for the SPEC_ROWS TMCs, every 15-minute epoch from start to end, with
+    drop_share of epochs missing at random. Speeds are slower in weekday peaks.'''
+    rng = np.random.default_rng(seed)
+    spec = pd.DataFrame(SPEC_ROWS, columns=SPEC_COLS)
+    tstamps = pd.date_range(start, end, freq='15min', inclusive='left')
+
+    df = pd.DataFrame({'tmc_code': np.repeat(spec['tmc'].values, len(tstamps)),
+                       'measurement_tstamp': np.tile(tstamps, len(spec))})
+    miles = np.repeat(spec['miles'].values, len(tstamps))
+    ff_speed = np.where(np.repeat(spec['f_system'].values, len(tstamps)) <= 2, 65, 35)
+    hr = df['measurement_tstamp'].dt.hour.values
+    is_weekday = df['measurement_tstamp'].dt.dayofweek.values < 5
+    is_peak = is_weekday & (((hr >= 7) & (hr < 9)) | ((hr >= 16) & (hr < 19)))
+    speed = ff_speed * np.where(is_peak, rng.uniform(0.3, 0.9, len(df)), rng.uniform(0.8, 1.05, len(df)))
+
+    df['speed'] = speed.round(1)
+    df['travel_time_seconds'] = (miles / df['speed'] * 3600).round(2)
+    df['data_density'] = rng.choice(['A', 'B', 'C'], len(df))
+
+    return df.loc[rng.random(len(df)) >= drop_share].reset_index(drop=True), spec
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from synthetic_data import make_tt_data
+from corridor_reliability import CorridorReliability, interpolate_gaps
+from ppa2_metrics import PPA2Params
+from tt_matrix_store import write_matrix_store
+
+
+def test_interpolate_gaps():
+    block = np.array([[np.nan, 1, np.nan, np.nan, 4, np.nan, np.nan, np.nan, 8, np.nan],
+                      [1, 2, 3, np.nan, 5, 6, 7, 8, 9, 10]])
+
+    is_filled = interpolate_gaps(block, max_gap=2)
+
+    # the 3-epoch gap is too long, and gaps at the ends of a row have nothing on one side
+    assert np.allclose(block[0], [np.nan, 1, 2, 3, 4, np.nan, np.nan, np.nan, 8, np.nan], equal_nan=True)
+    assert np.allclose(block[1], np.arange(1, 11))
+    assert is_filled.sum() == 3
+
+
+def write_store(tmp_path, df_tt, spec):
+    tt_csv, spec_csv = str(tmp_path / 'tt.csv'), str(tmp_path / 'spec.csv')
+    df_tt.to_csv(tt_csv, index=False)
+    spec.to_csv(spec_csv, index=False)
+    write_matrix_store(tt_csv, spec_csv, str(tmp_path), 'tt', 2023)
+
+    return spec_csv
+
+
+def test_corridor_percentiles_match_summed_travel_times(tmp_path):
+    df_tt, spec = make_tt_data(drop_share=0)
+    spec_csv = write_store(tmp_path, df_tt, spec)
+    p = PPA2Params()
+
+    df_out = CorridorReliability(str(tmp_path), 'tt', spec_csv, p).run()
+
+    # T1 and T2 (northbound) and T3 (southbound) share tmclinear 100, but are separate corridors
+    assert len(df_out) == 3
+    df_out = df_out.set_index(['tmclinear', 'direction'])
+    assert df_out.loc[(100, 'NORTHBOUND'), 'tmcs'] == 2
+
+    df_nb = df_tt.loc[df_tt['tmc_code'].isin(['T1', 'T2'])]
+    corr_tt = df_nb.groupby('measurement_tstamp')['travel_time_seconds'].sum()
+    hr, dow = corr_tt.index.hour, corr_tt.index.dayofweek
+    for prd_name, (hr_start, hr_end, days) in p.rel_periods.items():
+        prd_tt = corr_tt.loc[dow.isin(days) & (hr >= hr_start) & (hr < hr_end)]
+        tt_p50, tt_p80 = prd_tt.quantile(0.5), prd_tt.quantile(p.pctl_congested)
+
+        assert np.isclose(df_out.loc[(100, 'NORTHBOUND'), f"tt_p80_{prd_name}"], tt_p80, rtol=1e-4)
+        assert np.isclose(df_out.loc[(100, 'NORTHBOUND'), p.lottr_cols[prd_name]], tt_p80 / tt_p50, rtol=1e-4)
+
+
+def test_epochs_without_enough_observed_miles_are_not_used(tmp_path):
+    df_tt, spec = make_tt_data(drop_share=0.2)
+    spec_csv = write_store(tmp_path, df_tt, spec)
+
+    df_nb = df_tt.loc[df_tt['tmc_code'].isin(['T1', 'T2'])]
+
+    # neither northbound TMC alone has 75% of the corridor's miles, so both must be observed
+    df_out = CorridorReliability(str(tmp_path), 'tt', spec_csv, min_obs_share=0.75).run()
+    nb_used = df_out.set_index(['tmclinear', 'direction']).loc[(100, 'NORTHBOUND')]
+    assert nb_used['epochs_used'] == (df_nb.groupby('measurement_tstamp').size() == 2).sum()
+    assert nb_used['pct_interp'] == 0
+
+    # T2 has 62% of the miles, so epochs with T2 observed are used, with T1 gaps filled
+    df_out = CorridorReliability(str(tmp_path), 'tt', spec_csv, min_obs_share=0.6).run()
+    nb_used = df_out.set_index(['tmclinear', 'direction']).loc[(100, 'NORTHBOUND')]
+    assert nb_used['epochs_used'] == (df_nb['tmc_code'] == 'T2').sum()
+    assert nb_used['pct_interp'] > 0
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from synthetic_data import make_tt_data
+from data_completeness import DataCompleteness, possible_epochs_hod
+
+
+def test_possible_epochs_hod():
+    assert (possible_epochs_hod('2023-01-01', '2023-02-01') == 31 * 4).all()
+
+    # partial days: 6pm Jan 1 to 3am Jan 3 is one full day, plus 6pm-midnight and midnight-3am
+    poss = possible_epochs_hod('2023-01-01 18:00', '2023-01-03 03:00')
+    expected = np.full(24, 4) + 4 * ((np.arange(24) >= 18) | (np.arange(24) < 3))
+    assert (poss == expected).all()
+
+
+def test_completeness_matches_pandas_and_ignores_other_years(tmp_path):
+    df_tt, spec = make_tt_data('2023-01-01', '2023-02-01')
+    df_tt = pd.concat([make_tt_data('2022-01-01', '2022-01-15')[0], df_tt])
+    df_tt = df_tt.loc[df_tt['tmc_code'] != 'T4'] # T4 has no data
+    tt_csv, spec_csv = str(tmp_path / 'tt.csv'), str(tmp_path / 'spec.csv')
+    df_tt.to_csv(tt_csv, index=False)
+    spec.to_csv(spec_csv, index=False)
+
+    df_out = DataCompleteness({2023: (tt_csv, spec_csv)}, months=[1]).run()[0]
+    df_out = df_out.set_index(['tmc', 'hour_of_day'])
+
+    # January 2022 rows have the same month index and must not be counted
+    df_jan = df_tt.loc[df_tt['measurement_tstamp'].dt.year == 2023]
+    obs = df_jan.groupby(['tmc_code', df_jan['measurement_tstamp'].dt.hour]).size()
+    assert (df_out.loc[obs.index, 'obs_epochs'].values == obs.values).all()
+    assert (df_out['data_compl_pct'] <= 1).all()
+    assert (df_out.loc['T4', 'data_compl_pct'] == 0).all()
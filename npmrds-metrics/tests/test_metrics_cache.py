@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+
+from epoch_filter import EpochFilter
+from metrics_cache import MetricsCache, cached_ppa2_metrics
+from ppa2_metrics import PPA2Params
+
+
+def test_cache_reused_only_for_same_settings(synthetic_csvs, tmp_path):
+    tt_csv, spec_csv = synthetic_csvs[:2]
+    cache = MetricsCache(str(tmp_path))
+    runs = []
+
+    def run_func():
+        runs.append(1)
+        return pd.DataFrame({'n': [len(runs)]})
+
+    for settings in [None, None, {'epoch_filter': EpochFilter().settings()},
+                     {'epoch_filter': EpochFilter(min_density='B').settings()}]:
+        cache.get_or_run('test', [tt_csv, spec_csv], PPA2Params(), run_func, settings)
+    assert len(runs) == 3
+
+    # a changed source file gets a new version and replaces the old cached result
+    with open(tt_csv, 'a') as f_out:
+        f_out.write('\n')
+    cache.get_or_run('test', [tt_csv, spec_csv], PPA2Params(), run_func)
+    assert len(runs) == 4
+    assert len(os.listdir(str(tmp_path))) == 3 + 2 # 3 cached results plus the two CSVs
+
+
+def test_cached_ppa2_metrics_with_epoch_filter(synthetic_csvs, tmp_path):
+    tt_csv, spec_csv = synthetic_csvs[:2]
+    cache_dir = str(tmp_path / 'cache')
+    os.mkdir(cache_dir)
+
+    df_plain = cached_ppa2_metrics(cache_dir, tt_csv, spec_csv)
+    df_filtered = cached_ppa2_metrics(cache_dir, tt_csv, spec_csv, epoch_filter=EpochFilter(min_density='B'))
+
+    assert 'epochs_dropped' not in df_plain.columns
+    assert (df_filtered['epochs_dropped'] > 0).all()
+    assert len(os.listdir(cache_dir)) == 2
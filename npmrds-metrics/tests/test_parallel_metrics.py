@@ -0,0 +1,20 @@
+import pandas as pd
+
+from epoch_filter import EpochFilter
+from parallel_metrics import ParallelPPA2Metrics
+from ppa2_metrics import PPA2Metrics
+
+
+def test_parallel_matches_single_process_with_epoch_filter(synthetic_csvs, tmp_path):
+    tt_csv, spec_csv, df_tt = synthetic_csvs[:3]
+    # every T4 epoch is dropped, so T4 has no data but still has an epochs_dropped count
+    df_tt.loc[df_tt['tmc_code'] == 'T4', 'data_density'] = 'A'
+    df_tt.to_csv(tt_csv, index=False)
+
+    df_single = PPA2Metrics(tt_csv, spec_csv, epoch_filter=EpochFilter(min_density='B')).run()
+    df_parallel = ParallelPPA2Metrics(tt_csv, spec_csv, n_workers=2, shard_dir=str(tmp_path),
+                                      epoch_filter=EpochFilter(min_density='B')).run()
+
+    pd.testing.assert_frame_equal(df_parallel, df_single, check_dtype=False)
+    n_t4 = (df_tt['tmc_code'] == 'T4').sum()
+    assert df_parallel.loc[df_parallel['tmc'] == 'T4', 'epochs_dropped'].iloc[0] == n_t4
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from phed import PHED
+
+
+def test_corridor_totals_by_direction(synthetic_csvs, tmp_path):
+    tt_csv, spec_csv, df_tt, spec = synthetic_csvs
+    spec = spec.assign(urban_code=1, faciltype=1, aadt=50000, aadt_singl=2000, aadt_combi=3000)
+    spec.to_csv(spec_csv, index=False)
+    df_ff = pd.DataFrame({'tmc': spec['tmc'], 'ff_speed_art60thp': [65, 65, 65, 35]})
+
+    phed_dfs = PHED(tt_csv, spec_csv, df_ff).run()
+    df_tmc, df_corridor = phed_dfs['tmc'], phed_dfs['corridor']
+
+    # T1 and T2 (northbound) and T3 (southbound) share tmclinear 100, but are separate corridors
+    assert len(df_corridor) == 3
+    df_corridor = df_corridor.set_index(['tmclinear', 'direction'])
+    nb_tmcs = df_tmc.loc[df_tmc['tmc'].isin(['T1', 'T2'])]
+    assert np.isclose(df_corridor.loc[(100, 'NORTHBOUND'), 'phed_person_hrs'], nb_tmcs['phed_person_hrs'].sum())
+    assert np.isclose(df_corridor.loc[(100, 'NORTHBOUND'), 'miles'], 1.3)
+    assert np.isclose(df_corridor['phed_person_hrs'].sum(), df_tmc['phed_person_hrs'].sum())
+    assert (df_tmc['phed_person_hrs'] > 0).all()
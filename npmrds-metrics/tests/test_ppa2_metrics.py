@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ppa2_metrics import PPA2Metrics, PPA2Params
+
+
+def test_period_percentiles_and_counts_match_pandas(synthetic_csvs):
+    tt_csv, spec_csv, df_tt, spec = synthetic_csvs
+    p = PPA2Params()
+
+    df_out = PPA2Metrics(tt_csv, spec_csv, p).run().set_index('tmc')
+
+    tstamps = df_tt['measurement_tstamp']
+    hr, dow = tstamps.dt.hour, tstamps.dt.dayofweek
+    for prd_name, (hr_start, hr_end, days) in p.rel_periods.items():
+        in_prd = dow.isin(days) & (hr >= hr_start) & (hr < hr_end)
+        tt_prd = df_tt.loc[in_prd].groupby('tmc_code')['travel_time_seconds']
+        tt_p80, tt_p50 = tt_prd.quantile(p.pctl_congested), tt_prd.quantile(0.5)
+
+        assert np.allclose(df_out.loc[tt_p80.index, f"tt_p80_{prd_name}"], tt_p80, rtol=1e-5)
+        assert np.allclose(df_out.loc[tt_p50.index, p.lottr_cols[prd_name]], tt_p80 / tt_p50, rtol=1e-5)
+        assert (df_out.loc[tt_prd.size().index, f"epochs_{prd_name}"] == tt_prd.size()).all()
+
+    night_spd = df_tt.loc[(hr >= p.ff_prd_start) | (hr < p.ff_prd_end)].groupby('tmc_code')['speed']
+    is_fwy = spec.set_index('tmc')['f_system'].isin(p.fwy_fsystems)
+    ff_expected = np.where(is_fwy[night_spd.size().index], night_spd.quantile(p.ff_pctl_fwy),
+                           night_spd.quantile(p.ff_pctls_art[p.ff_col_congratio]))
+    assert np.allclose(df_out.loc[night_spd.size().index, p.ff_col_congratio], ff_expected, rtol=1e-5)
+
+
+def test_tmc_with_no_data_gets_minus_one(synthetic_csvs, tmp_path):
+    tt_csv, spec_csv, df_tt, spec = synthetic_csvs
+    tt_no_t4 = str(tmp_path / 'tt_no_t4.csv')
+    df_tt.loc[df_tt['tmc_code'] != 'T4'].to_csv(tt_no_t4, index=False)
+
+    df_out = PPA2Metrics(tt_no_t4, spec_csv).run().set_index('tmc')
+
+    assert df_out.loc['T4', 'lottr_ampk'] == -1
+    assert df_out.loc['T4', 'epochs_ampk'] == -1
+
+
+def test_overlapping_periods_raise():
+    # e.g. trying to reproduce the SQL script's weekend block by setting the weekend days to weekdays
+    p = PPA2Params()
+    p.rel_periods['weekend'] = (6, 20, p.weekdays)
+
+    with pytest.raises(Exception, match='overlap'):
+        p.hour_of_week_periods()
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import make_tt_data
+from ppa2_metrics import PPA2Params
+from quantile_sketch import SketchSet, build_monthly_sketches, load_months, sketch_metrics, SKETCH_ALPHA
+
+
+def test_sketch_metrics_within_error_bounds(tmp_path):
+    df_tt, spec = make_tt_data('2023-01-01', '2023-03-01')
+    df_tt.loc[df_tt.sample(frac=0.02, random_state=1).index, ['speed', 'travel_time_seconds']] = np.nan
+    tt_csv = str(tmp_path / 'tt.csv')
+    df_tt.to_csv(tt_csv, index=False)
+    p = PPA2Params()
+
+    out_files = build_monthly_sketches(tt_csv, str(tmp_path), p)
+    assert [os.path.basename(f) for f in out_files] == ['tt_2023-01.npz', 'tt_2023-02.npz']
+    df_out = sketch_metrics(load_months(str(tmp_path), 'tt'), spec, p).set_index('tmc')
+
+    tstamps = df_tt['measurement_tstamp']
+    hr, dow = tstamps.dt.hour, tstamps.dt.dayofweek
+    for prd_name, (hr_start, hr_end, days) in p.rel_periods.items():
+        df_prd = df_tt.loc[dow.isin(days) & (hr >= hr_start) & (hr < hr_end)]
+        tt_prd = df_prd.groupby('tmc_code')['travel_time_seconds']
+        tt_p80, tt_p50 = tt_prd.quantile(p.pctl_congested), tt_prd.quantile(0.5)
+
+        assert np.allclose(df_out.loc[tt_p80.index, f"tt_p80_{prd_name}"], tt_p80, rtol=SKETCH_ALPHA)
+        assert np.allclose(df_out.loc[tt_p50.index, f"tt_p50_{prd_name}"], tt_p50, rtol=SKETCH_ALPHA)
+        assert np.allclose(df_out.loc[tt_p80.index, p.lottr_cols[prd_name]], tt_p80 / tt_p50,
+                           rtol=2.01 * SKETCH_ALPHA)
+
+        # every row counts as an epoch, including rows with no travel time, as in PPA2Metrics
+        rows = df_prd.groupby('tmc_code').size()
+        assert (df_out.loc[rows.index, f"epochs_{prd_name}"] == rows).all()
+
+
+def test_merged_months_match_one_sketch(tmp_path):
+    df_tt = make_tt_data('2023-01-01', '2023-03-01')[0]
+    df_tt.to_csv(str(tmp_path / 'tt.csv'), index=False)
+
+    build_monthly_sketches(str(tmp_path / 'tt.csv'), str(tmp_path))
+    whole = load_months(str(tmp_path), 'tt')
+    jan = SketchSet.load(str(tmp_path / 'tt_2023-01.npz'))
+    feb = SketchSet.load(str(tmp_path / 'tt_2023-02.npz'))
+
+    # merging in either order gives the same bins as loading both months
+    for merged in [SketchSet.merge([jan, feb]), SketchSet.merge([feb, jan])]:
+        assert (merged.tmcs == whole.tmcs).all()
+        for measure, arrays in whole.bins.items():
+            assert all((a == b).all() for a, b in zip(merged.bins[measure], arrays))
+    assert whole.counts().sum() == len(df_tt)
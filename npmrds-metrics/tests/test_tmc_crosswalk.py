@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from tmc_crosswalk import STRTree, TMCCrosswalk
+
+
+def brute_force_pairs(item_boxes, q_boxes):
+    hits = (item_boxes[None, :, 0] <= q_boxes[:, None, 2]) & (item_boxes[None, :, 2] >= q_boxes[:, None, 0]) \
+        & (item_boxes[None, :, 1] <= q_boxes[:, None, 3]) & (item_boxes[None, :, 3] >= q_boxes[:, None, 1])
+    return set(zip(*np.nonzero(hits)))
+
+
+def random_boxes(rng, n, size=0.5):
+    xy = rng.uniform(0, 100, size=(n, 2))
+    wh = rng.uniform(0, size, size=(n, 2))
+    return np.column_stack([xy, xy + wh])
+
+
+def test_strtree_matches_brute_force():
+    rng = np.random.default_rng(0)
+    items, queries = random_boxes(rng, 1000), random_boxes(rng, 300, size=3)
+
+    q_idx, item_idx = STRTree(items).query(queries)
+
+    assert set(zip(q_idx, item_idx)) == brute_force_pairs(items, queries)
+
+
+def test_strtree_nan_item_does_not_hide_others():
+    rng = np.random.default_rng(1)
+    items, queries = random_boxes(rng, 1000), random_boxes(rng, 300, size=3)
+    expected = brute_force_pairs(items, queries)
+    assert len(expected) > 0
+
+    items[17] = np.nan
+    expected = {(q, i) for q, i in expected if i != 17}
+    q_idx, item_idx = STRTree(items).query(queries)
+
+    assert set(zip(q_idx, item_idx)) == expected
+
+
+def spec_df(rows):
+    cols = ['tmc', 'road', 'direction', 'tmclinear', 'miles', 'start_latitude', 'start_longitude',
+            'end_latitude', 'end_longitude']
+    return pd.DataFrame(rows, columns=cols)
+
+
+def write_specs(tmp_path, base_rows, comp_rows):
+    base_csv, comp_csv = str(tmp_path / 'spec_base.csv'), str(tmp_path / 'spec_comp.csv')
+    spec_df(base_rows).to_csv(base_csv, index=False)
+    spec_df(comp_rows).to_csv(comp_csv, index=False)
+    return base_csv, comp_csv
+
+
+# northbound TMCs along one line of longitude, 0.01 deg latitude (0.69 mi) each
+BASE_ROWS = [['A', 'I-5', 'N', 1, 0.69, 38.50, -121.5, 38.51, -121.5],
+             ['B', 'I-5', 'N', 1, 0.69, 38.51, -121.5, 38.52, -121.5],
+             ['C', 'I-5', 'N', 1, 0.69, 38.52, -121.5, 38.53, -121.5]]
+
+
+def test_crosswalk_split_tmc(tmp_path):
+    # comparison year splits B into two halves and renames them
+    comp_rows = [BASE_ROWS[0], ['B1', 'I 5', 'n', 1, 0.345, 38.51, -121.5, 38.515, -121.5],
+                 ['B2', 'I-5', 'N', 1, 0.345, 38.515, -121.5, 38.52, -121.5], BASE_ROWS[2]]
+
+    df = TMCCrosswalk(*write_specs(tmp_path, BASE_ROWS, comp_rows)).run()
+
+    pairs = {(r.tmc_base, r.tmc_comp): r for r in df.itertuples()}
+    assert set(pairs) == {('A', 'A'), ('B', 'B1'), ('B', 'B2'), ('C', 'C')}
+    assert np.isclose(pairs[('B', 'B1')].weight, 1.0)
+    assert np.isclose(pairs[('B', 'B1')].share_of_base, 0.5)
+
+
+def test_crosswalk_with_nan_geometry_base_tmc(tmp_path):
+    # base TMC D has no coordinates; it must not stop A-C from matching, and falls back to a same-code match
+    base_rows = BASE_ROWS + [['D', 'I-5', 'N', 1, 0.69, np.nan, np.nan, np.nan, np.nan]]
+    comp_rows = BASE_ROWS + [['D', 'I-5', 'N', 1, 0.69, 38.53, -121.5, 38.54, -121.5]]
+
+    df = TMCCrosswalk(*write_specs(tmp_path, base_rows, comp_rows)).run()
+
+    pairs = dict(zip(zip(df['tmc_base'], df['tmc_comp']), df['weight']))
+    assert pairs == {('A', 'A'): 1.0, ('B', 'B'): 1.0, ('C', 'C'): 1.0, ('D', 'D'): 1.0}
+
+
+def test_crosswalk_moved_tmc_is_unmatched(tmp_path):
+    # C's code is reused about 100 miles away; it must not be matched to the old C
+    comp_rows = BASE_ROWS[:2] + [['C', 'I-5', 'N', 1, 0.69, 39.97, -121.5, 39.98, -121.5]]
+
+    df = TMCCrosswalk(*write_specs(tmp_path, BASE_ROWS, comp_rows)).run()
+
+    assert 'C' not in df['tmc_comp'].values
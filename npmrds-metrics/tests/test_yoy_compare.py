@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from yoy_compare import YearCompare, apply_crosswalk, robust_z
+
+
+def test_robust_z_not_hidden_by_other_outliers():
+    changes = np.r_[np.linspace(-1, 1, 50), 40, 50]
+    z = robust_z(changes, np.zeros(len(changes)))
+
+    assert (np.abs(z[-2:]) > 3.5).all()
+    assert (np.abs(z[:-2]) < 3.5).all()
+
+
+def test_crosswalk_weighted_average_ignores_missing():
+    df_base = pd.DataFrame({'tmc': ['A', 'B', 'C'], 'lottr_ampk': [1.0, 2.0, np.nan]})
+    crosswalk = pd.DataFrame({'tmc_base': ['A', 'B', 'B', 'C'], 'tmc_comp': ['X', 'X', 'Y', 'Y'],
+                              'weight': [0.25, 0.75, 0.5, 0.5]})
+
+    df_out = apply_crosswalk(df_base, crosswalk, ['lottr_ampk']).set_index('tmc')
+
+    assert np.isclose(df_out.loc['X', 'lottr_ampk'], 1.75)
+    assert np.isclose(df_out.loc['Y', 'lottr_ampk'], 2.0)
+
+
+def test_slowest_hr_is_not_compared():
+    df_metrics = pd.DataFrame({'tmc': ['A'], 'road': ['I-5'], 'f_system': [1], 'miles': [1.0],
+                               'lottr_ampk': [1.2], 'slowest_hr': [17]})
+
+    assert YearCompare({}).metric_cols(df_metrics) == ['lottr_ampk']